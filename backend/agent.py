@@ -2,6 +2,7 @@
 SuperBryn AI Voice Agent - Core Agent Implementation
 Uses livekit.agents Agent + AgentSession (installed package API).
 """
+import ast
 import asyncio
 import logging
 import json
@@ -14,52 +15,87 @@ from datetime import datetime
 from livekit import agents, rtc
 from livekit.agents import JobContext, llm
 from livekit.agents.voice.room_io.types import RoomOptions
-from livekit.plugins import deepgram, cartesia, openai
+from livekit.plugins import cartesia, openai
 
 from livekit.agents.llm import find_function_tools
-from tools import ToolManager, AppointmentTools
+from tools import BUSINESS_HOURS, ToolManager, AppointmentTools
+from business_hours import BUSINESS_CALENDAR
 from database import DatabaseManager
+from event_log import bind_session, event
 from summarizer import ConversationSummarizer
+from call_records import CallRecordWriter
+from chat_context import ChatContextCompactor
+from metering import UsageMeter, record_worker_usage
+from session_recording import SessionRecorder
+from speech_connections import speech_connections
+from telemetry import QUEUED_EVENTS, attach_session
+from tracing import TurnTracer
+from turn_taking import session_options
+from transcript import TranscriptStore, ToolCallStore, spill_path_for
 
 logger = logging.getLogger(__name__)
 
 
+def parse_tool_args(args_str: Optional[str]) -> dict:
+    """Decode a function call's JSON arguments, {} if they don't parse"""
+    try:
+        return json.loads(args_str) if args_str else {}
+    except Exception:
+        return {}
+
+
+def parse_tool_output(output_str: Optional[str]) -> dict:
+    """Turn a tool's output string back into its result dict.
+
+    Tools return str(dict), so the Python literal is tried first, then
+    JSON; anything else is wrapped as a message.
+    """
+    if not output_str:
+        return {}
+    try:
+        return ast.literal_eval(output_str)
+    except Exception:
+        try:
+            return json.loads(output_str)
+        except Exception:
+            return {"message": output_str}
+
+
 class VoiceAgent:
     """Main voice agent that handles conversation flow."""
 
-    def __init__(self, ctx: JobContext):
+    def __init__(self, ctx: JobContext, db: Optional[DatabaseManager] = None):
         self.ctx = ctx
         self.agent = None
         self.session = None
-        self.tool_manager = ToolManager()
-        self.db = DatabaseManager()
-        self.summarizer = ConversationSummarizer()
+        self.db = db or DatabaseManager()
+        self.context_compactor = ChatContextCompactor()
 
-        self.conversation_history = []
         self.user_phone = None
         self.call_start_time = datetime.now()
-        self.tool_calls_made = []
+        room_name = getattr(getattr(ctx, "room", None), "name", None) or "session"
+        self.session_id = f"{room_name}-{int(self.call_start_time.timestamp())}"
+        bind_session(self.session_id)
+        self.meter = UsageMeter(self.session_id)
+        self.summarizer = ConversationSummarizer(meter=self.meter)
+        self.tracer = TurnTracer(self.session_id)
+        self.tracer.on_turn = self._on_turn_traced
+        self.recorder = SessionRecorder(self.session_id)
+        self.tool_manager = ToolManager(tracer=self.tracer, recorder=self.recorder, holder=self.session_id)
+        self.call_records = CallRecordWriter(self.db)
+        self.last_summary = None
+        self._call_recorded = False
+        self._usage_task: Optional[asyncio.Task] = None
+        self._holds_released = False
+        self.conversation_history = TranscriptStore(spill_path=spill_path_for(self.session_id, "transcript"))
+        self.tool_calls_made = ToolCallStore(spill_path=spill_path_for(self.session_id, "tools"))
         self._user_phone_ref = None
 
     async def start(self):
         """Start the voice agent."""
         logger.info("Initializing voice agent components")
 
-        stt_model = deepgram.STT(
-            language="en-US",
-            model="nova-2",
-            smart_format=True,
-        )
-        tts_model = deepgram.TTS(
-            model="aura-asteria-en",
-        )
-        # Allow overriding the model via env var; default to a more-wide-available
-        # model to avoid 403 "model not found" errors during development.
-        default_llm = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
-        llm_model = openai.LLM(
-            model=default_llm,
-            temperature=0.7,
-        )
+        stt_model, llm_model, tts_model = self._build_models()
 
         user_phone_ref = [self.user_phone]
         self._user_phone_ref = user_phone_ref
@@ -128,16 +164,18 @@ class VoiceAgent:
             stt=stt_model,
             llm=llm_model,
             tts=tts_model,
-            vad=None,
             chat_ctx=chat_ctx,
         )
 
+        # VAD is loaded once per process in prewarm(); the Agent inherits the
+        # session's VAD and turn detection rather than overriding them.
+        userdata = getattr(getattr(self.ctx, "proc", None), "userdata", None) or {}
         self.session = agents.AgentSession(
             stt=stt_model,
             llm=llm_model,
             tts=tts_model,
-            vad=None,
             tools=tools_list,
+            **session_options(userdata.get("vad")),
         )
 
         self.session.on("user_input_transcribed", self._on_user_transcribed)
@@ -145,18 +183,15 @@ class VoiceAgent:
         self.session.on("function_tools_executed", self._on_function_tools_executed)
         self.session.on("agent_state_changed", self._on_agent_state_changed)
         self.session.on("close", self._on_close)
+        self.tracer.attach(self.session)
+        self.meter.attach(self.session)
+        attach_session(self.session)
 
-        try:
-            # Request RoomIO to publish audio output back to the LiveKit room using typed RoomOptions
-            opts = RoomOptions(audio_output=True)
-            logger.info("Starting session with RoomOptions: %s", opts)
-            await self.session.start(agent=self.agent, room=self.ctx.room, room_options=opts)
-        except Exception:
-            # fallback to starting without explicit options
-            logger.exception(
-                "Failed to start session with RoomOptions, falling back to default start"
-            )
-            await self.session.start(agent=self.agent, room=self.ctx.room)
+        # Queued call records are flushed in the background and once more at shutdown
+        self.call_records.start()
+        self.ctx.add_shutdown_callback(self._on_shutdown)
+
+        await self._start_session()
 
         # Start a short-lived monitor to log room track state frequently for diagnostics
         try:
@@ -191,7 +226,7 @@ class VoiceAgent:
                     out_file = os.path.join(out_dir, "assistant_reply.wav")
                     await self._synthesize_text_to_wav(greeting_text, out_file)
                     logger.info("Wrote synthesized TTS WAV to %s", out_file)
-                    asyncio.create_task(self._send_tool_call_event("tts_saved", {"path": out_file}))
+                    self._queue_event("tts_saved", {"path": out_file})
                 except Exception:
                     logger.exception("Failed to synthesize/save greeting TTS WAV")
             except Exception:
@@ -199,25 +234,59 @@ class VoiceAgent:
         except Exception as e:
             logger.exception("Error while running session.say() for greeting: %s", e)
 
+    def _build_models(self):
+        """Create the STT, LLM and TTS used by the session"""
+        # Shared per process so calls reuse warm provider connections
+        speech = speech_connections()
+        stt_model = speech.stt()
+        tts_model = speech.tts()
+        # Allow overriding the model via env var; default to a more-wide-available
+        # model to avoid 403 "model not found" errors during development.
+        default_llm = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+        llm_model = openai.LLM(
+            model=default_llm,
+            temperature=0.7,
+        )
+        return stt_model, llm_model, tts_model
+
+    async def _start_session(self):
+        """Start the session with audio in and out through the room"""
+        try:
+            # Request RoomIO to publish audio output back to the LiveKit room using typed RoomOptions
+            opts = RoomOptions(audio_output=True)
+            logger.info("Starting session with RoomOptions: %s", opts)
+            await self.session.start(agent=self.agent, room=self.ctx.room, room_options=opts)
+        except Exception:
+            # fallback to starting without explicit options
+            logger.exception(
+                "Failed to start session with RoomOptions, falling back to default start"
+            )
+            await self.session.start(agent=self.agent, room=self.ctx.room)
+
     def _get_system_prompt(self) -> str:
-        now = datetime.now()
+        now = BUSINESS_CALENDAR.now()
         current_date = now.strftime("%Y-%m-%d")
         current_day = now.strftime("%A")
         current_time = now.strftime("%H:%M")
+        exceptions = BUSINESS_CALENDAR.upcoming_exceptions()
+        special_days = f"\nUpcoming closures and special hours: {'; '.join(exceptions)}" if exceptions else ""
         
         return f"""You are SuperBryn, a friendly and professional AI voice assistant specializing in appointment management.
 
 Current Date: {current_date} ({current_day})
 Current Time: {current_time}
+Business Hours: {BUSINESS_HOURS}{special_days}
 
 Your capabilities:
 1. Identify users by asking for their phone number
-2. Fetch available appointment slots
-3. Book appointments for users
-4. Retrieve user's past appointments
-5. Cancel appointments
-6. Modify existing appointments
-7. End conversations gracefully
+2. List the providers and rooms that take appointments
+3. Fetch available appointment slots
+4. Hold a slot for the user while confirming details
+5. Book appointments for users
+6. Retrieve user's past appointments
+7. Cancel appointments
+8. Modify existing appointments
+9. End conversations gracefully
 
 Guidelines:
 - Always be polite, professional, and helpful
@@ -225,7 +294,11 @@ Guidelines:
 - Confirm appointment details before booking
 - When booking, extract: date, time, user name, and contact number
 - If a user wants to book/modify/cancel, first identify them by asking for phone number
-- For fetch_slots, assume we have slots available every day from 9 AM to 5 PM in hourly intervals
+- Only offer times within business hours; if the user asks for a closed day or time, say so and suggest the nearest open day
+- fetch_slots returns open times with the providers or rooms free at each; a provider or room may keep shorter hours or its own slot length, and slots fully booked or held for other callers are left out
+- If the user asks for a particular provider or room, pass it as `resource` to fetch_slots, hold_slot and book_appointment; otherwise any free one is fine and you don't need to mention it
+- As soon as you offer a specific time or the user picks one, call hold_slot so it isn't offered to other callers while you confirm details
+- If a hold or booking fails because the slot was taken, offer one of the returned alternatives instead of fetching slots again
 - Always confirm bookings with all details (date, time, name, phone)
 - Prevent double-booking by checking existing appointments
 - When ending conversation, be warm and thank the user
@@ -237,13 +310,12 @@ Use the available tools to perform actions. Always use the tools when the user r
         text = getattr(evt, "transcript", getattr(evt, "text", getattr(evt, "transcription", "")))
         if not text:
             return
-        logger.info(f"User said: {text}")
-        self.conversation_history.append({
-            "role": "user",
-            "text": text,
-            "timestamp": datetime.now().isoformat(),
-        })
-        asyncio.create_task(self._send_tool_call_event("user_speech", {"text": text}))
+        logger.info("User said: %s", text, extra=event("transcript", final=getattr(evt, "is_final", True)))
+        # Interim transcripts are superseded by the final one; only keep finals
+        if getattr(evt, "is_final", True):
+            self.conversation_history.add("user", text)
+            self.recorder.record_transcript("user", text)
+        self._queue_event("user_speech", {"text": text})
 
     def _on_conversation_item_added(self, evt):
         """Track conversation items (e.g. agent messages)."""
@@ -255,11 +327,8 @@ Use the available tools to perform actions. Always use the tools when the user r
             else:
                 text = str(content) if content else ""
             if text:
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "text": text,
-                    "timestamp": datetime.now().isoformat(),
-                })
+                self.conversation_history.add("assistant", text)
+                self.recorder.record_transcript("assistant", text)
 
     def _on_function_tools_executed(self, evt):
         """After tools run: sync user_phone, track calls, send results, trigger summary."""
@@ -267,29 +336,16 @@ Use the available tools to perform actions. Always use the tools when the user r
         function_call_outputs = getattr(evt, "function_call_outputs", [])
         zipped = getattr(evt, "zipped", None)
         pairs = zipped() if callable(zipped) else list(zip(function_calls, function_call_outputs))
+        self.meter.note_tools_executed([getattr(fn_call, "name", None) for fn_call, _ in pairs])
         for fn_call, fn_output in pairs:
             name = getattr(fn_call, "name", "unknown")
-            args_str = getattr(fn_call, "arguments", "{}")
-            try:
-                args = json.loads(args_str) if args_str else {}
-            except Exception:
-                args = {}
-            asyncio.create_task(
-                self._send_tool_call_event("function_call", {"name": name, "args": args})
+            args = parse_tool_args(getattr(fn_call, "arguments", "{}"))
+            self._queue_event("function_call", {"name": name, "args": args})
+            result = parse_tool_output(getattr(fn_output, "output", None) if fn_output else None)
+            logger.info(
+                "Function call finished: %s (success=%s)", name, result.get("success"),
+                extra=event("tool", tool=name, result=result),
             )
-            output_str = getattr(fn_output, "output", None) if fn_output else None
-            if output_str is None:
-                result = {}
-            else:
-                try:
-                    import ast
-                    result = ast.literal_eval(output_str) if output_str else {}
-                except Exception:
-                    try:
-                        result = json.loads(output_str) if output_str else {}
-                    except Exception:
-                        result = {"message": output_str} if output_str else {}
-            logger.info(f"Function call finished: {name} -> {result}")
 
             if self._user_phone_ref is not None:
                 self.user_phone = self._user_phone_ref[0]
@@ -298,22 +354,24 @@ Use the available tools to perform actions. Always use the tools when the user r
                 if self._user_phone_ref is not None:
                     self._user_phone_ref[0] = self.user_phone
 
-            self.tool_calls_made.append({
-                "name": name,
-                "args": args,
-                "result": result,
-                "timestamp": datetime.now().isoformat(),
-            })
-            asyncio.create_task(
-                self._send_tool_call_event("function_result", {"name": name, "result": result})
-            )
+            entry = self.tool_calls_made.add(name, args, result)
+            self.summarizer.running.note_tool_call(entry)
+            self.call_records.add_event(self._call_event(
+                "tool_call", name=name, offset=entry.ts, success=bool(result.get("success")),
+                data={"args": args, "result": entry.result},
+            ))
+            self._queue_event("function_result", {"name": name, "result": result})
 
             if name == "end_conversation":
                 asyncio.create_task(self._end_conversation())
 
     def _on_agent_state_changed(self, evt):
         state = getattr(evt, "state", evt)
-        logger.info(f"Agent state changed: {state}")
+        logger.info("Agent state changed: %s", state, extra=event("state"))
+        # Fold older turns while the agent waits for the user, off the reply path
+        if getattr(evt, "new_state", None) == "listening" and self.agent is not None:
+            self.context_compactor.schedule(self.agent)
+            self.summarizer.running.schedule(self.conversation_history)
         try:
             # Log room/local participant published track info to help debug TTS publishing
             self._log_room_tracks()
@@ -322,6 +380,88 @@ Use the available tools to perform actions. Always use the tools when the user r
 
     def _on_close(self, evt):
         logger.info("Session closed")
+        self.conversation_history.close()
+        self.tool_calls_made.close()
+        self.recorder.close()
+        asyncio.create_task(self.context_compactor.aclose())
+        asyncio.create_task(self._release_slot_holds())
+        self._record_call_summary()
+
+    async def _on_shutdown(self):
+        # The job can shut down before the session emits "close"
+        self._record_call_summary()
+        self.recorder.close()
+        await self._release_slot_holds()
+        if self._usage_task is not None:
+            await self._usage_task
+        await self.call_records.aclose()
+
+    async def _release_slot_holds(self):
+        # Slots this caller was offered become available again on hang-up
+        if self._holds_released:
+            return
+        self._holds_released = True
+        released = await self.db.release_slot_holds(self.session_id)
+        if released:
+            logger.info(f"Released {released} slot hold(s)")
+
+    def _record_call_summary(self):
+        if self._call_recorded:
+            return
+        self._call_recorded = True
+        latency = self.tracer.close()
+        usage = self.meter.summary()
+        self.call_records.add_summary(self._call_summary_row(latency, usage))
+        self._usage_task = asyncio.create_task(self._record_worker_usage(usage["totals"]["cost_usd"]))
+
+    async def _record_worker_usage(self, call_cost: float):
+        # The shared totals file is locked and rewritten in a thread, off the audio loop
+        worker_totals = await asyncio.to_thread(record_worker_usage, self.meter.totals)
+        logger.info("Call cost: $%.4f; worker totals: %s", call_cost, worker_totals)
+
+    def _on_turn_traced(self, turn: dict):
+        self.call_records.add_event(self._call_event(
+            "turn", offset=turn["ts"] - self.call_start_time.timestamp(),
+            duration_ms=turn.get("playout_start_ms"), data=turn,
+        ))
+
+    def _call_event(self, event_type: str, name: Optional[str] = None, offset: float = 0.0,
+                    duration_ms: Optional[float] = None, success: Optional[bool] = None,
+                    data: Optional[dict] = None) -> dict:
+        return {
+            "session_id": self.session_id,
+            "event_type": event_type,
+            "name": name,
+            "offset_seconds": round(offset, 3),
+            "duration_ms": duration_ms,
+            "success": success,
+            "data": data or {},
+        }
+
+    def _call_summary_row(self, latency: dict, usage: dict) -> dict:
+        summary = self.last_summary or {}
+        ended_at = datetime.now()
+        return {
+            "session_id": self.session_id,
+            "room_name": getattr(getattr(self.ctx, "room", None), "name", None),
+            "user_phone": self.user_phone,
+            "summary_text": summary.get("summary_text"),
+            "summary_source": summary.get("summary_source"),
+            "conversation_length": self.conversation_history.total,
+            "tool_calls_count": self.tool_calls_made.total,
+            "appointments_count": summary.get("appointments_count", 0),
+            "started_at": self.call_start_time.astimezone().isoformat(),
+            "ended_at": ended_at.astimezone().isoformat(),
+            "duration_seconds": round((ended_at - self.call_start_time).total_seconds(), 3),
+            "latency": latency,
+            "usage": usage,
+            "cost_usd": usage["totals"]["cost_usd"],
+        }
+
+    def _queue_event(self, event_type: str, data: dict) -> None:
+        """Send a data-channel event in the background, counting it while queued"""
+        QUEUED_EVENTS.inc()
+        asyncio.create_task(self._send_tool_call_event(event_type, data))
 
     async def _send_tool_call_event(self, event_type: str, data: dict):
         try:
@@ -356,6 +496,8 @@ Use the available tools to perform actions. Always use the tools when the user r
                 logger.info("Tool event (no data channel): %s", message)
         except Exception as e:
             logger.error(f"Error sending tool call event: {e}")
+        finally:
+            QUEUED_EVENTS.dec()
 
     def _log_room_tracks(self) -> None:
         try:
@@ -406,7 +548,7 @@ Use the available tools to perform actions. Always use the tools when the user r
                 except Exception:
                     info["audio_tracks"] = str(audio_tracks)
 
-            logger.info("Room/local participant track info: %s", info)
+            logger.info("Room/local participant track info: %s", info, extra=event("tracks"))
         except Exception:
             logger.exception("Unexpected error while logging room tracks")
 
@@ -448,21 +590,21 @@ Use the available tools to perform actions. Always use the tools when the user r
             if not api_key:
                 raise ValueError("DEEPGRAM_API_KEY is not set")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    base_url,
-                    params={k: v for k, v in params.items() if v is not None},
-                    headers={"Authorization": f"Token {api_key}", "Content-Type": "application/json"},
-                    json={"text": text},
-                    timeout=aiohttp.ClientTimeout(total=30),
-                ) as resp:
-                    resp.raise_for_status()
-
-                    # Collect raw PCM bytes
-                    pcm = bytearray()
-                    async for chunk, _ in resp.content.iter_chunks():
-                        if chunk:
-                            pcm.extend(chunk)
+            session = speech_connections().http_session()
+            async with session.post(
+                base_url,
+                params={k: v for k, v in params.items() if v is not None},
+                headers={"Authorization": f"Token {api_key}", "Content-Type": "application/json"},
+                json={"text": text},
+                timeout=aiohttp.ClientTimeout(total=30),
+            ) as resp:
+                resp.raise_for_status()
+
+                # Collect raw PCM bytes
+                pcm = bytearray()
+                async for chunk, _ in resp.content.iter_chunks():
+                    if chunk:
+                        pcm.extend(chunk)
 
             # Write WAV file (16-bit PCM, little endian)
             with wave.open(out_path, "wb") as wf:
@@ -505,7 +647,7 @@ Use the available tools to perform actions. Always use the tools when the user r
                         t = rtc.LocalAudioTrack.create_audio_track("superbryn-tts", audio_source)
                         pub = await lp.publish_track(t)
                         logger.info("Published synthesized TTS track: %s", repr(pub))
-                        asyncio.create_task(self._send_tool_call_event("tts_published", {"sid": getattr(pub, 'sid', None)}))
+                        self._queue_event("tts_published", {"sid": getattr(pub, 'sid', None)})
                     except Exception:
                         logger.exception("Failed to create/publish LocalAudioTrack for TTS")
             except Exception:
@@ -517,19 +659,43 @@ Use the available tools to perform actions. Always use the tools when the user r
 
     async def _end_conversation(self):
         logger.info("Ending conversation, generating summary")
-        summary = await self.summarizer.generate_summary(
+        appointments = await self.summarizer.fetch_appointments(self.user_phone, self.db)
+        sentences = self.summarizer.stream_summary(
             conversation_history=self.conversation_history,
             tool_calls=self.tool_calls_made,
-            user_phone=self.user_phone,
-            db=self.db,
+            appointments=appointments,
         )
-        await self._send_tool_call_event("conversation_summary", summary)
-        summary_text = summary.get("summary_text", "Thank you for using SuperBryn!")
+        spoken = []
+        published = False
+
+        def _publish_summary():
+            # Publish whatever text was generated, exactly once, even if speaking it failed
+            nonlocal published
+            if published:
+                return
+            published = True
+            summary = self.summarizer.build_summary(
+                " ".join(spoken), self.conversation_history, self.tool_calls_made, self.user_phone, appointments
+            )
+            summary["usage"] = self.meter.summary()
+            self.last_summary = summary
+            self._queue_event("conversation_summary", summary)
+
+        async def _speak_sentences():
+            # Pipe sentences into TTS as they arrive; publish the summary event
+            # as soon as the text is complete rather than after playout.
+            async for sentence in sentences:
+                spoken.append(sentence)
+                yield sentence + " "
+            _publish_summary()
+
         if self.session:
             try:
                 logger.info("Invoking session.say() for summary")
-                await self.session.say(summary_text)
+                # The closing summary is not interruptible so the full text is generated
+                await self.session.say(_speak_sentences(), allow_interruptions=False)
                 logger.info("session.say() summary completed")
+                summary_text = " ".join(spoken) or "Thank you for using SuperBryn!"
                 try:
                     # Diagnostics after summary TTS
                     room = getattr(self.ctx, "room", None)
@@ -542,13 +708,19 @@ Use the available tools to perform actions. Always use the tools when the user r
                         out_file = os.path.join(out_dir, "assistant_summary.wav")
                         await self._synthesize_text_to_wav(summary_text, out_file)
                         logger.info("Wrote synthesized summary WAV to %s", out_file)
-                        asyncio.create_task(self._send_tool_call_event("tts_saved", {"path": out_file}))
+                        self._queue_event("tts_saved", {"path": out_file})
                     except Exception:
                         logger.exception("Failed to synthesize/save summary TTS WAV")
                 except Exception:
                     logger.exception("Error during post-summary diagnostics")
             except Exception as e:
                 logger.exception("Error while running session.say() for summary: %s", e)
+            finally:
+                # say() can fail or be cancelled before the stream is exhausted
+                _publish_summary()
+        else:
+            async for _ in _speak_sentences():
+                pass
         await asyncio.sleep(2)
         if self.session:
             await self.session.aclose()
@@ -0,0 +1,322 @@
+"""
+In-memory availability index over resources (providers, rooms) and their bookings
+"""
+import bisect
+import logging
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from business_hours import BUSINESS_CALENDAR, BusinessCalendar, from_minutes, to_minutes
+
+logger = logging.getLogger(__name__)
+
+# How long a day's bookings loaded from the database are trusted before a reload
+CACHE_SECONDS = float(os.getenv("AVAILABILITY_CACHE_SECONDS", "15"))
+# How long they're trusted while a change feed is applying writes from every worker
+FEED_CACHE_SECONDS = float(os.getenv("AVAILABILITY_FEED_CACHE_SECONDS", "300"))
+# How long one report that the feed is live holds; the feed renews it every second or so
+FEED_LEASE_SECONDS = 5.0
+RESOURCES_REFRESH_SECONDS = 300.0
+
+DEFAULT_RESOURCE_ID = "default"
+
+# (resource_id, date, "HH:MM") -> number of other callers' holds on that slot
+HoldCounts = Dict[Tuple[str, str, str], int]
+
+
+class Resource:
+    """A provider or room that takes up to `capacity` overlapping appointments.
+
+    Its slots follow the business calendar, narrowed to its own opening
+    window and slot length where those are set.
+    """
+
+    __slots__ = ("id", "name", "kind", "capacity", "open_minute", "close_minute", "slot_minutes", "calendar")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        kind: str = "provider",
+        capacity: int = 1,
+        open_time: Optional[str] = None,
+        close_time: Optional[str] = None,
+        slot_minutes: Optional[int] = None,
+        calendar: Optional[BusinessCalendar] = None,
+    ):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.capacity = max(1, int(capacity))
+        self.calendar = calendar or BUSINESS_CALENDAR
+        self.open_minute = to_minutes(open_time) if open_time else None
+        self.close_minute = to_minutes(close_time) if close_time else None
+        self.slot_minutes = max(1, int(slot_minutes)) if slot_minutes else self.calendar.slot_minutes
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any], calendar: Optional[BusinessCalendar] = None) -> "Resource":
+        return cls(
+            id=str(row["id"]),
+            name=row.get("name") or str(row["id"]),
+            kind=row.get("kind") or "provider",
+            capacity=row.get("capacity") or 1,
+            open_time=row.get("open_time"),
+            close_time=row.get("close_time"),
+            slot_minutes=row.get("slot_minutes"),
+            calendar=calendar,
+        )
+
+    def slot_starts(self, date: str) -> Tuple[int, ...]:
+        return self.calendar.slots(date, self.open_minute, self.close_minute, self.slot_minutes)[0]
+
+    def is_slot(self, date: str, minute: int) -> bool:
+        return minute in self.calendar.slots(date, self.open_minute, self.close_minute, self.slot_minutes)[1]
+
+    def as_dict(self) -> Dict[str, Any]:
+        hours = "business hours"
+        if self.open_minute is not None or self.close_minute is not None:
+            opens = from_minutes(self.open_minute) if self.open_minute is not None else "opening"
+            closes = from_minutes(self.close_minute) if self.close_minute is not None else "closing"
+            hours = f"{opens}-{closes} within business hours"
+        return {
+            "id": self.id,
+            "name": self.name,
+            "kind": self.kind,
+            "capacity": self.capacity,
+            "hours": hours,
+            "slot_minutes": self.slot_minutes,
+        }
+
+
+def default_resource(calendar: Optional[BusinessCalendar] = None) -> Resource:
+    """The single calendar used when no resources are configured"""
+    return Resource(DEFAULT_RESOURCE_ID, "Main calendar", calendar=calendar)
+
+
+class DayIntervals:
+    """Booked intervals on one resource-day, as separately sorted start and end minutes.
+
+    The bookings overlapping [start, end) are those starting before `end`
+    minus those ending at or before `start`, so a capacity check is two
+    bisections however busy the day is. Bookings on a resource follow
+    its slot grid, which makes that count the peak load over the slot.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def add(self, start: int, end: int) -> None:
+        bisect.insort(self.starts, start)
+        bisect.insort(self.ends, end)
+
+    def remove(self, start: int, end: int) -> None:
+        for values, value in ((self.starts, start), (self.ends, end)):
+            i = bisect.bisect_left(values, value)
+            if i < len(values) and values[i] == value:
+                del values[i]
+
+    def overlapping(self, start: int, end: int) -> int:
+        return bisect.bisect_left(self.starts, end) - bisect.bisect_right(self.ends, start)
+
+
+class AvailabilityIndex:
+    """Per-process cache of resources and confirmed bookings, indexed by date then resource.
+
+    DatabaseManager loads whole days (every resource) in one range query
+    and trusts them for `ttl` seconds; bookings, cancellations and moves
+    made through this process are applied as they happen, and those made
+    elsewhere too while a change feed is live. The database still
+    enforces capacity when an appointment is written, so a stale day can
+    only cause an offer that then fails with alternatives.
+    """
+
+    def __init__(self, ttl: float = CACHE_SECONDS, calendar: Optional[BusinessCalendar] = None):
+        self.polling_ttl = ttl
+        self._feed_ttl = ttl
+        self._live_until = 0.0
+        self.calendar = calendar or BUSINESS_CALENDAR
+        self.resources: Dict[str, Resource] = {DEFAULT_RESOURCE_ID: default_resource(self.calendar)}
+        self._resources_loaded_at: Optional[float] = None
+        self._days: Dict[str, Dict[str, DayIntervals]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        # appointment id -> (resource_id, date, start, end), for applying changes
+        self._bookings: Dict[str, Tuple[str, str, int, int]] = {}
+        self.loads = 0
+        self.hits = 0
+
+    # -- loading -------------------------------------------------------------
+
+    def resources_stale(self) -> bool:
+        loaded = self._resources_loaded_at
+        return loaded is None or time.monotonic() - loaded > RESOURCES_REFRESH_SECONDS
+
+    def set_resources(self, rows: Iterable[Dict[str, Any]]) -> None:
+        resources = {}
+        for row in rows:
+            try:
+                resource = Resource.from_row(row, self.calendar)
+            except (KeyError, ValueError) as e:
+                logger.error(f"Skipping invalid resource row {row}: {e}")
+                continue
+            resources[resource.id] = resource
+        # An empty result (no rows, or the query failed) keeps what was loaded before
+        self.resources = resources or self.resources
+        self._resources_loaded_at = time.monotonic()
+
+    def stale_dates(self, dates: List[str]) -> List[str]:
+        now = time.monotonic()
+        stale = [d for d in dates if now - self._loaded_at.get(d, -self.ttl - 1) > self.ttl]
+        if dates and not stale:
+            self.hits += 1
+        return stale
+
+    def load_days(self, dates: Iterable[str], bookings: Iterable[Dict[str, Any]]) -> None:
+        """Replace the given days with freshly loaded confirmed bookings"""
+        now = time.monotonic()
+        dates = set(dates)
+        # Expired days would be reloaded before use anyway
+        expired = {d for d, t in self._loaded_at.items() if now - t > self.ttl}
+        self._drop_days(dates | expired)
+        for date in dates:
+            self._days[date] = {}
+            self._loaded_at[date] = now
+        for booking in bookings:
+            if str(booking.get("date")) in dates:
+                self.apply(booking)
+        self.loads += 1
+
+    def _drop_days(self, dates: set) -> None:
+        for date in dates:
+            self._days.pop(date, None)
+            self._loaded_at.pop(date, None)
+        if dates:
+            self._bookings = {k: v for k, v in self._bookings.items() if v[1] not in dates}
+
+    def clear(self) -> None:
+        self._drop_days(set(self._days))
+
+    @property
+    def live(self) -> bool:
+        return time.monotonic() < self._live_until
+
+    @property
+    def ttl(self) -> float:
+        return self._feed_ttl if self.live else self.polling_ttl
+
+    def set_live(self, live: bool, ttl: float = FEED_CACHE_SECONDS, lease: float = FEED_LEASE_SECONDS) -> None:
+        """Report whether a change feed is live; while reports keep coming, days are trusted for `ttl`.
+
+        Each live report holds for `lease` seconds, so a feed that stops
+        without saying so (its event loop ended) falls back to the polling
+        TTL. Going live after a gap drops the loaded days, since changes
+        made in between were never applied to them; renewals keep them.
+        """
+        if not live:
+            self._live_until = 0.0
+            return
+        now = time.monotonic()
+        if now >= self._live_until:
+            self.clear()
+        self._live_until = now + lease
+        self._feed_ttl = max(ttl, self.polling_ttl)
+
+    # -- changes -------------------------------------------------------------
+
+    def apply(self, appointment: Dict[str, Any]) -> None:
+        """Insert or update one appointment row; cancelled rows are removed"""
+        appointment_id = appointment.get("id")
+        if appointment_id is None:
+            return
+        appointment_id = str(appointment_id)
+        self.discard(appointment_id)
+        date = str(appointment.get("date"))
+        if appointment.get("status", "confirmed") != "confirmed" or date not in self._days:
+            return
+        resource_id = str(appointment.get("resource_id") or DEFAULT_RESOURCE_ID)
+        resource = self.resources.get(resource_id)
+        try:
+            start = to_minutes(appointment.get("time"))
+        except (ValueError, AttributeError):
+            return
+        duration = appointment.get("duration_minutes") or (resource.slot_minutes if resource else self.calendar.slot_minutes)
+        end = start + int(duration)
+        self._days[date].setdefault(resource_id, DayIntervals()).add(start, end)
+        self._bookings[appointment_id] = (resource_id, date, start, end)
+
+    def discard(self, appointment_id: str) -> None:
+        booking = self._bookings.pop(str(appointment_id), None)
+        if booking is None:
+            return
+        resource_id, date, start, end = booking
+        intervals = self._days.get(date, {}).get(resource_id)
+        if intervals is not None:
+            intervals.remove(start, end)
+
+    # -- queries -------------------------------------------------------------
+
+    def resolve(self, name_or_id: Optional[str]) -> Optional[Resource]:
+        """A resource by id or case-insensitive name"""
+        if not name_or_id:
+            return None
+        resource = self.resources.get(name_or_id)
+        if resource is not None:
+            return resource
+        wanted = name_or_id.strip().lower()
+        for resource in self.resources.values():
+            if resource.name.lower() == wanted:
+                return resource
+        return None
+
+    def free_capacity(
+        self, resource: Resource, date: str, minute: int, holds: int = 0, exclude_id: Optional[str] = None
+    ) -> int:
+        """Appointments `resource` can still take at `minute` on `date`; 0 off its slots for the day"""
+        if not resource.is_slot(date, minute):
+            return 0
+        end = minute + resource.slot_minutes
+        intervals = self._days.get(date, {}).get(resource.id)
+        used = intervals.overlapping(minute, end) if intervals is not None else 0
+        if exclude_id is not None:
+            own = self._bookings.get(str(exclude_id))
+            if own and own[0] == resource.id and own[1] == date and own[2] < end and own[3] > minute:
+                used -= 1
+        return resource.capacity - used - holds
+
+    def open_slots(
+        self, date: str, resources: List[Resource], holds: Optional[HoldCounts] = None
+    ) -> List[Tuple[str, List[str]]]:
+        """(HH:MM, resource ids with room) for every open time on `date`, least busy resources first"""
+        day = self._days.get(date, {})
+        ordered = sorted(resources, key=lambda r: len(day.get(r.id, ())) / r.capacity)
+        by_minute: Dict[int, List[str]] = {}
+        for resource in ordered:
+            intervals = day.get(resource.id)
+            length = resource.slot_minutes
+            for minute in resource.slot_starts(date):
+                used = intervals.overlapping(minute, minute + length) if intervals is not None else 0
+                if holds:
+                    used += holds.get((resource.id, date, from_minutes(minute)), 0)
+                if used < resource.capacity:
+                    by_minute.setdefault(minute, []).append(resource.id)
+        return [(from_minutes(m), ids) for m, ids in sorted(by_minute.items())]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resources": len(self.resources),
+            "days": len(self._days),
+            "bookings": len(self._bookings),
+            "loads": self.loads,
+            "hits": self.hits,
+            "live": self.live,
+        }
+
+
+# Shared by every DatabaseManager built from the environment in this process
+PROCESS_INDEX = AvailabilityIndex()
@@ -0,0 +1,3 @@
+"""
+Benchmarks and load harnesses; run as modules from the backend directory
+"""
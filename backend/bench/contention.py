@@ -0,0 +1,257 @@
+"""
+Booking contention benchmark: many callers racing for the same days' slots
+
+    python -m bench.contention --callers 300 --days 5
+    python -m bench.contention --callers 300 --days 5 --holds off
+    python -m bench.contention --backend postgrest --latency lognormal:15,0.5
+    python -m bench.contention --callers 1000 --providers 20 --capacity 2
+    python -m bench.contention --workers 4 --feed both --holds off
+
+Each simulated caller is a ToolManager session that checks slots for a
+preferred day (earlier days and morning times are more popular), picks
+one, spends `--think` seconds confirming details and books it. A booking
+that fails because someone else got the slot costs a failed-booking turn
+and the caller tries again from the alternatives or the next day. With
+holds on, the agent holds the slot as soon as it is picked, so other
+callers aren't offered it in the meantime; a fraction of callers hang up
+before booking (`--abandon-rate`) and their holds are released.
+
+Every tool call stands for one LLM round trip (`--llm-seconds`). The
+report gives bookings, failed-booking turns, round trips per booking and
+throughput; `--holds both` runs the same arrivals with and without holds.
+`--providers` and `--capacity` spread the slots over several resources,
+each taking that many overlapping appointments; callers take any free one.
+
+`--workers` spreads the callers over that many DatabaseManagers, each
+with its own availability index as separate worker processes would have.
+Without a change feed each worker only sees the others' bookings when
+its cached days expire, so it keeps offering taken slots; `--feed on`
+applies every write to every worker's index `--feed-delay-ms` after it
+is made, and `--feed both` runs the same arrivals without and with it.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import itertools
+import time
+from typing import Any, Dict, List, Optional
+
+from availability import AvailabilityIndex
+from bench.local_postgrest import DEFAULT_KEY, FaultConfig, LocalPostgrest
+from bench.local_supabase import LocalChangeSource, LocalSupabase
+from change_feed import AppointmentChangeFeed
+from database import DatabaseManager
+from tools import SLOT_HOLD_TTL, ToolManager
+from tracing import summarize_latencies
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 6
+
+
+class Stats:
+    def __init__(self):
+        self.booked = 0
+        self.gave_up = 0
+        self.abandoned = 0
+        self.failed_bookings = 0
+        self.failed_holds = 0
+        self.round_trips = 0
+        self.turns_to_book: List[int] = []
+        self.time_to_book_ms: List[float] = []
+
+
+class Caller:
+    def __init__(self, index: int, args, db, rng: random.Random, holds: bool, stats: Stats):
+        self.index = index
+        self.args = args
+        self.db = db
+        self.rng = rng
+        self.stats = stats
+        self.session_id = f"contention-{index}"
+        self.tools = ToolManager(holder=self.session_id, hold_ttl=args.hold_ttl if holds else 0)
+        self.holds = holds
+        self.phone = f"555{index:07d}"
+
+    async def _call(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.args.llm_seconds)
+        self.stats.round_trips += 1
+        return await self.tools.execute_tool(name, args, self.db, self.phone)
+
+    def _pick(self, times: List[str]) -> Optional[str]:
+        if not times:
+            return None
+        # Earlier times are more popular
+        weights = [1.0 / (1 + i) for i in range(len(times))]
+        return self.rng.choices(times, weights=weights)[0]
+
+    def _preferred_day(self, days: List[str]) -> int:
+        weights = [1.0 / (1 + i) for i in range(len(days))]
+        return self.rng.choices(range(len(days)), weights=weights)[0]
+
+    async def run(self, days: List[str]) -> None:
+        started = time.perf_counter()
+        await self._call("identify_user", {"phone_number": self.phone})
+        day = self._preferred_day(days)
+        offered: Optional[List[str]] = None
+        turns = 0
+        try:
+            while turns < MAX_ATTEMPTS and day < len(days):
+                turns += 1
+                date = days[day]
+                if offered is None:
+                    result = await self._call("fetch_slots", {"date": date})
+                    offered = [s["time"] for s in result.get("slots", [])]
+                slot = self._pick(offered)
+                if slot is None:
+                    day, offered = day + 1, None
+                    continue
+                if self.holds:
+                    held = await self._call("hold_slot", {"date": date, "time": slot})
+                    if not held.get("success"):
+                        self.stats.failed_holds += 1
+                        offered = held.get("alternatives")
+                        continue
+                await asyncio.sleep(self.args.think * self.rng.uniform(0.5, 1.5))
+                if self.rng.random() < self.args.abandon_rate:
+                    self.stats.abandoned += 1
+                    return
+                booked = await self._call("book_appointment", {
+                    "date": date, "time": slot, "user_name": f"Caller {self.index}", "phone_number": self.phone,
+                })
+                if booked.get("success"):
+                    self.stats.booked += 1
+                    self.stats.turns_to_book.append(turns)
+                    self.stats.time_to_book_ms.append((time.perf_counter() - started) * 1000.0)
+                    return
+                self.stats.failed_bookings += 1
+                offered = booked.get("alternatives")
+            self.stats.gave_up += 1
+        finally:
+            # Hang-up releases whatever this caller still holds
+            await self.db.release_slot_holds(self.session_id)
+
+
+def _seed_resources(store: LocalSupabase, providers: int, capacity: int) -> None:
+    if providers <= 1 and capacity <= 1:
+        return
+    store.table("resources").insert([
+        {"id": f"provider-{i}", "name": f"Provider {i}", "capacity": capacity, "active": True}
+        for i in range(providers)
+    ]).execute()
+
+
+def _days(count: int) -> List[str]:
+    first = datetime.date.today() + datetime.timedelta(days=1)
+    return [(first + datetime.timedelta(days=i)).isoformat() for i in range(count)]
+
+
+async def run_contention(args, holds: bool, feed: bool = False) -> Dict[str, Any]:
+    server = None
+    workers = max(1, args.workers)
+    if args.backend == "postgrest":
+        server = LocalPostgrest(faults=FaultConfig(latency=args.latency, seed=args.seed))
+        url = server.start()
+        os.environ["SUPABASE_URL"] = url
+        os.environ["SUPABASE_KEY"] = DEFAULT_KEY
+        # A fresh index per run, or the second run would see the first one's bookings
+        dbs = [DatabaseManager(availability=AvailabilityIndex()) for _ in range(workers)]
+        store = server.store
+    else:
+        store = LocalSupabase()
+        dbs = [DatabaseManager(client=store) for _ in range(workers)]
+    _seed_resources(store, args.providers, args.capacity)
+    feeds = []
+    if feed:
+        for db in dbs:
+            change_feed = AppointmentChangeFeed(
+                LocalChangeSource(store, delay=args.feed_delay_ms / 1000.0), db.availability, check_interval=0.05,
+            )
+            change_feed.start()
+            feeds.append(change_feed)
+        await asyncio.sleep(0.1)
+
+    stats = Stats()
+    rng = random.Random(args.seed)
+    days = _days(args.days)
+    tasks = []
+    started = time.perf_counter()
+    try:
+        for index in range(args.callers):
+            caller = Caller(index, args, dbs[index % workers], random.Random(rng.random()), holds, stats)
+            tasks.append(asyncio.create_task(caller.run(days)))
+            await asyncio.sleep(rng.expovariate(args.arrival_rate))
+        await asyncio.gather(*tasks)
+    finally:
+        for change_feed in feeds:
+            await change_feed.aclose()
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - started
+    # Bookings beyond a resource's capacity at one time
+    per_slot: Dict[tuple, int] = {}
+    for a in store.tables.get("appointments", []):
+        key = (a.get("resource_id"), a["date"], str(a["time"])[:5])
+        per_slot[key] = per_slot.get(key, 0) + 1
+    double_booked = sum(max(0, n - args.capacity) for n in per_slot.values())
+    return {
+        "holds": holds,
+        "callers": args.callers,
+        "workers": workers,
+        "feed": feed,
+        "slots": sum(len(dbs[0].availability.calendar.slots(d)[0]) for d in days) * max(1, args.providers) * args.capacity,
+        "booked": stats.booked,
+        "gave_up": stats.gave_up,
+        "abandoned": stats.abandoned,
+        "failed_booking_turns": stats.failed_bookings,
+        "failed_holds": stats.failed_holds,
+        "double_booked": double_booked,
+        "round_trips": stats.round_trips,
+        "round_trips_per_booking": round(stats.round_trips / stats.booked, 2) if stats.booked else None,
+        "duration_s": round(elapsed, 2),
+        "bookings_per_s": round(stats.booked / elapsed, 2) if elapsed else None,
+        "attempts_to_book": summarize_latencies([float(t) for t in stats.turns_to_book]),
+        "time_to_book_ms": summarize_latencies(stats.time_to_book_ms),
+        "db_requests": store.requests,
+        "feed_changes_applied": sum(f.applied for f in feeds),
+    }
+
+
+async def main_async(args) -> Any:
+    modes = {"on": [True], "off": [False], "both": [False, True]}
+    results = [
+        await run_contention(args, holds, feed)
+        for holds, feed in itertools.product(modes[args.holds], modes[args.feed])
+    ]
+    return results[0] if len(results) == 1 else results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=300)
+    parser.add_argument("--days", type=int, default=5, help="days open for booking, from tomorrow")
+    parser.add_argument("--providers", type=int, default=1, help="resources sharing the slots")
+    parser.add_argument("--capacity", type=int, default=1, help="overlapping appointments each resource takes")
+    parser.add_argument("--arrival-rate", type=float, default=30.0, help="callers arriving per second")
+    parser.add_argument("--think", type=float, default=2.0, help="seconds between picking a slot and booking it")
+    parser.add_argument("--llm-seconds", type=float, default=0.3, help="simulated LLM round trip per tool call")
+    parser.add_argument("--abandon-rate", type=float, default=0.05, help="callers who hang up before booking")
+    parser.add_argument("--holds", choices=("on", "off", "both"), default="both")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, each with its own availability index")
+    parser.add_argument("--feed", choices=("on", "off", "both"), default="off", help="apply a change feed to every worker's index")
+    parser.add_argument("--feed-delay-ms", type=float, default=50.0, help="time from a write to the feed delivering it")
+    parser.add_argument("--hold-ttl", type=int, default=SLOT_HOLD_TTL or 120)
+    parser.add_argument("--backend", choices=("local", "postgrest"), default="local")
+    parser.add_argument("--latency", default="fixed:0", help="postgrest backend latency distribution in ms")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Deterministic stand-ins for STT, LLM, TTS, room audio and the OpenAI client
+
+They implement the livekit-agents plugin interfaces, so an AgentSession
+runs its normal pipeline (endpointing, LLM with tool calls, TTS, playout)
+without any network service.
+"""
+import asyncio
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from livekit import rtc
+from livekit.agents import APIConnectOptions, llm, stt, tts
+from livekit.agents.voice import io
+
+FRAME_MS = 20
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+
+
+@dataclass
+class ScriptedTurn:
+    """One caller utterance and how the fake LLM answers it"""
+
+    utterance: str
+    reply: str
+    tool: Optional[str] = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+class CallerScript:
+    """A caller's turns, released one at a time when the agent starts listening"""
+
+    def __init__(self, turns: List[ScriptedTurn], speech_seconds: float = 1.2, think_seconds: float = 0.3):
+        self.turns = turns
+        self.by_utterance = {t.utterance: t for t in turns}
+        self.speech_seconds = speech_seconds
+        self.think_seconds = think_seconds
+        self.spoken = 0
+        self._pending: "asyncio.Queue[str]" = asyncio.Queue()
+
+    def on_agent_state_changed(self, evt) -> None:
+        if getattr(evt, "old_state", None) == "speaking" and getattr(evt, "new_state", None) == "listening":
+            if self.spoken < len(self.turns):
+                asyncio.get_running_loop().call_later(self.think_seconds, self._release)
+
+    def _release(self) -> None:
+        if self.spoken < len(self.turns):
+            self._pending.put_nowait(self.turns[self.spoken].utterance)
+            self.spoken += 1
+
+    def next_utterance(self) -> Optional[str]:
+        try:
+            return self._pending.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+
+def _silent_frame(sample_rate: int, ms: int = FRAME_MS) -> rtc.AudioFrame:
+    samples = sample_rate * ms // 1000
+    return rtc.AudioFrame(b"\x00\x00" * samples, sample_rate, 1, samples)
+
+
+# -- room audio -----------------------------------------------------------
+
+class SilentAudioInput(io.AudioInput):
+    """Microphone that yields silent 20 ms frames in real time"""
+
+    def __init__(self):
+        super().__init__(label="load-test-mic")
+        self._frame = _silent_frame(INPUT_SAMPLE_RATE)
+        self._next_at: Optional[float] = None
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        now = time.monotonic()
+        self._next_at = max(self._next_at or now, now - 0.1) + FRAME_MS / 1000.0
+        await asyncio.sleep(max(0.0, self._next_at - now))
+        return self._frame
+
+
+class NullAudioOutput(io.AudioOutput):
+    """Speaker that plays captured audio back in real time and discards it"""
+
+    def __init__(self):
+        try:
+            super().__init__(
+                label="load-test-speaker",
+                capabilities=io.AudioOutputCapabilities(pause=False),
+                next_in_chain=None,
+                sample_rate=OUTPUT_SAMPLE_RATE,
+            )
+        except (AttributeError, TypeError):
+            # Older releases take no capabilities argument
+            super().__init__(label="load-test-speaker", next_in_chain=None, sample_rate=OUTPUT_SAMPLE_RATE)
+        self._pushed = 0.0
+        self._started: Optional[float] = None
+        self._playout: Optional[asyncio.Task] = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._started is None:
+            self._started = time.monotonic()
+            if hasattr(self, "on_playback_started"):
+                self.on_playback_started(created_at=time.time())
+        self._pushed += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._started is None:
+            return
+        remaining = max(0.0, self._started + self._pushed - time.monotonic())
+        self._playout = asyncio.create_task(self._finish(remaining, interrupted=False))
+
+    def clear_buffer(self) -> None:
+        if self._playout is not None:
+            self._playout.cancel()
+        if self._started is not None:
+            self._playout = asyncio.create_task(self._finish(0.0, interrupted=True))
+
+    async def _finish(self, delay: float, interrupted: bool) -> None:
+        await asyncio.sleep(delay)
+        position = min(self._pushed, time.monotonic() - (self._started or time.monotonic()))
+        self._pushed, self._started = 0.0, None
+        self.on_playback_finished(playback_position=position, interrupted=interrupted)
+
+
+# -- STT ------------------------------------------------------------------
+
+class ScriptedSTT(stt.STT):
+    """Streaming STT that 'hears' the caller script over the incoming frames.
+
+    When an utterance is released it reports start of speech, lets the
+    utterance's duration of frames pass, then emits the final transcript
+    and end of speech, as provider endpointing would.
+    """
+
+    def __init__(self, script: CallerScript):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=False))
+        self.script = script
+
+    async def _recognize_impl(self, buffer, *, language=None, conn_options: APIConnectOptions = None) -> stt.SpeechEvent:
+        raise NotImplementedError("ScriptedSTT only supports streaming")
+
+    def stream(self, *, language=None, conn_options: APIConnectOptions = None) -> "ScriptedSTTStream":
+        return ScriptedSTTStream(stt=self, conn_options=conn_options or APIConnectOptions())
+
+
+class ScriptedSTTStream(stt.RecognizeStream):
+    async def _run(self) -> None:
+        script = self._stt.script
+        frames_left = 0
+        current: Optional[str] = None
+        async for data in self._input_ch:
+            if not isinstance(data, rtc.AudioFrame):
+                continue
+            if current is None:
+                current = script.next_utterance()
+                if current is None:
+                    continue
+                frames_left = int(script.speech_seconds * 1000 / FRAME_MS)
+                self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH))
+            frames_left -= 1
+            if frames_left > 0:
+                continue
+            alternative = stt.SpeechData(language="en", text=current, confidence=1.0)
+            self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.FINAL_TRANSCRIPT, alternatives=[alternative]))
+            self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH))
+            current = None
+
+
+# -- LLM ------------------------------------------------------------------
+
+class ScriptedLLM(llm.LLM):
+    """LLM that answers each scripted utterance, calling its tool first if it has one"""
+
+    def __init__(self, script: CallerScript, ttft: float = 0.25, chunk_delay: float = 0.02):
+        super().__init__()
+        self.script = script
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+
+    def chat(self, *, chat_ctx: llm.ChatContext, tools=None, conn_options: APIConnectOptions = None, **kwargs) -> "ScriptedLLMStream":
+        return ScriptedLLMStream(self, chat_ctx=chat_ctx, tools=tools or [], conn_options=conn_options or APIConnectOptions())
+
+
+class ScriptedLLMStream(llm.LLMStream):
+    def _send(self, delta: Optional[llm.ChoiceDelta] = None, usage: Optional[llm.CompletionUsage] = None) -> None:
+        self._event_ch.send_nowait(llm.ChatChunk(id=self._request_id, delta=delta, usage=usage))
+
+    async def _run(self) -> None:
+        fake: ScriptedLLM = self._llm
+        self._request_id = f"fake-{uuid.uuid4().hex[:8]}"
+        await asyncio.sleep(fake.ttft)
+        items = self._chat_ctx.items
+        last = items[-1] if items else None
+        turn = None
+        for item in reversed(items):
+            if getattr(item, "type", None) == "message" and item.role == "user":
+                turn = fake.script.by_utterance.get(item.text_content or "")
+                break
+        if turn is not None and turn.tool and getattr(last, "type", None) != "function_call_output":
+            call = llm.FunctionToolCall(name=turn.tool, arguments=json.dumps(turn.args), call_id=f"call_{uuid.uuid4().hex[:8]}")
+            self._send(llm.ChoiceDelta(role="assistant", tool_calls=[call]))
+            reply_tokens = 20
+        else:
+            reply = turn.reply if turn is not None else "Sorry, could you say that again?"
+            words = reply.split(" ")
+            for i in range(0, len(words), 4):
+                self._send(llm.ChoiceDelta(role="assistant", content=" ".join(words[i : i + 4]) + " "))
+                await asyncio.sleep(fake.chunk_delay)
+            reply_tokens = len(words)
+        prompt_tokens = sum(len((getattr(i, "text_content", None) or "").split()) for i in items) + 400
+        self._send(usage=llm.CompletionUsage(completion_tokens=reply_tokens, prompt_tokens=prompt_tokens, total_tokens=prompt_tokens + reply_tokens))
+
+
+# -- TTS ------------------------------------------------------------------
+
+class SilentTTS(tts.TTS):
+    """Non-streaming TTS returning silence sized to the text's speaking time"""
+
+    def __init__(self, ttfb: float = 0.15, chars_per_second: float = 15.0):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=OUTPUT_SAMPLE_RATE, num_channels=1)
+        self.ttfb = ttfb
+        self.chars_per_second = chars_per_second
+
+    def synthesize(self, text: str, *, conn_options: APIConnectOptions = None) -> "SilentChunkedStream":
+        return SilentChunkedStream(tts=self, input_text=text, conn_options=conn_options or APIConnectOptions())
+
+
+class SilentChunkedStream(tts.ChunkedStream):
+    async def _run(self, output_emitter) -> None:
+        fake: SilentTTS = self._tts
+        await asyncio.sleep(fake.ttfb)
+        output_emitter.initialize(
+            request_id=uuid.uuid4().hex[:8],
+            sample_rate=OUTPUT_SAMPLE_RATE,
+            num_channels=1,
+            mime_type="audio/pcm",
+        )
+        seconds = max(0.2, len(self._input_text) / fake.chars_per_second)
+        chunk = b"\x00\x00" * (OUTPUT_SAMPLE_RATE // 10)
+        for _ in range(int(seconds * 10)):
+            output_emitter.push(chunk)
+        output_emitter.flush()
+
+
+# -- OpenAI client used by the summarizer ---------------------------------
+
+class FakeOpenAI:
+    """Answers `chat.completions.create` the way the summarizer reads it"""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.requests = 0
+
+    async def _create(self, *, messages, stream: bool = False, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        text = "The caller booked an appointment and reviewed their upcoming appointments."
+        usage = SimpleNamespace(prompt_tokens=sum(len(m["content"].split()) for m in messages), completion_tokens=len(text.split()))
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+        async def _chunks():
+            for word in text.split(" "):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+
+        return _chunks()
@@ -0,0 +1,278 @@
+"""
+Offline load test: many simulated callers through VoiceAgent in one process
+
+    python -m bench.load_test --calls 40 --concurrency 20
+    python -m bench.load_test --sweep 1,5,10,20,40
+
+Each call runs the real VoiceAgent and AgentSession pipeline with a
+scripted caller (identify, check slots, book, list appointments, hang up)
+over fake STT/LLM/TTS and an in-memory Supabase stand-in. A worker job
+process hosts one call, so one process here stands in for a worker's
+loop at N concurrent sessions. The report covers event-loop lag, memory
+per session and per-turn latency percentiles; `--sweep` finds the most
+sessions that stay within the lag and latency budget.
+"""
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import logging
+import os
+import resource
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# Configure the agent modules for offline runs before they are imported
+os.environ.setdefault("TURN_DETECTION", "stt")
+os.environ.setdefault("OPENAI_API_KEY", "load-test")
+os.environ["TRACE_DIR"] = ""
+os.environ.pop("TRANSCRIPT_SPILL_DIR", None)
+
+from agent import VoiceAgent
+from bench.fakes import CallerScript, FakeOpenAI, NullAudioOutput, ScriptedLLM, ScriptedSTT, ScriptedTurn, SilentAudioInput, SilentTTS
+from bench.local_supabase import LocalSupabase
+from database import DatabaseManager
+from tracing import REPORT_FIELDS, summarize_latencies
+from worker_load import MAX_LOOP_LAG_MS
+
+logger = logging.getLogger(__name__)
+
+CALL_TIMEOUT = 120.0
+
+
+def caller_script(index: int, speech_seconds: float) -> CallerScript:
+    phone = f"555{index:07d}"
+    date = (datetime.date.today() + datetime.timedelta(days=1 + index % 14)).isoformat()
+    time_of_day = f"{9 + index % 8:02d}:00"
+    name = f"Caller {index}"
+    turns = [
+        ScriptedTurn(f"Hi, my number is {phone}.", "Thanks, I found your account. What day works for you?", "identify_user", {"phone_number": phone}),
+        ScriptedTurn(f"Do you have anything on {date}?", "Yes, there are openings that day. Which time would you like?", "fetch_slots", {"date": date}),
+        ScriptedTurn(
+            f"{time_of_day} please, the name is {name}.",
+            f"You're booked for {date} at {time_of_day}.",
+            "book_appointment",
+            {"date": date, "time": time_of_day, "user_name": name, "phone_number": phone},
+        ),
+        ScriptedTurn("Can you read back my appointments?", "You have one upcoming appointment.", "retrieve_appointments", {"phone_number": phone}),
+        ScriptedTurn("No, that's everything. Goodbye!", "Thanks for calling, goodbye!", "end_conversation", {}),
+    ]
+    return CallerScript(turns, speech_seconds=speech_seconds)
+
+
+class _FakeJobContext:
+    """The parts of JobContext VoiceAgent touches, with no room"""
+
+    def __init__(self, room_name: str):
+        # Named for session ids; no participant, so data-channel events are dropped
+        self.room = SimpleNamespace(name=room_name, local_participant=None)
+        self.proc = SimpleNamespace(userdata={})
+        self.shutdown_callbacks: List[Any] = []
+
+    def add_shutdown_callback(self, callback) -> None:
+        self.shutdown_callbacks.append(callback)
+
+    async def shutdown(self) -> None:
+        for callback in self.shutdown_callbacks:
+            await callback()
+
+
+class SimulatedVoiceAgent(VoiceAgent):
+    """VoiceAgent with fake models and in-process audio instead of a room"""
+
+    def __init__(self, ctx, db, script: CallerScript, args):
+        super().__init__(ctx, db=db)
+        self.script = script
+        self.args = args
+        fake_openai = FakeOpenAI(latency=args.llm_ttft)
+        self.summarizer.client = fake_openai
+        self.summarizer.running._client = fake_openai
+
+    def _build_models(self):
+        return (
+            ScriptedSTT(self.script),
+            ScriptedLLM(self.script, ttft=self.args.llm_ttft),
+            SilentTTS(ttfb=self.args.tts_ttfb),
+        )
+
+    async def _start_session(self):
+        self.session.input.audio = SilentAudioInput()
+        self.session.output.audio = NullAudioOutput()
+        self.session.on("agent_state_changed", self.script.on_agent_state_changed)
+        await self.session.start(agent=self.agent)
+
+    async def _synthesize_text_to_wav(self, text: str, out_path: str) -> None:
+        return None
+
+    async def _monitor_room_tracks(self, duration: float = 8.0, interval: float = 1.0) -> None:
+        return None
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        # Peak RSS is the best available without procfs (KB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Sampler:
+    """Samples event-loop lag every `interval` and resident memory every second"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lag_ms: List[float] = []
+        self.peak_rss_mb = _rss_mb()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag_ms.append(max(0.0, (loop.time() - expected) * 1000.0))
+            ticks += 1
+            if ticks % int(1 / self.interval) == 0:
+                self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb())
+
+
+async def run_load(args, concurrency: int, calls: int) -> Dict[str, Any]:
+    supabase = LocalSupabase()
+    db = DatabaseManager(client=supabase)
+    semaphore = asyncio.Semaphore(concurrency)
+    turns: List[Dict[str, Any]] = []
+    outcomes = {"completed": 0, "timed_out": 0, "failed": 0}
+    active = 0
+    peak_active = 0
+
+    gc.collect()
+    baseline_rss = _rss_mb()
+    sampler = _Sampler()
+    sampler.start()
+
+    async def one_call(index: int) -> None:
+        nonlocal active, peak_active
+        async with semaphore:
+            ctx = _FakeJobContext(f"load-{index}")
+            agent = SimulatedVoiceAgent(ctx, db, caller_script(index, args.speech_seconds), args)
+            closed = asyncio.Event()
+            active += 1
+            peak_active = max(peak_active, active)
+            try:
+                await agent.start()
+                agent.session.on("close", lambda _evt: closed.set())
+                await asyncio.wait_for(closed.wait(), timeout=CALL_TIMEOUT)
+                outcomes["completed"] += 1
+            except asyncio.TimeoutError:
+                outcomes["timed_out"] += 1
+                await agent.session.aclose()
+            except Exception:
+                logger.exception("Simulated call %d failed", index)
+                outcomes["failed"] += 1
+            finally:
+                active -= 1
+                await ctx.shutdown()
+                turns.extend(agent.tracer.turns)
+
+    started = time.perf_counter()
+    # Stagger arrivals so calls don't all hit the same pipeline stage at once
+    tasks = []
+    for index in range(calls):
+        tasks.append(asyncio.create_task(one_call(index)))
+        await asyncio.sleep(args.arrival_interval)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await sampler.aclose()
+
+    latency = {}
+    for name in REPORT_FIELDS:
+        values = [t[name] for t in turns if t.get(name) is not None]
+        if values:
+            latency[name] = summarize_latencies(values)
+    lag = summarize_latencies(sampler.lag_ms)
+    lag["max"] = round(max(sampler.lag_ms), 1) if sampler.lag_ms else None
+    peak_rss = sampler.peak_rss_mb
+    per_session = (peak_rss - baseline_rss) / peak_active if peak_active else 0.0
+    return {
+        "concurrency": concurrency,
+        "calls": calls,
+        **outcomes,
+        "peak_sessions": peak_active,
+        "duration_s": round(elapsed, 1),
+        "turns": len(turns),
+        "loop_lag_ms": lag,
+        "memory_mb": {
+            "baseline": round(baseline_rss, 1),
+            "peak": round(peak_rss, 1),
+            "per_session": round(per_session, 2),
+        },
+        "turn_latency_ms": latency,
+        "db_requests": supabase.requests,
+        "appointments": supabase.row_count("appointments"),
+    }
+
+
+def within_budget(result: Dict[str, Any], max_lag_ms: float, max_playout_ms: float) -> bool:
+    lag_p99 = result["loop_lag_ms"].get("p99") or 0.0
+    playout_p90 = result["turn_latency_ms"].get("playout_start_ms", {}).get("p90") or 0.0
+    return (
+        result["failed"] == 0
+        and result["timed_out"] == 0
+        and lag_p99 <= max_lag_ms
+        and playout_p90 <= max_playout_ms
+    )
+
+
+async def main_async(args) -> Dict[str, Any]:
+    if not args.sweep:
+        result = await run_load(args, args.concurrency, args.calls)
+        result["within_budget"] = within_budget(result, args.max_lag_ms, args.max_playout_ms)
+        return result
+    levels = [int(level) for level in args.sweep.split(",") if level.strip()]
+    results = []
+    sessions_per_worker = 0
+    for level in levels:
+        result = await run_load(args, level, max(level, args.calls_per_level * level))
+        result["within_budget"] = within_budget(result, args.max_lag_ms, args.max_playout_ms)
+        results.append(result)
+        if not result["within_budget"]:
+            break
+        sessions_per_worker = level
+    return {"sessions_per_worker": sessions_per_worker, "levels": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--sweep", help="comma-separated concurrency levels to step through")
+    parser.add_argument("--calls-per-level", type=int, default=2, help="calls per concurrent slot in a sweep")
+    parser.add_argument("--arrival-interval", type=float, default=0.05, help="seconds between call arrivals")
+    parser.add_argument("--speech-seconds", type=float, default=1.2, help="length of each caller utterance")
+    parser.add_argument("--llm-ttft", type=float, default=0.25)
+    parser.add_argument("--tts-ttfb", type=float, default=0.15)
+    parser.add_argument("--max-lag-ms", type=float, default=MAX_LOOP_LAG_MS)
+    parser.add_argument("--max-playout-ms", type=float, default=1500.0, help="p90 budget from end of speech to agent audio")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # The null speaker can't pause, which livekit warns about once per session
+    logging.getLogger("livekit.agents").setLevel(logging.ERROR)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
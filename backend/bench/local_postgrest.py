@@ -0,0 +1,420 @@
+"""
+Local PostgREST stand-in with injectable latency, errors and stalls
+
+    python -m bench.local_postgrest --port 54321 --latency lognormal:20,0.5 --error-rate 0.01
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=local.bench.key python main.py dev
+
+    python -m bench.local_postgrest --bench --calls 50 --concurrency 5 --latency uniform:5,40 --stall-rate 0.01
+
+Serves the part of the PostgREST API the Supabase client uses for this
+backend: select, insert and update on `/rest/v1/<table>` with `eq`,
+`gt(e)` and `lt(e)` filters, `order` and `limit`, plus
+`/rest/v1/rpc/<function>` for the store's stand-ins of the schema's SQL
+functions and anything added with `register_rpc`. Rows live in memory (a LocalSupabase), so the real
+DatabaseManager and supabase-py code paths run without a Supabase
+project.
+
+Faults apply to every `/rest/v1` request:
+- latency    `fixed:MS`, `uniform:LO,HI`, `normal:MEAN,SD` or `lognormal:MEDIAN,SIGMA` (ms)
+- errors     a fraction of requests fail with a PostgREST-style 503
+- stalls     a fraction of requests hang for `stall_seconds` before answering
+
+They can be changed while running with `POST /_admin/faults` (same field
+names as FaultConfig) and request counts are at `GET /_admin/stats`.
+`--bench` runs scripted tool sequences through ToolManager and the real
+DatabaseManager against the server and reports per-tool latency.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from bench.local_supabase import FILTER_OPS, LocalSupabase
+
+logger = logging.getLogger(__name__)
+
+# Shaped like a JWT, which older supabase-py releases require of the key
+DEFAULT_KEY = "local.bench.key"
+_RESERVED_PARAMS = ("select", "order", "limit", "offset", "columns", "on_conflict")
+
+
+class LatencyModel:
+    """Samples a per-request delay in seconds from a spec like `lognormal:20,0.5`"""
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec: str = "fixed:0"):
+        kind, _, params = spec.partition(":")
+        if kind not in self.KINDS:
+            # A bare number is a fixed delay
+            kind, params = "fixed", spec
+        try:
+            self.params = [float(p) for p in params.split(",") if p.strip()] or [0.0]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        if kind in ("uniform", "normal", "lognormal") and len(self.params) != 2:
+            raise ValueError(f"{kind} latency takes two parameters: {spec!r}")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.params[0]
+        if self.kind == "fixed":
+            ms = a
+        elif self.kind == "uniform":
+            ms = rng.uniform(a, self.params[1])
+        elif self.kind == "normal":
+            ms = rng.gauss(a, self.params[1])
+        else:
+            ms = rng.lognormvariate(math.log(max(a, 1e-3)), self.params[1])
+        return max(0.0, ms) / 1000.0
+
+
+@dataclass
+class FaultConfig:
+    """What the server does to each request before answering it"""
+
+    latency: str = "fixed:0"
+    error_rate: float = 0.0
+    error_status: int = 503
+    stall_rate: float = 0.0
+    stall_seconds: float = 30.0
+    seed: Optional[int] = None
+
+    def update(self, values: Dict[str, Any]) -> None:
+        known = {f.name for f in fields(self)}
+        for name, value in values.items():
+            if name not in known:
+                raise ValueError(f"Unknown fault setting: {name}")
+            if name == "latency":
+                LatencyModel(str(value))
+            setattr(self, name, value)
+
+
+def _pg_error(status: int, code: str, message: str) -> web.Response:
+    return web.json_response({"code": code, "details": None, "hint": None, "message": message}, status=status)
+
+
+def _unquote(value: str) -> str:
+    # supabase-py quotes filter values containing , : ( or )
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def parse_order(spec: str) -> List[Tuple[str, bool]]:
+    """`date.asc,time.desc.nullslast` -> [("date", False), ("time", True)]"""
+    columns = []
+    for term in spec.split(","):
+        if not term:
+            continue
+        column, *modifiers = term.split(".")
+        columns.append((column, "desc" in modifiers))
+    return columns
+
+
+class LocalPostgrest:
+    """In-memory PostgREST over a LocalSupabase store, with fault injection"""
+
+    def __init__(self, store: Optional[LocalSupabase] = None, faults: Optional[FaultConfig] = None):
+        self.store = store or LocalSupabase()
+        self.faults = faults or FaultConfig()
+        self._rng = random.Random(self.faults.seed)
+        self._latency = LatencyModel(self.faults.latency)
+        self._rpc: Dict[str, Callable[..., Any]] = {}
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "stalls": 0}
+        self.by_route: Dict[str, int] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    def register_rpc(self, name: str, fn: Callable[..., Any]) -> None:
+        """Expose `fn(store, **params)` at /rest/v1/rpc/<name>"""
+        self._rpc[name] = fn
+
+    # -- faults -----------------------------------------------------------
+
+    @web.middleware
+    async def _fault_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        if not request.path.startswith("/rest/v1/"):
+            return await handler(request)
+        faults = self.faults
+        self.stats["requests"] += 1
+        route = f"{request.method} {request.path[len('/rest/v1/'):]}"
+        self.by_route[route] = self.by_route.get(route, 0) + 1
+
+        if self._latency.spec != faults.latency:
+            self._latency = LatencyModel(faults.latency)
+        delay = self._latency.sample(self._rng)
+        if faults.stall_rate and self._rng.random() < faults.stall_rate:
+            self.stats["stalls"] += 1
+            delay += faults.stall_seconds
+        if delay:
+            await asyncio.sleep(delay)
+        if faults.error_rate and self._rng.random() < faults.error_rate:
+            self.stats["errors"] += 1
+            return _pg_error(faults.error_status, "PGRST000", "Injected fault")
+        return await handler(request)
+
+    # -- REST ---------------------------------------------------------------
+
+    def _query(self, request: web.Request):
+        query = self.store.table(request.match_info["table"])
+        for column, value in request.query.items():
+            if column in _RESERVED_PARAMS:
+                continue
+            op, _, operand = value.partition(".")
+            if op not in FILTER_OPS:
+                raise web.HTTPBadRequest(
+                    text=json.dumps({"code": "PGRST100", "message": f"Unsupported operator: {op}"}),
+                    content_type="application/json",
+                )
+            query.filter(column, op, _unquote(operand))
+        for column, desc in parse_order(request.query.get("order", "")):
+            query.order(column, desc=desc)
+        return query
+
+    @staticmethod
+    def _window(request: web.Request, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        offset = int(request.query.get("offset", 0))
+        limit = request.query.get("limit")
+        return rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+
+    @staticmethod
+    def _returns_rows(request: web.Request) -> bool:
+        return "return=representation" in request.headers.get("Prefer", "")
+
+    async def _json_body(self, request: web.Request) -> Any:
+        try:
+            return await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(
+                text=json.dumps({"code": "PGRST102", "message": "Invalid JSON body"}),
+                content_type="application/json",
+            )
+
+    async def handle_select(self, request: web.Request) -> web.Response:
+        rows = self._query(request).select().execute().data
+        return web.json_response(self._window(request, rows))
+
+    async def handle_insert(self, request: web.Request) -> web.Response:
+        body = await self._json_body(request)
+        if not isinstance(body, (dict, list)):
+            return _pg_error(400, "PGRST102", "Body must be an object or an array of objects")
+        rows = self.store.table(request.match_info["table"]).insert(body).execute().data
+        if self._returns_rows(request):
+            return web.json_response(rows, status=201)
+        return web.Response(status=201)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        body = await self._json_body(request)
+        if not isinstance(body, dict):
+            return _pg_error(400, "PGRST102", "Body must be an object")
+        rows = self._query(request).update(body).execute().data
+        if self._returns_rows(request):
+            return web.json_response(rows)
+        return web.Response(status=204)
+
+    async def handle_rpc(self, request: web.Request) -> web.Response:
+        name = request.match_info["function"]
+        fn = self._rpc.get(name)
+        if fn is None and name in self.store.functions:
+            fn = lambda _store, **params: self.store.functions[name](**params)
+        if fn is None:
+            return _pg_error(404, "PGRST202", f"Could not find the function public.{name}")
+        params = await self._json_body(request) if request.can_read_body else {}
+        try:
+            result = fn(self.store, **(params or {}))
+        except TypeError as e:
+            return _pg_error(400, "PGRST202", str(e))
+        except Exception as e:
+            logger.error(f"RPC {name} failed: {e}")
+            return _pg_error(400, "P0001", str(e))
+        return web.json_response(result)
+
+    # -- admin --------------------------------------------------------------
+
+    async def handle_faults(self, request: web.Request) -> web.Response:
+        if request.method == "POST":
+            try:
+                values = await request.json()
+                self.faults.update(values)
+            except (ValueError, AttributeError) as e:
+                return web.json_response({"error": str(e)}, status=400)
+            if "seed" in values:
+                self._rng.seed(self.faults.seed)
+        return web.json_response(asdict(self.faults))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "by_route": self.by_route, "rows": {t: len(r) for t, r in self.store.tables.items()}})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._fault_middleware])
+        app.router.add_post("/rest/v1/rpc/{function}", self.handle_rpc)
+        app.router.add_get("/rest/v1/{table}", self.handle_select)
+        app.router.add_post("/rest/v1/{table}", self.handle_insert)
+        app.router.add_patch("/rest/v1/{table}", self.handle_update)
+        app.router.add_route("*", "/_admin/faults", self.handle_faults)
+        app.router.add_get("/_admin/stats", self.handle_stats)
+        return app
+
+    # -- serving ------------------------------------------------------------
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 54321, stop: Optional[asyncio.Event] = None, ready: Optional[Callable[[int], None]] = None) -> None:
+        """Serve until `stop` is set; `ready` gets the bound port"""
+        runner = web.AppRunner(self.build_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound = runner.addresses[0][1]
+        logger.info(f"Local PostgREST listening on {host}:{bound}")
+        if ready is not None:
+            ready(bound)
+        try:
+            await (stop or asyncio.Event()).wait()
+        finally:
+            await runner.cleanup()
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a daemon thread and return the base URL.
+
+        The Supabase client is synchronous, so the server needs its own
+        loop to answer while a caller's loop is blocked on a request.
+        """
+        bound: Dict[str, int] = {}
+        started = threading.Event()
+
+        def _ready(p: int) -> None:
+            bound["port"] = p
+            started.set()
+
+        async def _main() -> None:
+            self._loop = asyncio.get_running_loop()
+            self._stop = asyncio.Event()
+            await self.serve(host, port, self._stop, _ready)
+
+        def _run() -> None:
+            try:
+                asyncio.run(_main())
+            except Exception as e:
+                logger.error(f"Local PostgREST stopped: {e}", exc_info=True)
+                started.set()
+
+        self._thread = threading.Thread(target=_run, name="local-postgrest", daemon=True)
+        self._thread.start()
+        started.wait()
+        if "port" not in bound:
+            raise RuntimeError("Local PostgREST failed to start")
+        return f"http://{host}:{bound['port']}"
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# -- tool latency benchmark ---------------------------------------------------
+
+async def _caller(tools, db, index: int, latencies: Dict[str, List[float]]) -> None:
+    phone = f"555{index:07d}"
+    date = f"2025-04-{1 + index % 28:02d}"
+    steps = [
+        ("identify_user", {"phone_number": phone}),
+        ("fetch_slots", {"date": date}),
+        ("book_appointment", {"date": date, "time": f"{9 + index % 8:02d}:00", "user_name": f"Caller {index}", "phone_number": phone}),
+        ("retrieve_appointments", {"phone_number": phone}),
+    ]
+    for name, args in steps:
+        start = time.perf_counter()
+        result = await tools.execute_tool(name, args, db, phone)
+        latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000.0)
+        if name == "book_appointment" and result.get("success"):
+            appointment_id = result["appointment"].get("id")
+            for follow_up, extra in (("modify_appointment", {"new_time": "16:30"}), ("cancel_appointment", {})):
+                start = time.perf_counter()
+                await tools.execute_tool(follow_up, {"appointment_id": appointment_id, "phone_number": phone, **extra}, db, phone)
+                latencies.setdefault(follow_up, []).append((time.perf_counter() - start) * 1000.0)
+
+
+async def run_bench(server: LocalPostgrest, calls: int, concurrency: int) -> Dict[str, Any]:
+    """Run scripted tool sequences through the real DatabaseManager against `server`"""
+    from database import DatabaseManager
+    from tools import ToolManager
+    from tracing import summarize_latencies
+
+    url = server.start()
+    os.environ["SUPABASE_URL"] = url
+    os.environ["SUPABASE_KEY"] = DEFAULT_KEY
+    try:
+        db = DatabaseManager()
+        tools = ToolManager()
+        latencies: Dict[str, List[float]] = {}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int) -> None:
+            async with semaphore:
+                await _caller(tools, db, index, latencies)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(calls)))
+        elapsed = time.perf_counter() - started
+        return {
+            "calls": calls,
+            "concurrency": concurrency,
+            "faults": asdict(server.faults),
+            "duration_s": round(elapsed, 2),
+            "tool_latency_ms": {name: summarize_latencies(values) for name, values in latencies.items()},
+            "server": {**server.stats, "by_route": server.by_route},
+        }
+    finally:
+        server.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency", default="fixed:0", help="per-request latency distribution in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--bench", action="store_true", help="run the tool latency benchmark instead of serving")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING if args.bench else logging.INFO)
+
+    LatencyModel(args.latency)
+    faults = FaultConfig(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds,
+        seed=args.seed,
+    )
+    server = LocalPostgrest(faults=faults)
+    if args.bench:
+        print(json.dumps(asyncio.run(run_bench(server, args.calls, args.concurrency)), indent=2))
+        return
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+In-memory stand-in for the subset of the Supabase client used by DatabaseManager
+"""
+import asyncio
+import copy
+import datetime
+import itertools
+import operator
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from availability import DEFAULT_RESOURCE_ID, to_minutes
+
+# Values are compared as strings, which is right for ids, ISO dates and HH:MM times
+FILTER_OPS = {"eq": operator.eq, "gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+
+def _text(value: Any) -> str:
+    # Booleans as PostgREST spells them, so `eq.true` matches True
+    return str(value).lower() if isinstance(value, bool) or str(value) in ("True", "False") else str(value)
+
+
+class _Query:
+    """Chainable query over one table: select/insert/update, comparison filters, order"""
+
+    def __init__(self, client: "LocalSupabase", table: str):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._payload: Any = None
+        self._filters: List[tuple] = []
+        self._order: List[tuple] = []
+
+    def select(self, _columns: str = "*") -> "_Query":
+        self._op = "select"
+        return self
+
+    def insert(self, rows: Any) -> "_Query":
+        self._op = "insert"
+        self._payload = rows
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "_Query":
+        self._op = "update"
+        self._payload = values
+        return self
+
+    def filter(self, column: str, op: str, value: Any) -> "_Query":
+        self._filters.append((column, FILTER_OPS[op], _text(value)))
+        return self
+
+    def eq(self, column: str, value: Any) -> "_Query":
+        return self.filter(column, "eq", value)
+
+    def gte(self, column: str, value: Any) -> "_Query":
+        return self.filter(column, "gte", value)
+
+    def lte(self, column: str, value: Any) -> "_Query":
+        return self.filter(column, "lte", value)
+
+    def order(self, column: str, desc: bool = False) -> "_Query":
+        self._order.append((column, desc))
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(op(_text(row.get(column)), value) for column, op, value in self._filters)
+
+    def execute(self) -> SimpleNamespace:
+        return SimpleNamespace(data=self._client._execute(self))
+
+
+class _RpcCall:
+    def __init__(self, client: "LocalSupabase", fn: Callable[..., Any], params: Dict[str, Any]):
+        self._client = client
+        self._fn = fn
+        self._params = params
+
+    def execute(self) -> SimpleNamespace:
+        self._client.requests += 1
+        return SimpleNamespace(data=copy.deepcopy(self._fn(**self._params)))
+
+
+class LocalSupabase:
+    """Dict-backed tables with just enough of the query builder for DatabaseManager.
+
+    Rows get a UUID `id` on insert (BIGSERIAL-style integers for
+    `call_events`), and results are deep copies so callers can't mutate
+    stored rows, matching what a round trip through PostgREST gives.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._serial = itertools.count(1)
+        self.requests = 0
+        # table -> callbacks receiving each inserted or updated row, as Realtime delivers them
+        self._listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        # Python versions of the SQL functions in database/schema.sql
+        self.functions: Dict[str, Callable[..., Any]] = {
+            "hold_slot": self._hold_slot,
+            "release_slot_holds": self._release_slot_holds,
+            "release_slot_hold": self._release_slot_hold,
+            "active_holds": self._active_holds,
+            "book_slot": self._book_slot,
+        }
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def subscribe(self, table: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self._listeners.setdefault(table, []).append(callback)
+
+    def unsubscribe(self, table: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+        if callback in self._listeners.get(table, []):
+            self._listeners[table].remove(callback)
+
+    def _notify(self, table: str, kind: str, row: Dict[str, Any]) -> None:
+        for callback in self._listeners.get(table, []):
+            callback({
+                "type": kind,
+                "table": table,
+                "record": copy.deepcopy(row),
+                "old_record": {"id": row.get("id")},
+                "commit_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+
+    def rpc(self, name: str, params: Optional[Dict[str, Any]] = None) -> _RpcCall:
+        if name not in self.functions:
+            raise ValueError(f"Could not find the function public.{name}")
+        return _RpcCall(self, self.functions[name], params or {})
+
+    # -- resources and slot holds (expires_at is epoch seconds here) ---------
+
+    def _resource(self, resource_id: str) -> Optional[Dict[str, Any]]:
+        for row in self.tables.get("resources", []):
+            if str(row["id"]) == str(resource_id):
+                return row
+        # The schema seeds the default resource
+        if resource_id == DEFAULT_RESOURCE_ID:
+            return {"id": DEFAULT_RESOURCE_ID, "capacity": 1}
+        return None
+
+    def _booked(self, resource_id: str, date: str, time_str: str, minutes: int, exclude_id: Any = None) -> int:
+        """Confirmed appointments on a resource overlapping `minutes` from `time_str`"""
+        start = to_minutes(time_str)
+        end = start + minutes
+        used = 0
+        for a in self.tables.get("appointments", []):
+            if (
+                str(a.get("resource_id", DEFAULT_RESOURCE_ID)) == str(resource_id)
+                and str(a.get("date")) == str(date)
+                and a.get("status", "confirmed") == "confirmed"
+                and a.get("id") != exclude_id
+            ):
+                a_start = to_minutes(a.get("time"))
+                if a_start < end and a_start + int(a.get("duration_minutes") or 60) > start:
+                    used += 1
+        return used
+
+    def _held(self, resource_id: str, date: str, time_str: str, holder: Optional[str]) -> int:
+        now = time.time()
+        key = (str(resource_id), str(date), str(time_str)[:5])
+        return sum(
+            1 for h in self.tables.get("slot_holds", [])
+            if (h["resource_id"], h["date"], h["time"]) == key and h["holder"] != holder and h["expires_at"] > now
+        )
+
+    def _hold_slot(
+        self, p_resource_id: str, p_date: str, p_time: str, p_duration_minutes: int, p_holder: str, p_ttl_seconds: int,
+    ) -> bool:
+        resource = self._resource(p_resource_id)
+        if resource is None:
+            return False
+        holds = self.tables.setdefault("slot_holds", [])
+        now = time.time()
+        key = (str(p_resource_id), str(p_date), str(p_time)[:5])
+        holds[:] = [h for h in holds if (h["resource_id"], h["date"], h["time"]) != key or h["expires_at"] > now]
+        for hold in holds:
+            if (hold["resource_id"], hold["date"], hold["time"]) == key and hold["holder"] == p_holder:
+                hold["expires_at"] = now + p_ttl_seconds
+                return True
+        used = self._booked(*key, p_duration_minutes) + self._held(*key, None)
+        if used >= (resource.get("capacity") or 1):
+            return False
+        holds.append({"resource_id": key[0], "date": key[1], "time": key[2], "holder": p_holder, "expires_at": now + p_ttl_seconds})
+        return True
+
+    def _release_slot_holds(self, p_holder: str) -> int:
+        holds = self.tables.setdefault("slot_holds", [])
+        kept = [h for h in holds if h["holder"] != p_holder]
+        released = len(holds) - len(kept)
+        holds[:] = kept
+        return released
+
+    def _release_slot_hold(self, p_resource_id: str, p_date: str, p_time: str, p_holder: str) -> bool:
+        holds = self.tables.setdefault("slot_holds", [])
+        before = len(holds)
+        self._release_hold(p_resource_id, p_date, p_time, p_holder)
+        return len(holds) < before
+
+    def _active_holds(self, p_date_from: str, p_date_to: str, p_holder: str) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [
+            {"resource_id": h["resource_id"], "date": h["date"], "time": h["time"]}
+            for h in self.tables.get("slot_holds", [])
+            if str(p_date_from) <= h["date"] <= str(p_date_to) and h["holder"] != p_holder and h["expires_at"] > now
+        ]
+
+    def _book_slot(
+        self, p_resource_id: str, p_date: str, p_time: str, p_duration_minutes: int,
+        p_phone_number: str, p_user_name: str, p_holder: str,
+    ) -> List[Dict[str, Any]]:
+        resource = self._resource(p_resource_id)
+        if resource is None:
+            return []
+        used = self._booked(p_resource_id, p_date, p_time, p_duration_minutes) + self._held(p_resource_id, p_date, p_time, p_holder)
+        if used >= (resource.get("capacity") or 1):
+            return []
+        self._release_hold(p_resource_id, p_date, p_time, p_holder)
+        row = {
+            "id": str(uuid.uuid4()),
+            "phone_number": p_phone_number,
+            "user_name": p_user_name,
+            "resource_id": str(p_resource_id),
+            "date": str(p_date),
+            "time": str(p_time),
+            "duration_minutes": p_duration_minutes,
+            "status": "confirmed",
+        }
+        self.tables.setdefault("appointments", []).append(row)
+        self._notify("appointments", "INSERT", row)
+        return [row]
+
+    def _check_capacity(self, row: Dict[str, Any]) -> None:
+        # Mirrors the check_resource_capacity trigger
+        if row.get("status", "confirmed") != "confirmed":
+            return
+        resource_id = row.get("resource_id", DEFAULT_RESOURCE_ID)
+        resource = self._resource(resource_id) or {}
+        minutes = int(row.get("duration_minutes") or 60)
+        if self._booked(resource_id, row.get("date"), row.get("time"), minutes, exclude_id=row.get("id")) >= (resource.get("capacity") or 1):
+            raise ValueError(f"slot_full: {row.get('date')} {row.get('time')} on {resource_id}")
+
+    def _release_hold(self, resource_id: str, date: str, time_str: str, holder: str) -> None:
+        key = (str(resource_id), str(date), str(time_str)[:5], holder)
+        holds = self.tables.get("slot_holds", [])
+        holds[:] = [h for h in holds if (h["resource_id"], h["date"], h["time"], h["holder"]) != key]
+
+    def _execute(self, query: _Query) -> List[Dict[str, Any]]:
+        self.requests += 1
+        rows = self.tables.setdefault(query._table, [])
+        if query._op == "insert":
+            payload = query._payload if isinstance(query._payload, list) else [query._payload]
+            inserted = []
+            for row in payload:
+                row = dict(row)
+                if "id" not in row:
+                    row["id"] = next(self._serial) if query._table == "call_events" else str(uuid.uuid4())
+                rows.append(row)
+                inserted.append(copy.deepcopy(row))
+                self._notify(query._table, "INSERT", row)
+            return inserted
+        matched = [row for row in rows if query._matches(row)]
+        if query._op == "update":
+            for row in matched:
+                if query._table == "appointments":
+                    self._check_capacity(dict(row, **query._payload))
+                row.update(query._payload)
+                self._notify(query._table, "UPDATE", row)
+        for column, desc in reversed(query._order):
+            matched.sort(key=lambda r: str(r.get(column, "")), reverse=desc)
+        return copy.deepcopy(matched)
+
+    def row_count(self, table: str) -> int:
+        return len(self.tables.get(table, []))
+
+
+class LocalChangeSource:
+    """Change feed from a LocalSupabase for AppointmentChangeFeed, standing in for Realtime.
+
+    Changes reach the subscriber's event loop `delay` seconds after the
+    write, whichever thread made it (the PostgREST stand-in serves
+    requests on its own thread).
+    """
+
+    def __init__(self, store: LocalSupabase, delay: float = 0.0):
+        self.store = store
+        self.delay = delay
+        self.live = False
+        self._deliver: Optional[Callable[[Dict[str, Any]], None]] = None
+
+    async def start(self, on_change: Callable[[Dict[str, Any]], None]) -> None:
+        loop = asyncio.get_running_loop()
+
+        def deliver(change: Dict[str, Any]) -> None:
+            loop.call_soon_threadsafe(loop.call_later, self.delay, on_change, change)
+
+        self._deliver = deliver
+        self.store.subscribe("appointments", deliver)
+        self.live = True
+
+    async def aclose(self) -> None:
+        if self._deliver is not None:
+            self.store.unsubscribe("appointments", self._deliver)
+            self._deliver = None
+        self.live = False
@@ -0,0 +1,194 @@
+"""
+Replay recorded sessions' tool calls against a storage backend
+
+    python -m bench.replay tmp/recordings --speed 1
+    python -m bench.replay tmp/recordings --speed 10 --replicas 20 --concurrency 200
+    python -m bench.replay tmp/recordings --speed 0 --backend postgrest --latency lognormal:20,0.5
+
+Reads recordings written with SESSION_RECORD_DIR and re-executes each
+session's tool calls through ToolManager and DatabaseManager. Calls keep
+their recorded offsets divided by `--speed` (0 runs them back to back),
+and sessions arrive with their recorded spacing. `--replicas` runs
+extra copies of every session, each as a different caller (phone
+numbers get a suffix), competing for the same slots.
+
+Appointment ids from the recording are mapped to the ids the replay
+backend hands out, so a cancel after a booking hits the new row. Calls
+whose success differs from the recording are counted as diverged.
+
+Backends:
+- local      in-memory Supabase stand-in, in-process (default)
+- postgrest  the local PostgREST server, with `--latency`, `--error-rate`, `--stall-rate`
+- env        the Supabase project in SUPABASE_URL / SUPABASE_KEY (writes real rows)
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bench.local_postgrest import DEFAULT_KEY, FaultConfig, LocalPostgrest
+from bench.local_supabase import LocalSupabase
+from database import DatabaseManager
+from session_recording import appointment_ids, iter_recordings
+from tools import ToolManager
+from tracing import summarize_latencies
+
+logger = logging.getLogger(__name__)
+
+_PHONE_CHARS = re.compile(r"[\s\-()]")
+
+
+class SessionReplay:
+    """One replica of a recorded session, with its own phone and id mappings"""
+
+    def __init__(self, recording: Dict[str, Any], replica: int):
+        self.recording = recording
+        self.replica = replica
+        self.id_map: Dict[str, str] = {}
+
+    def _phone(self, phone: Any) -> Any:
+        if not self.replica or not isinstance(phone, str) or not phone.strip():
+            return phone
+        return f"{_PHONE_CHARS.sub('', phone)}{self.replica:04d}"
+
+    def map_args(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        mapped = dict(args)
+        if "phone_number" in mapped:
+            mapped["phone_number"] = self._phone(mapped["phone_number"])
+        if "appointment_id" in mapped:
+            mapped["appointment_id"] = self.id_map.get(str(mapped["appointment_id"]), mapped["appointment_id"])
+        return mapped
+
+    def learn_ids(self, recorded: List[str], result: Dict[str, Any]) -> None:
+        # Ids line up by position: one for a booking, date order for a listing
+        for old, new in zip(recorded, appointment_ids(result)):
+            self.id_map.setdefault(old, new)
+
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        return [r for r in self.recording["records"] if r.get("k") == "tool"]
+
+
+class Replayer:
+    def __init__(self, db, speed: float, concurrency: int):
+        self.db = db
+        self.speed = speed
+        self.tools = ToolManager()
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.latencies: Dict[str, List[float]] = {}
+        self.recorded: Dict[str, List[float]] = {}
+        self.diverged: Dict[str, int] = {}
+        self.schedule_lag_ms: List[float] = []
+        self.calls = 0
+
+    def _scaled(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed > 0 else 0.0
+
+    async def _run_session(self, replay: SessionReplay) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        phone: Optional[str] = None
+        for record in replay.tool_calls():
+            due = start + self._scaled(record.get("t", 0.0))
+            wait = due - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif self.speed > 0:
+                self.schedule_lag_ms.append(-wait * 1000.0)
+            name = record["name"]
+            args = replay.map_args(record.get("args") or {})
+            began = time.perf_counter()
+            result = await self.tools.execute_tool(name, args, self.db, phone)
+            self.latencies.setdefault(name, []).append((time.perf_counter() - began) * 1000.0)
+            self.recorded.setdefault(name, []).append(record.get("ms", 0.0))
+            self.calls += 1
+            if bool(result.get("success")) != bool(record.get("ok")):
+                self.diverged[name] = self.diverged.get(name, 0) + 1
+            if name == "identify_user" and result.get("success"):
+                phone = result.get("phone_number")
+            replay.learn_ids(record.get("ids", []), result)
+
+    async def _arrive(self, replay: SessionReplay, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if self.semaphore is None:
+            await self._run_session(replay)
+            return
+        async with self.semaphore:
+            await self._run_session(replay)
+
+    async def run(self, recordings: List[Dict[str, Any]], replicas: int, stagger: float) -> float:
+        """Replay every session `replicas` times; returns the wall time in seconds"""
+        starts = [r["header"].get("ts", 0.0) for r in recordings]
+        first = min(starts) if starts else 0.0
+        tasks = []
+        for recording, ts in zip(recordings, starts):
+            for replica in range(replicas):
+                delay = self._scaled(ts - first) + replica * stagger
+                tasks.append(self._arrive(SessionReplay(recording, replica), delay))
+        began = time.perf_counter()
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - began
+
+
+def build_database(args) -> Tuple[DatabaseManager, Optional[LocalPostgrest]]:
+    """DatabaseManager for the chosen backend, plus the server to stop afterwards"""
+    if args.backend == "local":
+        return DatabaseManager(client=LocalSupabase()), None
+    if args.backend == "postgrest":
+        server = LocalPostgrest(faults=FaultConfig(
+            latency=args.latency, error_rate=args.error_rate, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+        ))
+        os.environ["SUPABASE_URL"] = server.start()
+        os.environ["SUPABASE_KEY"] = DEFAULT_KEY
+        return DatabaseManager(), server
+    return DatabaseManager(), None
+
+
+async def main_async(args) -> Dict[str, Any]:
+    recordings = [r for r in iter_recordings(args.paths) if any(rec.get("k") == "tool" for rec in r["records"])]
+    if not recordings:
+        raise SystemExit("No recordings with tool calls found")
+    db, server = build_database(args)
+    replayer = Replayer(db, args.speed, args.concurrency)
+    try:
+        elapsed = await replayer.run(recordings, args.replicas, args.stagger)
+    finally:
+        if server is not None:
+            server.stop()
+    return {
+        "sessions": len(recordings) * args.replicas,
+        "recordings": len(recordings),
+        "backend": args.backend,
+        "speed": args.speed,
+        "duration_s": round(elapsed, 2),
+        "tool_calls": replayer.calls,
+        "calls_per_s": round(replayer.calls / elapsed, 1) if elapsed else None,
+        "tool_latency_ms": {name: summarize_latencies(v) for name, v in replayer.latencies.items()},
+        "recorded_latency_ms": {name: summarize_latencies(v) for name, v in replayer.recorded.items()},
+        "diverged": replayer.diverged,
+        "schedule_lag_ms": summarize_latencies(replayer.schedule_lag_ms),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="recording files or directories")
+    parser.add_argument("--speed", type=float, default=1.0, help="time acceleration; 0 for no waits")
+    parser.add_argument("--replicas", type=int, default=1, help="copies of each session")
+    parser.add_argument("--stagger", type=float, default=0.05, help="seconds between replicas of a session")
+    parser.add_argument("--concurrency", type=int, default=0, help="max sessions in flight; 0 for no limit")
+    parser.add_argument("--backend", choices=("local", "postgrest", "env"), default="local")
+    parser.add_argument("--latency", default="fixed:0", help="postgrest backend latency distribution in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=30.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
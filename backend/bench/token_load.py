@@ -0,0 +1,84 @@
+"""
+Load benchmark for the token service
+
+    python -m bench.token_load --requests 20000 --concurrency 200
+
+Starts the token server in-process on a local port with throwaway
+credentials (signing needs no network) and drives it with concurrent
+clients, reporting throughput and p50/p90/p99 latency for pooled grants
+(empty body) and for named rooms (signed per request).
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+import aiohttp
+from aiohttp import web
+
+from token_server import create_app
+from token_service import TokenService
+from tracing import summarize_latencies
+
+
+async def _drive(url: str, body: bytes, total: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+async def run(total: int, concurrency: int, pool_size: int) -> Dict[str, Any]:
+    service = TokenService(url="ws://localhost:7880", api_key="bench", api_secret="bench-secret" * 4, pool_size=pool_size)
+    runner = web.AppRunner(create_app(service), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f"http://127.0.0.1:{port}/api/livekit-token"
+    try:
+        await asyncio.sleep(0.1)  # let the pool fill
+        results = {
+            "pooled": await _drive(url, b"", total, concurrency),
+            "named": await _drive(url, json.dumps({"roomName": "bench-room", "participantName": "bench-user"}).encode(), total, concurrency),
+            "service": service.stats(),
+        }
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--pool-size", type=int, default=256)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency, args.pool_size)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Business-hours calendar: weekly opening hours, breaks and dated exceptions compiled into slot templates
+"""
+import datetime
+import json
+import logging
+import os
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# JSON file with the opening hours (see business_hours.example.json); unset means 09:00-17:00 every day
+HOURS_FILE = os.getenv("BUSINESS_HOURS_FILE")
+# IANA timezone for today's date and the current time, overriding the file's; unset uses the server's
+TIMEZONE = os.getenv("BUSINESS_TIMEZONE")
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_HOURS = {"mon-sun": ["09:00-17:00"]}
+DEFAULT_SLOT_MINUTES = 60
+# Dates (or date and resource window pairs) cached before the cache starts over
+MAX_CACHED_DAYS = 4096
+
+# Sorted, non-overlapping (open, close) minutes after midnight
+Intervals = Tuple[Tuple[int, int], ...]
+# Slot start minutes, in order and as a set for membership tests
+SlotTemplate = Tuple[Tuple[int, ...], FrozenSet[int]]
+
+
+def to_minutes(value: Any) -> int:
+    """`HH:MM` or `HH:MM:SS` -> minutes after midnight"""
+    hours, minutes = str(value).split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+_LABELS = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(24 * 60))
+
+
+def from_minutes(minutes: int) -> str:
+    return _LABELS[minutes] if 0 <= minutes < len(_LABELS) else f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _parse_range(value: str) -> Tuple[int, int]:
+    start, _, end = str(value).partition("-")
+    start, end = to_minutes(start.strip()), to_minutes(end.strip())
+    if not 0 <= start < end <= 24 * 60:
+        raise ValueError(f"Invalid hours range: {value}")
+    return start, end
+
+
+def _intervals(values: Optional[List[str]], breaks: Intervals = ()) -> Intervals:
+    """Merge "HH:MM-HH:MM" ranges and cut the breaks out of them"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(_parse_range(v) for v in values or ()):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    for break_start, break_end in breaks:
+        merged = [
+            piece
+            for start, end in merged
+            for piece in ((start, min(end, break_start)), (max(start, break_end), end))
+            if piece[0] < piece[1]
+        ]
+    return tuple(merged)
+
+
+def _parse_days(spec: str) -> List[int]:
+    """"mon-fri", "sat" or "mon,wed,fri" -> weekday numbers (Monday is 0)"""
+    days: List[int] = []
+    for part in spec.lower().split(","):
+        first, _, last = part.strip().partition("-")
+        start = WEEKDAYS.index(first.strip()[:3])
+        end = WEEKDAYS.index(last.strip()[:3]) if last else start
+        days.extend(range(start, end + 1) if start <= end else [*range(start, 7), *range(end + 1)])
+    return days
+
+
+def _format(hours: Intervals) -> str:
+    return ", ".join(f"{from_minutes(start)}-{from_minutes(end)}" for start, end in hours)
+
+
+def _zone(name: Optional[str]) -> Optional[ZoneInfo]:
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logger.error(f"Unknown timezone {name}, using the server's: {e}")
+        return None
+
+
+class BusinessCalendar:
+    """Opening hours as per-weekday slot templates plus dated exceptions.
+
+    Each distinct combination of hours, resource window and slot length is
+    compiled to its slot starts once, and each date and resource window
+    resolves to one of those templates through a cached day mask, so
+    checking that a time is bookable is a dict lookup and a set
+    membership test.
+    """
+
+    def __init__(
+        self,
+        weekly: List[Intervals],
+        slot_minutes: int = DEFAULT_SLOT_MINUTES,
+        timezone: Optional[str] = None,
+        exceptions: Optional[Dict[str, Tuple[Intervals, str]]] = None,
+    ):
+        if len(weekly) != 7:
+            raise ValueError("weekly needs the hours for all seven days")
+        self.weekly = tuple(weekly)
+        self.slot_minutes = max(1, int(slot_minutes))
+        self.tz = _zone(timezone)
+        self.timezone = timezone if self.tz else None
+        # date -> (hours, name); empty hours means closed
+        self.exceptions = dict(exceptions or {})
+        self._day_hours: Dict[str, Intervals] = {}
+        # (date, open, close, slot length) -> template; keyed by the date so lookups hash no intervals
+        self._day_masks: Dict[tuple, SlotTemplate] = {}
+        self._templates: Dict[tuple, SlotTemplate] = {}
+        for hours in set(self.weekly):
+            self._template(hours, None, None, self.slot_minutes)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], timezone: Optional[str] = None) -> "BusinessCalendar":
+        """Build from a config dict in the business_hours.example.json format"""
+        breaks = _intervals(config.get("breaks"))
+        weekly: List[Intervals] = [()] * 7
+        for spec, ranges in (config.get("hours") or DEFAULT_HOURS).items():
+            for day in _parse_days(spec):
+                weekly[day] = _intervals(ranges, breaks)
+        exceptions = {}
+        for date, rule in (config.get("exceptions") or {}).items():
+            datetime.date.fromisoformat(date)
+            # A bare string names a closed day
+            if isinstance(rule, str):
+                rule = {"name": rule}
+            exceptions[date] = (_intervals(rule.get("hours"), breaks), rule.get("name") or "")
+        return cls(
+            weekly,
+            slot_minutes=config.get("slot_minutes") or DEFAULT_SLOT_MINUTES,
+            timezone=timezone or config.get("timezone"),
+            exceptions=exceptions,
+        )
+
+    @classmethod
+    def from_env(cls) -> "BusinessCalendar":
+        if HOURS_FILE:
+            try:
+                with open(HOURS_FILE) as f:
+                    return cls.from_config(json.load(f), TIMEZONE)
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                logger.error(f"Invalid business hours in {HOURS_FILE}, using the defaults: {e}")
+        return cls.from_config({}, TIMEZONE)
+
+    # -- clock ---------------------------------------------------------------
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.tz) if self.tz else datetime.datetime.now()
+
+    def today(self) -> datetime.date:
+        return self.now().date()
+
+    # -- lookups -------------------------------------------------------------
+
+    def hours(self, date: str) -> Intervals:
+        """Opening hours on `date` (YYYY-MM-DD); empty when closed or unparseable"""
+        hours = self._day_hours.get(date)
+        if hours is None:
+            if len(self._day_hours) >= MAX_CACHED_DAYS:
+                self._day_hours.clear()
+            hours = self._day_hours[date] = self._resolve(date)
+        return hours
+
+    def _resolve(self, date: str) -> Intervals:
+        exception = self.exceptions.get(date)
+        if exception is not None:
+            return exception[0]
+        try:
+            return self.weekly[datetime.date.fromisoformat(date).weekday()]
+        except (TypeError, ValueError):
+            return ()
+
+    def slots(
+        self,
+        date: str,
+        open_minute: Optional[int] = None,
+        close_minute: Optional[int] = None,
+        slot_minutes: Optional[int] = None,
+    ) -> SlotTemplate:
+        """Slot starts on `date`, optionally within a resource's own window and slot length"""
+        key = (date, open_minute, close_minute, slot_minutes)
+        mask = self._day_masks.get(key)
+        if mask is None:
+            if len(self._day_masks) >= MAX_CACHED_DAYS:
+                self._day_masks.clear()
+            mask = self._day_masks[key] = self._template(
+                self.hours(date), open_minute, close_minute, slot_minutes or self.slot_minutes
+            )
+        return mask
+
+    def _template(
+        self, hours: Intervals, open_minute: Optional[int], close_minute: Optional[int], slot_minutes: int,
+    ) -> SlotTemplate:
+        key = (hours, open_minute, close_minute, slot_minutes)
+        template = self._templates.get(key)
+        if template is None:
+            starts: List[int] = []
+            for start, end in hours:
+                if open_minute is not None:
+                    start = max(start, open_minute)
+                if close_minute is not None:
+                    end = min(end, close_minute)
+                starts.extend(range(start, end - slot_minutes + 1, slot_minutes))
+            template = self._templates[key] = (tuple(starts), frozenset(starts))
+        return template
+
+    def is_slot(self, date: str, minute: int) -> bool:
+        """Whether a slot on the business grid starts at `minute` on `date`"""
+        return minute in self.slots(date)[1]
+
+    def is_open_at(self, date: str, minute: int) -> bool:
+        return any(start <= minute < end for start, end in self.hours(date))
+
+    def closure(self, date: str) -> Optional[str]:
+        """Why `date` is closed, or None if it has opening hours"""
+        if self.hours(date):
+            return None
+        exception = self.exceptions.get(date)
+        return (exception[1] if exception else "") or "closed"
+
+    # -- descriptions for the tools and prompt -------------------------------
+
+    def describe(self) -> str:
+        """Weekly hours in one line, e.g. "Mon-Fri 09:00-12:30, 13:30-17:00; closed Sat-Sun; 30-minute slots" """
+        groups: List[list] = []
+        for day, hours in enumerate(self.weekly):
+            if groups and groups[-1][2] == hours:
+                groups[-1][1] = day
+            else:
+                groups.append([day, day, hours])
+        opened, closed = [], []
+        for first, last, hours in groups:
+            if first == 0 and last == 6:
+                days = "Every day"
+            elif first == last:
+                days = WEEKDAYS[first].title()
+            else:
+                days = f"{WEEKDAYS[first].title()}-{WEEKDAYS[last].title()}"
+            if hours:
+                opened.append(f"{days} {_format(hours)}")
+            else:
+                closed.append(days)
+        parts = opened or ["Closed all week"]
+        if opened and closed:
+            parts.append("closed " + ", ".join(closed))
+        parts.append(f"{self.slot_minutes}-minute slots")
+        if self.timezone:
+            parts.append(f"times in {self.timezone}")
+        return "; ".join(parts)
+
+    def upcoming_exceptions(self, days: int = 30) -> List[str]:
+        """Closures and special hours in the next `days` days, e.g. "2026-12-25 (Christmas Day): closed" """
+        first = self.today().isoformat()
+        last = (self.today() + datetime.timedelta(days=days)).isoformat()
+        notes = []
+        for date in sorted(d for d in self.exceptions if first <= d <= last):
+            hours, name = self.exceptions[date]
+            label = f"{date} ({name})" if name else date
+            notes.append(f"{label}: {_format(hours) if hours else 'closed'}")
+        return notes
+
+
+# The calendar every resource and tool uses unless given another one
+BUSINESS_CALENDAR = BusinessCalendar.from_env()
@@ -0,0 +1,94 @@
+"""
+Background batched writer for call summaries and call events
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("CALL_RECORDS_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("CALL_RECORDS_FLUSH_INTERVAL", "30"))
+# Upper bound on the final flush when the job shuts down
+CLOSE_TIMEOUT = 10.0
+
+
+class CallRecordWriter:
+    """Queues call records in memory and writes them in bulk off the call path.
+
+    `add_event` and `add_summary` only append to a buffer. A background
+    task flushes when a batch fills, when a summary is queued (end of
+    call), every `flush_interval` seconds, and once more on close, so a
+    call costs a handful of bulk inserts instead of one write per event.
+    """
+
+    def __init__(self, db, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self._db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._events: List[Dict[str, Any]] = []
+        self._summaries: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def add_event(self, row: Dict[str, Any]) -> None:
+        self._events.append(row)
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def add_summary(self, row: Dict[str, Any]) -> None:
+        self._summaries.append(row)
+        self._wakeup.set()
+
+    async def aclose(self) -> None:
+        """Stop the background task and flush whatever is still queued"""
+        self._closed = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._drain(), timeout=CLOSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Timed out flushing call records on close")
+
+    async def _drain(self) -> None:
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._closed:
+                break
+            await self.flush()
+
+    async def flush(self) -> None:
+        summaries, self._summaries = self._summaries, []
+        events, self._events = self._events, []
+        # Summaries first: they are the rows analytics depend on
+        for i in range(0, len(summaries), self.batch_size):
+            await self._write("call_summaries", summaries[i : i + self.batch_size])
+        for i in range(0, len(events), self.batch_size):
+            await self._write("call_events", events[i : i + self.batch_size])
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        if table == "call_summaries":
+            inserted = await self._db.insert_call_summaries(rows)
+        else:
+            inserted = await self._db.insert_call_events(rows)
+        self.written += inserted
+        if inserted < len(rows):
+            self.dropped += len(rows) - inserted
+            logger.error(f"Dropped {len(rows) - inserted} {table} row(s) after a failed bulk insert")
@@ -0,0 +1,177 @@
+"""
+Change feed on the appointments table, applied to the in-process availability index
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from availability import PROCESS_INDEX, AvailabilityIndex
+from telemetry import CHANGE_FEED_EVENTS, CHANGE_FEED_LAG
+
+if TYPE_CHECKING:
+    from realtime import AsyncRealtimeClient
+
+logger = logging.getLogger(__name__)
+
+# "realtime" subscribes to Supabase Realtime; "off" relies on AVAILABILITY_CACHE_SECONDS alone
+CHANGE_FEED = os.getenv("CHANGE_FEED", "off").lower()
+CHANNEL = "appointments-changes"
+
+# One row change: type (INSERT, UPDATE or DELETE), record, old_record and commit_timestamp,
+# as Realtime delivers postgres_changes
+Change = Dict[str, Any]
+OnChange = Callable[[Change], None]
+
+
+class RealtimeSource:
+    """Supabase Realtime subscription to inserts, updates and deletes on public.appointments"""
+
+    def __init__(self, url: str, key: str):
+        self.url = url
+        self.key = key
+        self._client: Optional["AsyncRealtimeClient"] = None
+        self._channel = None
+
+    @property
+    def live(self) -> bool:
+        # The client reconnects and rejoins on its own; it's only live once joined again
+        return bool(self._client and self._client.is_connected and self._channel and self._channel.is_joined)
+
+    async def start(self, on_change: OnChange) -> None:
+        # Imported here so the realtime package is only needed with CHANGE_FEED=realtime
+        from realtime import AsyncRealtimeClient, RealtimeSubscribeStates
+
+        self._client = AsyncRealtimeClient(f"{self.url.rstrip('/')}/realtime/v1", token=self.key)
+        await self._client.connect()
+        self._channel = self._client.channel(CHANNEL)
+        self._channel.on_postgres_changes(
+            "*", lambda payload: on_change(payload["data"]), table="appointments", schema="public"
+        )
+
+        def on_subscribe(state: "RealtimeSubscribeStates", error: Optional[Exception]) -> None:
+            if state != RealtimeSubscribeStates.SUBSCRIBED:
+                logger.error(f"Appointments change feed {state.value}: {error}")
+
+        await self._channel.subscribe(on_subscribe)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class AppointmentChangeFeed:
+    """Keeps an AvailabilityIndex current with appointment writes made by any worker.
+
+    While the source is live the index trusts loaded days for
+    AVAILABILITY_FEED_CACHE_SECONDS instead of reloading them every
+    AVAILABILITY_CACHE_SECONDS. When the source drops, or the feed stops
+    renewing its live status, it falls back to the shorter TTL, and on
+    reconnecting it drops its days, since changes in between were missed.
+    """
+
+    def __init__(self, source, index: AvailabilityIndex = PROCESS_INDEX, check_interval: float = 1.0):
+        self.source = source
+        self.index = index
+        self.check_interval = check_interval
+        self.applied = 0
+        self._live = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Run on the current loop, unless already running on a loop that's still going"""
+        if self._task is not None and not self._task.done() and self._task.get_loop().is_running():
+            return
+        # A job on a thread executor ends with its loop; the next job restarts the feed on its own
+        self._live = False
+        self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._live = False
+        try:
+            await self.source.aclose()
+        except Exception as e:
+            logger.error(f"Error closing change feed: {e}")
+        self.index.set_live(False)
+
+    async def _run(self) -> None:
+        try:
+            await self.source.start(self.handle)
+        except Exception as e:
+            logger.error(f"Change feed unavailable, reloading availability every {self.index.polling_ttl:g}s: {e}")
+            return
+        while True:
+            live = self.source.live
+            if live != self._live:
+                logger.info(f"Appointments change feed {'live' if live else 'down'}")
+                self._live = live
+                if not live:
+                    self.index.set_live(False)
+            if live:
+                # Renewed every check, so the index stops trusting the feed if this loop stops
+                self.index.set_live(True)
+            await asyncio.sleep(self.check_interval)
+
+    def handle(self, change: Change) -> None:
+        """Apply one change: inserts and updates upsert the new row, deletes drop the old one"""
+        kind = change.get("type")
+        kind = str(getattr(kind, "value", kind) or "").upper()
+        try:
+            if kind == "DELETE":
+                old = change.get("old_record") or {}
+                if old.get("id") is not None:
+                    self.index.discard(old["id"])
+            elif kind in ("INSERT", "UPDATE") and change.get("record"):
+                self.index.apply(change["record"])
+            else:
+                return
+        except Exception as e:
+            logger.error(f"Error applying appointment change {kind}: {e}")
+            return
+        self.applied += 1
+        CHANGE_FEED_EVENTS.labels(kind).inc()
+        committed = change.get("commit_timestamp")
+        if committed:
+            try:
+                lag = datetime.now(timezone.utc) - datetime.fromisoformat(str(committed).replace("Z", "+00:00"))
+                CHANGE_FEED_LAG.observe(max(0.0, lag.total_seconds()))
+            except ValueError:
+                pass
+
+
+_PROCESS_FEED: Optional[AppointmentChangeFeed] = None
+
+
+def start_change_feed() -> Optional[AppointmentChangeFeed]:
+    """Start this process's feed on first use and keep it, and the index it keeps current, across jobs"""
+    global _PROCESS_FEED
+    if _PROCESS_FEED is None:
+        _PROCESS_FEED = change_feed_from_env()
+        if _PROCESS_FEED is None:
+            return None
+    _PROCESS_FEED.start()
+    return _PROCESS_FEED
+
+
+def change_feed_from_env(index: AvailabilityIndex = PROCESS_INDEX) -> Optional[AppointmentChangeFeed]:
+    """The feed CHANGE_FEED asks for, or None when it's off"""
+    if CHANGE_FEED in ("", "off"):
+        return None
+    if CHANGE_FEED != "realtime":
+        logger.error(f"Unknown CHANGE_FEED {CHANGE_FEED!r}, expected realtime or off")
+        return None
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        logger.error("CHANGE_FEED=realtime needs SUPABASE_URL and SUPABASE_KEY")
+        return None
+    return AppointmentChangeFeed(RealtimeSource(url, key), index)
@@ -0,0 +1,189 @@
+"""
+Rolling chat-context compaction for long calls
+"""
+import asyncio
+import logging
+import os
+from typing import Any, List, Optional
+
+from livekit.agents import llm
+
+from tokens import count_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "600"))
+
+# Per-line caps when folding items into the running summary
+_MESSAGE_LINE_TOKENS = 60
+_TOOL_LINE_TOKENS = 40
+# Per-item overhead of the chat format (role markers, separators)
+_ITEM_OVERHEAD_TOKENS = 4
+
+
+def _item_type(item: Any) -> str:
+    return getattr(item, "type", "message")
+
+
+def _message_text(item: Any) -> str:
+    text = getattr(item, "text_content", None)
+    if text is not None:
+        return text
+    content = getattr(item, "content", "")
+    if isinstance(content, list):
+        return "\n".join(c for c in content if isinstance(c, str))
+    return str(content) if content else ""
+
+
+def _render_item(item: Any) -> str:
+    """Render a chat item as plain text, as the LLM would roughly see it"""
+    kind = _item_type(item)
+    if kind == "function_call":
+        return f"{getattr(item, 'name', 'tool')}({getattr(item, 'arguments', '')})"
+    if kind == "function_call_output":
+        return f"{getattr(item, 'name', 'tool')} -> {getattr(item, 'output', '')}"
+    return f"{getattr(item, 'role', 'unknown')}: {_message_text(item)}"
+
+
+def _fold_item(item: Any) -> Optional[str]:
+    """Render a chat item as one compact running-summary line"""
+    kind = _item_type(item)
+    if kind == "function_call":
+        return None  # the matching output line carries the tool name
+    if kind == "function_call_output":
+        output = truncate_to_tokens(str(getattr(item, "output", "")), _TOOL_LINE_TOKENS)
+        return f"- Tool {getattr(item, 'name', 'tool')}: {output}"
+    text = _message_text(item).strip()
+    if not text:
+        return None
+    role = str(getattr(item, "role", "unknown")).capitalize()
+    return f"- {role}: {truncate_to_tokens(text, _MESSAGE_LINE_TOKENS)}"
+
+
+class ChatContextCompactor:
+    """Keeps the LLM context bounded over a call.
+
+    The last `keep_turns` user turns stay verbatim; older turns and their
+    tool outputs are folded into a single running-summary system message.
+    Compaction runs as a background task while the agent is listening, so
+    it never delays a reply.
+    """
+
+    SUMMARY_ITEM_ID = "running_summary"
+
+    def __init__(
+        self,
+        keep_turns: int = KEEP_TURNS,
+        token_budget: int = TOKEN_BUDGET,
+        summary_max_tokens: int = SUMMARY_MAX_TOKENS,
+    ):
+        self.keep_turns = max(1, keep_turns)
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.compactions = 0
+        self._summary_lines: List[str] = []
+        self._token_cache: dict = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pending = False
+
+    def schedule(self, agent) -> None:
+        """Request a compaction pass; concurrent requests are coalesced"""
+        if self._task is not None and not self._task.done():
+            self._pending = True
+            return
+        self._task = asyncio.create_task(self._run(agent))
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, agent) -> None:
+        try:
+            while True:
+                self._pending = False
+                await self.compact(agent)
+                if not self._pending:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Chat context compaction failed")
+
+    async def compact(self, agent) -> bool:
+        """Compact `agent`'s chat context in place; returns True if it changed"""
+        items = self.plan(list(agent.chat_ctx.items))
+        if items is None:
+            return False
+        await agent.update_chat_ctx(llm.ChatContext(items=items))
+        self.compactions += 1
+        logger.debug("Compacted chat context to %d items", len(items))
+        return True
+
+    def plan(self, items: List[Any]) -> Optional[List[Any]]:
+        """Return the compacted item list, or None when nothing needs folding"""
+        head: List[Any] = []
+        body: List[Any] = []
+        for item in items:
+            if getattr(item, "id", None) == self.SUMMARY_ITEM_ID:
+                continue
+            if not body and _item_type(item) == "message" and getattr(item, "role", None) in ("system", "developer"):
+                head.append(item)
+            else:
+                body.append(item)
+
+        turns: List[List[Any]] = []
+        for item in body:
+            if not turns or (_item_type(item) == "message" and getattr(item, "role", None) == "user"):
+                turns.append([])
+            turns[-1].append(item)
+
+        folded = turns[: -self.keep_turns]
+        kept = turns[-self.keep_turns :]
+        # The running summary has its own allotment; fold further while the
+        # verbatim window alone would push the request over budget.
+        fixed = self._tokens(head) + self.summary_max_tokens
+        kept_tokens = sum(self._tokens(turn) for turn in kept)
+        while len(kept) > 1 and fixed + kept_tokens > self.token_budget:
+            kept_tokens -= self._tokens(kept[0])
+            folded.append(kept.pop(0))
+
+        if not folded:
+            return None
+
+        for turn in folded:
+            for item in turn:
+                line = _fold_item(item)
+                if line:
+                    self._summary_lines.append(line)
+                self._token_cache.pop(getattr(item, "id", None), None)
+        self._trim_summary()
+
+        summary = llm.ChatMessage(
+            id=self.SUMMARY_ITEM_ID,
+            role="system",
+            content=["Summary of the earlier part of this call:\n" + "\n".join(self._summary_lines)],
+        )
+        return head + [summary] + [item for turn in kept for item in turn]
+
+    def _trim_summary(self) -> None:
+        total = sum(count_tokens(line) for line in self._summary_lines)
+        while len(self._summary_lines) > 1 and total > self.summary_max_tokens:
+            total -= count_tokens(self._summary_lines.pop(0))
+
+    def _tokens(self, items: List[Any]) -> int:
+        total = 0
+        for item in items:
+            item_id = getattr(item, "id", None)
+            cached = self._token_cache.get(item_id) if item_id else None
+            if cached is None:
+                cached = count_tokens(_render_item(item)) + _ITEM_OVERHEAD_TOKENS
+                if item_id:
+                    self._token_cache[item_id] = cached
+            total += cached
+        return total
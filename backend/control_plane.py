@@ -0,0 +1,113 @@
+"""
+HTTP control plane for the agent worker: health, readiness, tokens and metrics
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from aiohttp import web
+
+from metering import worker_usage
+from telemetry import ACTIVE_SESSIONS, LOOP_LAG, REGISTRY, collect_process_snapshots, merge_snapshots, render, render_samples
+from token_service import MAX_REQUEST_BYTES, TokenService, add_token_routes, cors_middleware
+from tts_preview import add_tts_preview_routes
+from worker_load import IDLE_PROCESSES, WorkerLoad, prewarmed_processes
+
+logger = logging.getLogger(__name__)
+
+CONTROL_PLANE_HOST = os.getenv("CONTROL_PLANE_HOST", "0.0.0.0")
+CONTROL_PLANE_PORT = int(os.getenv("PORT", "8080"))
+
+
+class ControlPlane:
+    """Serves the worker's HTTP endpoints from one asyncio loop.
+
+    - `/`, `/health`: liveness
+    - `/ready`: 200 once a job process has prewarmed and the worker has
+      capacity for another call, 503 otherwise
+    - `/api/livekit-token`: token issuance for the web client
+    - `/api/tts-preview`: streamed, cached TTS previews, when TTS_PREVIEW_ENABLED is set
+    - `/metrics`: Prometheus metrics merged from the worker and its job processes
+
+    `start()` serves it from the worker's own event loop, so the control
+    plane and the LiveKit worker share one loop and one thread instead of
+    contending for the GIL.
+    """
+
+    def __init__(
+        self,
+        worker_load: WorkerLoad,
+        token_service: Optional[TokenService] = None,
+        host: str = CONTROL_PLANE_HOST,
+        port: int = CONTROL_PLANE_PORT,
+    ):
+        self.worker_load = worker_load
+        self.token_service = token_service or TokenService()
+        self.host = host
+        self.port = port
+        self._task: Optional[asyncio.Task] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[cors_middleware], client_max_size=MAX_REQUEST_BYTES)
+        app.router.add_get("/", self.handle_health)
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/ready", self.handle_ready)
+        app.router.add_get("/metrics", self.handle_metrics)
+        add_token_routes(app, self.token_service)
+        add_tts_preview_routes(app)
+        return app
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="Agent running")
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        prewarmed = prewarmed_processes()
+        has_capacity = self.worker_load.has_capacity()
+        ready = has_capacity and (prewarmed > 0 or IDLE_PROCESSES == 0)
+        body = {"ready": ready, "prewarmed": prewarmed, "has_capacity": has_capacity, "load": self.worker_load.last}
+        return web.json_response(body, status=200 if ready else 503)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        load = self.worker_load.last
+        ACTIVE_SESSIONS.set(load["sessions"])
+        LOOP_LAG.set(load["loop_lag_ms"])
+        # Job processes publish snapshots to the status directory; reading
+        # and folding them is file I/O, so keep it off the loop
+        snapshots = await asyncio.to_thread(collect_process_snapshots)
+        usage = await asyncio.to_thread(worker_usage)
+        tokens = self.token_service.stats()
+        samples = [
+            ("superbryn_worker_load", "gauge", "Reported worker load (0-1)", load["load"]),
+            ("superbryn_worker_cpu_percent", "gauge", "Worker CPU usage", load["cpu_percent"]),
+            ("superbryn_prewarmed_processes", "gauge", "Live prewarmed job processes", prewarmed_processes()),
+            ("superbryn_tokens_issued_total", "counter", "Tokens issued", tokens["issued"]),
+            ("superbryn_calls_total", "counter", "Calls completed", usage["calls"]),
+            ("superbryn_call_cost_usd_total", "counter", "Metered cost of completed calls", usage["cost_usd"]),
+        ]
+        if "pool" in tokens:
+            samples.append(("superbryn_token_pool_ready", "gauge", "Pre-minted grants ready", tokens["pool"]["ready"]))
+        text = render(merge_snapshots([REGISTRY.snapshot()] + snapshots)) + render_samples(samples)
+        return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+    async def serve(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Serve until `stop` is set (or forever)"""
+        runner = web.AppRunner(self.build_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        logger.info(f"Control plane listening on {self.host}:{self.port}")
+        try:
+            await (stop or asyncio.Event()).wait()
+        finally:
+            await runner.cleanup()
+
+    def start(self) -> None:
+        """Serve on the running loop; the worker calls this once its loop is up"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._serve_logged())
+
+    async def _serve_logged(self) -> None:
+        try:
+            await self.serve()
+        except Exception as e:
+            logger.error(f"Control plane stopped: {e}", exc_info=True)
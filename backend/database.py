@@ -1,19 +1,37 @@
 """
 Database manager for Supabase operations
 """
+import asyncio
 import logging
 import os
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from supabase import create_client, Client
 
+from availability import DEFAULT_RESOURCE_ID, PROCESS_INDEX, AvailabilityIndex, Resource, to_minutes
+from telemetry import DB_DURATION, timed
+
 logger = logging.getLogger(__name__)
 
+# Raised by the appointments capacity trigger in database/schema.sql
+SLOT_FULL = "slot_full"
+
+
+def _is_slot_full(error: Exception) -> bool:
+    return SLOT_FULL in str(error)
+
 
 class DatabaseManager:
     """Manages database operations for appointments"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[Client] = None, availability: Optional[AvailabilityIndex] = None):
+        # An explicit client (e.g. a local stand-in for load tests) skips the env config
+        # and gets its own availability index, since its rows aren't the project's
+        if client is not None:
+            self.supabase = client
+            self.availability = availability or AvailabilityIndex()
+            return
+
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_KEY")
         
@@ -21,7 +39,9 @@ class DatabaseManager:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
         
         self.supabase: Client = create_client(supabase_url, supabase_key)
+        self.availability = availability or PROCESS_INDEX
         
+    @timed(DB_DURATION)
     async def get_or_create_user(self, phone_number: str) -> Dict[str, Any]:
         """Get or create a user by phone number"""
         try:
@@ -45,31 +65,40 @@ class DatabaseManager:
             # Return a basic user dict even if DB fails
             return {"phone_number": phone_number, "id": phone_number}
     
+    @timed(DB_DURATION)
     async def create_appointment(
         self,
         phone_number: str,
         user_name: str,
         date: str,
         time: str,
-    ) -> Dict[str, Any]:
-        """Create a new appointment"""
+        resource_id: str = DEFAULT_RESOURCE_ID,
+        holder: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Create a new appointment; None if the resource is already full at that time"""
         try:
-            appointment = {
-                "phone_number": phone_number,
-                "user_name": user_name,
-                "date": date,
-                "time": time,
-                "status": "confirmed",
-                "created_at": datetime.now().isoformat(),
-            }
-            
-            result = self.supabase.table("appointments").insert(appointment).execute()
+            result = self.supabase.rpc(
+                "book_slot",
+                {
+                    "p_resource_id": resource_id,
+                    "p_date": date,
+                    "p_time": time,
+                    "p_duration_minutes": self._slot_minutes(resource_id),
+                    "p_phone_number": phone_number,
+                    "p_user_name": user_name,
+                    "p_holder": holder or "",
+                },
+            ).execute()
             
-            if result.data:
-                return result.data[0]
+            if not result.data:
+                return None
+            appointment = result.data[0]
+            self.availability.apply(appointment)
             return appointment
             
         except Exception as e:
+            if _is_slot_full(e):
+                return None
             logger.error(f"Error creating appointment: {e}")
             # Return a basic appointment dict even if DB fails
             return {
@@ -78,9 +107,11 @@ class DatabaseManager:
                 "user_name": user_name,
                 "date": date,
                 "time": time,
+                "resource_id": resource_id,
                 "status": "confirmed",
             }
     
+    @timed(DB_DURATION)
     async def get_appointment(self, appointment_id: str) -> Optional[Dict[str, Any]]:
         """Get an appointment by ID"""
         try:
@@ -94,26 +125,7 @@ class DatabaseManager:
             logger.error(f"Error getting appointment: {e}")
             return None
     
-    async def get_appointment_by_datetime(self, date: str, time: str) -> Optional[Dict[str, Any]]:
-        """Get an appointment by date and time (for double-booking check)"""
-        try:
-            result = (
-                self.supabase.table("appointments")
-                .select("*")
-                .eq("date", date)
-                .eq("time", time)
-                .eq("status", "confirmed")
-                .execute()
-            )
-            
-            if result.data:
-                return result.data[0]
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error checking appointment availability: {e}")
-            return None
-    
+    @timed(DB_DURATION)
     async def get_user_appointments(self, phone_number: str) -> List[Dict[str, Any]]:
         """Get all appointments for a user"""
         try:
@@ -132,6 +144,7 @@ class DatabaseManager:
             logger.error(f"Error getting user appointments: {e}")
             return []
     
+    @timed(DB_DURATION)
     async def cancel_appointment(self, appointment_id: str) -> Dict[str, Any]:
         """Cancel an appointment"""
         try:
@@ -142,6 +155,7 @@ class DatabaseManager:
                 .execute()
             )
             
+            self.availability.discard(appointment_id)
             if result.data:
                 return result.data[0]
             return {"id": appointment_id, "status": "cancelled"}
@@ -150,13 +164,15 @@ class DatabaseManager:
             logger.error(f"Error cancelling appointment: {e}")
             return {"id": appointment_id, "status": "cancelled"}
     
+    @timed(DB_DURATION)
     async def modify_appointment(
         self,
         appointment_id: str,
         new_date: Optional[str] = None,
         new_time: Optional[str] = None,
-    ) -> Dict[str, Any]:
-        """Modify an appointment"""
+        new_resource_id: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Modify an appointment; None if the new slot is already full"""
         try:
             updates = {"updated_at": datetime.now().isoformat()}
             
@@ -164,6 +180,8 @@ class DatabaseManager:
                 updates["date"] = new_date
             if new_time:
                 updates["time"] = new_time
+            if new_resource_id:
+                updates["resource_id"] = new_resource_id
             
             result = (
                 self.supabase.table("appointments")
@@ -173,6 +191,7 @@ class DatabaseManager:
             )
             
             if result.data:
+                self.availability.apply(result.data[0])
                 return result.data[0]
             
             # Fallback
@@ -187,5 +206,182 @@ class DatabaseManager:
             return {"id": appointment_id}
             
         except Exception as e:
+            if _is_slot_full(e):
+                return None
             logger.error(f"Error modifying appointment: {e}")
             return {"id": appointment_id}
+    
+    @timed(DB_DURATION)
+    async def get_resources(self) -> List[Dict[str, Any]]:
+        """Active providers and rooms"""
+        try:
+            result = self.supabase.table("resources").select("*").eq("active", True).order("name").execute()
+            return result.data or []
+            
+        except Exception as e:
+            logger.error(f"Error getting resources: {e}")
+            return []
+    
+    @timed(DB_DURATION)
+    async def get_bookings(self, date_from: str, date_to: str) -> List[Dict[str, Any]]:
+        """Confirmed appointments on every resource between two dates, inclusive"""
+        try:
+            result = (
+                self.supabase.table("appointments")
+                .select("id,resource_id,date,time,duration_minutes,status")
+                .eq("status", "confirmed")
+                .gte("date", date_from)
+                .lte("date", date_to)
+                .execute()
+            )
+            return result.data or []
+            
+        except Exception as e:
+            logger.error(f"Error getting bookings {date_from}..{date_to}: {e}")
+            return []
+    
+    async def refresh_availability(self, dates: List[str]) -> None:
+        """Load resources and any of `dates` whose bookings aren't cached or are stale"""
+        index = self.availability
+        if index.resources_stale():
+            index.set_resources(await self.get_resources())
+        stale = index.stale_dates(dates)
+        if stale:
+            index.load_days(stale, await self.get_bookings(min(stale), max(stale)))
+    
+    async def find_resource(self, name_or_id: Optional[str]) -> Optional[Resource]:
+        if self.availability.resources_stale():
+            await self.refresh_availability([])
+        return self.availability.resolve(name_or_id)
+    
+    async def list_resources(self, kind: Optional[str] = None) -> List[Resource]:
+        if self.availability.resources_stale():
+            await self.refresh_availability([])
+        resources = self.availability.resources.values()
+        return [r for r in resources if not kind or r.kind == kind]
+    
+    async def get_open_slots(
+        self,
+        dates: List[str],
+        resource_id: Optional[str] = None,
+        holder: Optional[str] = None,
+        include_holds: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """Open times on `dates`, each with the resources that can still take it.
+
+        Bookings come from the availability index; other callers' holds
+        are read fresh, since they come and go within minutes.
+        """
+        await self.refresh_availability(dates)
+        index = self.availability
+        if resource_id:
+            resource = index.resources.get(resource_id)
+            resources = [resource] if resource else []
+        else:
+            resources = list(index.resources.values())
+        holds = await self.get_active_holds(min(dates), max(dates), holder) if include_holds and dates else {}
+        return [
+            {"date": date, "time": time, "resources": ids}
+            for date in dates
+            for time, ids in index.open_slots(date, resources, holds)
+        ]
+    
+    def _slot_minutes(self, resource_id: str) -> int:
+        resource = self.availability.resources.get(resource_id)
+        return resource.slot_minutes if resource else self.availability.calendar.slot_minutes
+    
+    async def slot_capacity(
+        self, resource_id: str, date: str, time: str, exclude_id: Optional[str] = None,
+    ) -> int:
+        """Appointments `resource_id` can still take at `time`, ignoring holds; 0 off its slot grid"""
+        await self.refresh_availability([date])
+        resource = self.availability.resources.get(resource_id)
+        if resource is None:
+            return 0
+        return self.availability.free_capacity(resource, date, to_minutes(time), exclude_id=exclude_id)
+    
+    @timed(DB_DURATION)
+    async def hold_slot(self, resource_id: str, date: str, time: str, holder: str, ttl_seconds: int) -> bool:
+        """Take or refresh a hold on a resource's slot; False if it's full with bookings and holds"""
+        try:
+            result = self.supabase.rpc(
+                "hold_slot",
+                {
+                    "p_resource_id": resource_id,
+                    "p_date": date,
+                    "p_time": time,
+                    "p_duration_minutes": self._slot_minutes(resource_id),
+                    "p_holder": holder,
+                    "p_ttl_seconds": ttl_seconds,
+                },
+            ).execute()
+            return bool(result.data)
+            
+        except Exception as e:
+            logger.error(f"Error holding slot {resource_id} {date} {time}: {e}")
+            # Holds only reduce contention; booking still checks capacity
+            return True
+    
+    @timed(DB_DURATION)
+    async def release_slot_holds(self, holder: str) -> int:
+        """Release every hold taken by `holder`; returns how many were released"""
+        try:
+            result = self.supabase.rpc("release_slot_holds", {"p_holder": holder}).execute()
+            return int(result.data or 0)
+            
+        except Exception as e:
+            logger.error(f"Error releasing slot holds: {e}")
+            return 0
+    
+    @timed(DB_DURATION)
+    async def release_slot_hold(self, resource_id: str, date: str, time: str, holder: str) -> bool:
+        """Release `holder`'s hold on one slot; True if there was one"""
+        try:
+            result = self.supabase.rpc(
+                "release_slot_hold",
+                {"p_resource_id": resource_id, "p_date": date, "p_time": time, "p_holder": holder},
+            ).execute()
+            return bool(result.data)
+            
+        except Exception as e:
+            logger.error(f"Error releasing slot hold {resource_id} {date} {time}: {e}")
+            return False
+    
+    @timed(DB_DURATION)
+    async def get_active_holds(self, date_from: str, date_to: str, holder: Optional[str] = None) -> Dict[tuple, int]:
+        """Unexpired holds by callers other than `holder`, counted per (resource_id, date, HH:MM)"""
+        try:
+            result = self.supabase.rpc(
+                "active_holds", {"p_date_from": date_from, "p_date_to": date_to, "p_holder": holder or ""},
+            ).execute()
+            counts: Dict[tuple, int] = {}
+            for row in result.data or []:
+                key = (str(row["resource_id"]), str(row["date"]), str(row["time"])[:5])
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+            
+        except Exception as e:
+            logger.error(f"Error getting active holds: {e}")
+            return {}
+    
+    @timed(DB_DURATION)
+    async def insert_call_summaries(self, rows: List[Dict[str, Any]]) -> int:
+        """Bulk insert call summary rows; returns the number written"""
+        return await self._bulk_insert("call_summaries", rows)
+    
+    @timed(DB_DURATION)
+    async def insert_call_events(self, rows: List[Dict[str, Any]]) -> int:
+        """Bulk insert call event rows; returns the number written"""
+        return await self._bulk_insert("call_events", rows)
+    
+    async def _bulk_insert(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        try:
+            # One request per batch, run off the event loop
+            await asyncio.to_thread(lambda: self.supabase.table(table).insert(rows).execute())
+            return len(rows)
+            
+        except Exception as e:
+            logger.error(f"Error inserting {len(rows)} row(s) into {table}: {e}")
+            return 0
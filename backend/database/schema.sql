@@ -7,23 +7,95 @@ CREATE TABLE IF NOT EXISTS users (
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Providers and rooms. Each takes up to `capacity` overlapping appointments.
+-- Slots follow the business hours configured for the backend (BUSINESS_HOURS_FILE);
+-- open_time, close_time and slot_minutes narrow them for one resource, NULL keeps them.
+CREATE TABLE IF NOT EXISTS resources (
+  id TEXT PRIMARY KEY,
+  name TEXT NOT NULL,
+  kind TEXT NOT NULL DEFAULT 'provider' CHECK (kind IN ('provider', 'room')),
+  capacity INTEGER NOT NULL DEFAULT 1 CHECK (capacity > 0),
+  open_time TIME,
+  close_time TIME,
+  slot_minutes INTEGER CHECK (slot_minutes > 0),
+  active BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+-- Upgrade from per-resource hours that were always set
+ALTER TABLE resources ALTER COLUMN open_time DROP NOT NULL, ALTER COLUMN open_time DROP DEFAULT;
+ALTER TABLE resources ALTER COLUMN close_time DROP NOT NULL, ALTER COLUMN close_time DROP DEFAULT;
+ALTER TABLE resources ALTER COLUMN slot_minutes DROP NOT NULL, ALTER COLUMN slot_minutes DROP DEFAULT;
+
+-- Appointments made before resources existed belong to the default calendar
+INSERT INTO resources (id, name) VALUES ('default', 'Main calendar') ON CONFLICT (id) DO NOTHING;
+
 -- Appointments table
 CREATE TABLE IF NOT EXISTS appointments (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
   phone_number TEXT NOT NULL,
   user_name TEXT NOT NULL,
+  resource_id TEXT NOT NULL DEFAULT 'default' REFERENCES resources(id),
   date DATE NOT NULL,
   time TIME NOT NULL,
+  duration_minutes INTEGER NOT NULL DEFAULT 60 CHECK (duration_minutes > 0),
   status TEXT DEFAULT 'confirmed' CHECK (status IN ('confirmed', 'cancelled')),
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-  CONSTRAINT unique_slot UNIQUE (date, time, status) DEFERRABLE INITIALLY DEFERRED
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Upgrading from the single-calendar schema: capacity per resource replaces
+-- the one-appointment-per-time unique constraint
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS resource_id TEXT NOT NULL DEFAULT 'default' REFERENCES resources(id);
+ALTER TABLE appointments ADD COLUMN IF NOT EXISTS duration_minutes INTEGER NOT NULL DEFAULT 60;
+ALTER TABLE appointments DROP CONSTRAINT IF EXISTS unique_slot;
+
 -- Create index for faster lookups
 CREATE INDEX IF NOT EXISTS idx_appointments_phone ON appointments(phone_number);
 CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments(date, time);
 CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
+CREATE INDEX IF NOT EXISTS idx_appointments_resource_date ON appointments(resource_id, date) WHERE status = 'confirmed';
+
+-- Stream appointment changes to workers over Realtime (CHANGE_FEED=realtime).
+-- Skipped when the table is already published or outside Supabase.
+DO $$
+BEGIN
+  ALTER PUBLICATION supabase_realtime ADD TABLE appointments;
+EXCEPTION WHEN duplicate_object OR undefined_object THEN NULL;
+END $$;
+
+-- Confirmed appointments overlapping [p_time, p_time + p_minutes) on a resource.
+-- Compared as timestamps: TIME arithmetic wraps at midnight.
+CREATE OR REPLACE FUNCTION booked_count(p_resource_id TEXT, p_date DATE, p_time TIME, p_minutes INTEGER, p_exclude UUID)
+RETURNS INTEGER AS $$
+  SELECT COUNT(*)::INTEGER FROM appointments
+    WHERE resource_id = p_resource_id AND date = p_date AND status = 'confirmed'
+      AND id IS DISTINCT FROM p_exclude
+      AND date + time < p_date + p_time + make_interval(mins => p_minutes)
+      AND date + time + make_interval(mins => duration_minutes) > p_date + p_time;
+$$ LANGUAGE sql STABLE;
+
+-- Reject a confirmed appointment that would exceed its resource's capacity.
+-- Locking the resource row serializes concurrent writes for that resource.
+CREATE OR REPLACE FUNCTION check_resource_capacity()
+RETURNS TRIGGER AS $$
+DECLARE
+  cap INTEGER;
+BEGIN
+  IF NEW.status <> 'confirmed' THEN
+    RETURN NEW;
+  END IF;
+  SELECT capacity INTO cap FROM resources WHERE id = NEW.resource_id FOR UPDATE;
+  IF booked_count(NEW.resource_id, NEW.date, NEW.time, NEW.duration_minutes, NEW.id) >= COALESCE(cap, 1) THEN
+    RAISE EXCEPTION 'slot_full: % % on %', NEW.date, NEW.time, NEW.resource_id;
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS check_appointments_capacity ON appointments;
+CREATE TRIGGER check_appointments_capacity
+    BEFORE INSERT OR UPDATE OF resource_id, date, time, duration_minutes, status ON appointments
+    FOR EACH ROW EXECUTE FUNCTION check_resource_capacity();
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -35,5 +107,151 @@ END;
 $$ language 'plpgsql';
 
 -- Trigger to auto-update updated_at
+DROP TRIGGER IF EXISTS update_appointments_updated_at ON appointments;
 CREATE TRIGGER update_appointments_updated_at BEFORE UPDATE ON appointments
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+-- Call summaries (one row per call, written after hang-up)
+CREATE TABLE IF NOT EXISTS call_summaries (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  session_id TEXT UNIQUE NOT NULL,
+  room_name TEXT,
+  user_phone TEXT,
+  summary_text TEXT,
+  summary_source TEXT,
+  conversation_length INTEGER DEFAULT 0,
+  tool_calls_count INTEGER DEFAULT 0,
+  appointments_count INTEGER DEFAULT 0,
+  started_at TIMESTAMP WITH TIME ZONE,
+  ended_at TIMESTAMP WITH TIME ZONE,
+  duration_seconds REAL,
+  latency JSONB,
+  usage JSONB,
+  cost_usd REAL,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Call events (tool calls and per-turn timings, bulk inserted per call)
+CREATE TABLE IF NOT EXISTS call_events (
+  id BIGSERIAL PRIMARY KEY,
+  session_id TEXT NOT NULL,
+  event_type TEXT NOT NULL,
+  name TEXT,
+  offset_seconds REAL,
+  duration_ms REAL,
+  success BOOLEAN,
+  data JSONB,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_call_summaries_phone ON call_summaries(user_phone);
+CREATE INDEX IF NOT EXISTS idx_call_events_session ON call_events(session_id);
+
+-- Short-lived holds on slots offered to or chosen by a caller, so other
+-- callers aren't offered them; released on booking, hang-up or expiry.
+-- A resource with capacity N can have N holds and bookings on a slot.
+CREATE TABLE IF NOT EXISTS slot_holds (
+  resource_id TEXT NOT NULL DEFAULT 'default' REFERENCES resources(id),
+  date DATE NOT NULL,
+  time TIME NOT NULL,
+  holder TEXT NOT NULL,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  PRIMARY KEY (resource_id, date, time, holder)
+);
+
+CREATE INDEX IF NOT EXISTS idx_slot_holds_holder ON slot_holds(holder);
+CREATE INDEX IF NOT EXISTS idx_slot_holds_date ON slot_holds(date);
+
+-- Earlier versions of the hold functions
+DROP FUNCTION IF EXISTS hold_slot(DATE, TIME, TEXT, INTEGER);
+DROP FUNCTION IF EXISTS hold_slot(TEXT, DATE, TIME, TEXT, INTEGER);
+DROP FUNCTION IF EXISTS unavailable_slots(DATE, TEXT);
+
+-- Take or refresh a hold; false if the slot is full with bookings and other holds.
+-- p_duration_minutes is the resource's slot length, which the backend resolves
+-- from the business hours when the resource doesn't set its own.
+CREATE OR REPLACE FUNCTION hold_slot(
+  p_resource_id TEXT, p_date DATE, p_time TIME, p_duration_minutes INTEGER, p_holder TEXT, p_ttl_seconds INTEGER
+)
+RETURNS BOOLEAN AS $$
+DECLARE
+  res resources%ROWTYPE;
+  held INTEGER;
+BEGIN
+  SELECT * INTO res FROM resources WHERE id = p_resource_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN FALSE;
+  END IF;
+  DELETE FROM slot_holds
+    WHERE resource_id = p_resource_id AND date = p_date AND time = p_time AND expires_at <= NOW();
+  UPDATE slot_holds SET expires_at = NOW() + make_interval(secs => p_ttl_seconds)
+    WHERE resource_id = p_resource_id AND date = p_date AND time = p_time AND holder = p_holder;
+  IF FOUND THEN
+    RETURN TRUE;
+  END IF;
+  SELECT COUNT(*) INTO held FROM slot_holds
+    WHERE resource_id = p_resource_id AND date = p_date AND time = p_time;
+  IF held + booked_count(p_resource_id, p_date, p_time, p_duration_minutes, NULL) >= res.capacity THEN
+    RETURN FALSE;
+  END IF;
+  INSERT INTO slot_holds (resource_id, date, time, holder, expires_at)
+    VALUES (p_resource_id, p_date, p_time, p_holder, NOW() + make_interval(secs => p_ttl_seconds));
+  RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION release_slot_holds(p_holder TEXT)
+RETURNS INTEGER AS $$
+  WITH released AS (
+    DELETE FROM slot_holds WHERE holder = p_holder RETURNING 1
+  )
+  SELECT COUNT(*)::INTEGER FROM released;
+$$ LANGUAGE sql;
+
+-- Release one caller's hold on one slot, e.g. after moving an appointment into it
+CREATE OR REPLACE FUNCTION release_slot_hold(p_resource_id TEXT, p_date DATE, p_time TIME, p_holder TEXT)
+RETURNS BOOLEAN AS $$
+  WITH released AS (
+    DELETE FROM slot_holds
+      WHERE resource_id = p_resource_id AND date = p_date AND time = p_time AND holder = p_holder
+      RETURNING 1
+  )
+  SELECT COUNT(*) > 0 FROM released;
+$$ LANGUAGE sql;
+
+-- Unexpired holds between two dates taken by callers other than p_holder
+CREATE OR REPLACE FUNCTION active_holds(p_date_from DATE, p_date_to DATE, p_holder TEXT)
+RETURNS TABLE (resource_id TEXT, date DATE, time TEXT) AS $$
+  SELECT h.resource_id, h.date, to_char(h.time, 'HH24:MI') FROM slot_holds h
+    WHERE h.date BETWEEN p_date_from AND p_date_to AND h.holder <> p_holder AND h.expires_at > NOW();
+$$ LANGUAGE sql STABLE;
+
+-- Book a slot and drop the booker's hold on it in one round trip. Returns no
+-- row when bookings plus other callers' holds already fill the resource.
+CREATE OR REPLACE FUNCTION book_slot(
+  p_resource_id TEXT, p_date DATE, p_time TIME, p_duration_minutes INTEGER,
+  p_phone_number TEXT, p_user_name TEXT, p_holder TEXT
+)
+RETURNS SETOF appointments AS $$
+DECLARE
+  cap INTEGER;
+  held INTEGER;
+BEGIN
+  SELECT capacity INTO cap FROM resources WHERE id = p_resource_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+  SELECT COUNT(*) INTO held FROM slot_holds
+    WHERE resource_id = p_resource_id AND date = p_date AND time = p_time
+      AND holder <> p_holder AND expires_at > NOW();
+  IF held + booked_count(p_resource_id, p_date, p_time, p_duration_minutes, NULL) >= cap THEN
+    RETURN;
+  END IF;
+  DELETE FROM slot_holds
+    WHERE resource_id = p_resource_id AND date = p_date AND time = p_time AND holder = p_holder;
+  RETURN QUERY
+    INSERT INTO appointments (phone_number, user_name, resource_id, date, time, duration_minutes)
+    VALUES (p_phone_number, p_user_name, p_resource_id, p_date, p_time, p_duration_minutes)
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,166 @@
+"""
+Session event log: records queued unformatted, sampled per category and written off the event loop
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where each process's JSONL event log is written (default tmp/logs, empty to disable)
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "tmp/logs")
+# Size at which a log file is rotated, and how many rotated files are kept
+EVENT_LOG_MAX_MB = float(os.getenv("EVENT_LOG_MAX_MB", "20"))
+EVENT_LOG_BACKUPS = int(os.getenv("EVENT_LOG_BACKUPS", "5"))
+# Fraction of records kept per category, e.g. "tracks=0.1,state=0.5"; unlisted categories keep everything
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "tracks=0.1")
+
+_session_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+# Job processes serve one session; callbacks the job runs outside the session's tasks fall back to it
+_process_session: Optional[str] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_rates(spec: Optional[str]) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition("=")
+        if not name.strip():
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            logger.error(f"Invalid LOG_SAMPLE_RATES entry {part!r}, expected category=fraction")
+    return rates
+
+
+def bind_session(session_id: str) -> None:
+    """Tag records logged from here on (and from tasks started from here) with `session_id`"""
+    global _process_session
+    _session_id.set(session_id)
+    _process_session = session_id
+
+
+def event(category: str, **fields: Any) -> Dict[str, Any]:
+    """`extra` for a log call: its sampling category and structured fields for the JSONL log.
+
+    Fields are serialized on the writer thread, so pass values that
+    aren't changed after the call.
+    """
+    return {"category": category, "fields": fields}
+
+
+class EventQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them, dropping sampled-out categories first.
+
+    The stock QueueHandler formats every record on the calling thread;
+    here the message, arguments and fields are formatted by whichever
+    handler the writer thread passes the record to. Warnings and errors
+    are never sampled out.
+    """
+
+    def __init__(self, log_queue, rates: Optional[Dict[str, float]] = None):
+        super().__init__(log_queue)
+        self.rates = rates or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and self.rates:
+            rate = self.rates.get(getattr(record, "category", None), 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The context variable is only readable here, on the logging thread
+        record.session_id = _session_id.get() or _process_session
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, session, category, message and fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "session_id": getattr(record, "session_id", None),
+            "category": getattr(record, "category", None),
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = fields
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+def _file_handler(directory: str) -> Optional[logging.Handler]:
+    try:
+        os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            # One file per process, so rotation never races another writer
+            os.path.join(directory, f"events-{os.getpid()}.jsonl"),
+            maxBytes=int(EVENT_LOG_MAX_MB * 1024 * 1024),
+            backupCount=EVENT_LOG_BACKUPS,
+            encoding="utf-8",
+            delay=True,
+        )
+    except OSError as e:
+        logger.error(f"Event log disabled, can't write to {directory}: {e}")
+        return None
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def start_event_log() -> None:
+    """Put the root logger's handlers behind a queue and add the JSONL log, once per process.
+
+    The handlers already installed (stderr, and in job processes the
+    forwarder to the worker) run on the writer thread along with the
+    rotating JSONL file, so a log call on the event loop costs a filter
+    check and a queue put.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    root = logging.getLogger()
+    handlers: List[logging.Handler] = list(root.handlers)
+    if EVENT_LOG_DIR:
+        file_handler = _file_handler(EVENT_LOG_DIR)
+        if file_handler is not None:
+            handlers.append(file_handler)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(EventQueueHandler(log_queue, parse_rates(LOG_SAMPLE_RATES)))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_event_log)
+
+
+def stop_event_log() -> None:
+    """Write out queued records and hand the handlers back to the root logger"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, EventQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        if isinstance(handler, logging.handlers.RotatingFileHandler):
+            handler.close()
+        else:
+            root.addHandler(handler)
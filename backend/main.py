@@ -3,12 +3,13 @@ SuperBryn AI Voice Agent - Main Entry Point
 """
 import asyncio
 import logging
-import os
 from dotenv import load_dotenv
 from livekit import agents, rtc
 from livekit.agents import (
+    AgentServer,
     AutoSubscribe,
     JobContext,
+    JobRequest,
     WorkerOptions,
     cli,
     llm,
@@ -16,6 +17,13 @@ from livekit.agents import (
 from livekit.plugins import deepgram, cartesia, openai
 
 from agent import VoiceAgent
+from change_feed import start_change_feed
+from turn_taking import load_vad
+from control_plane import ControlPlane
+from event_log import start_event_log
+from speech_connections import speech_connections
+from telemetry import MetricsPublisher
+from worker_load import IDLE_PROCESSES, LOAD_THRESHOLD, LoopLagMonitor, WorkerLoad, mark_prewarmed, status_dir
 
 # Load environment variables
 load_dotenv()
@@ -24,28 +32,42 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- Health Check Server for Railway ---
-from flask import Flask
-import threading
+worker_load = WorkerLoad()
 
-app = Flask(__name__)
 
-@app.route("/")
-@app.route("/health")
-def health():
-    return "Agent running", 200
-
-def run_health_server():
-    port = int(os.getenv("PORT", 8080))
-    logger.info(f"Starting health check server on port {port}")
-    # Disable reloader/debugger to avoid signal interference
-    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
+async def request_fnc(req: JobRequest):
+    """Accept a job only while this worker can serve it at target latency"""
+    if not worker_load.admit():
+        logger.warning(f"Rejecting job {req.id}: worker at capacity {worker_load.last}")
+        await req.reject()
+        return
+    await req.accept()
 
-# ---------------------------------------
 
 async def entrypoint(ctx: JobContext):
     """Entry point for LiveKit agent jobs"""
+    # Move log formatting and writes off this job's event loop
+    start_event_log()
     logger.info("Starting voice agent job")
+
+    # Report this job's event-loop lag to the worker's load function
+    loop_monitor = LoopLagMonitor()
+    loop_monitor.start()
+    ctx.add_shutdown_callback(loop_monitor.aclose)
+
+    # Publish this job's metrics for the worker's /metrics endpoint
+    metrics_publisher = MetricsPublisher()
+    metrics_publisher.start()
+    ctx.add_shutdown_callback(metrics_publisher.aclose)
+
+    # Apply bookings made by other workers to this process's availability index.
+    # The feed is the process's, not the job's, so it isn't closed at shutdown
+    start_change_feed()
+
+    # Open the speech provider connections while the room connects and the caller joins
+    speech = speech_connections()
+    speech.start()
+    ctx.add_shutdown_callback(speech.aclose)
     
     try:
         # Connect to the room (required before waiting for participants)
@@ -76,16 +98,26 @@ async def entrypoint(ctx: JobContext):
 def prewarm(proc):
     """Prewarm function to initialize the agent"""
     logger.info("Prewarming agent")
-    # Initialize any resources here if needed
+    # Load the VAD model once per process so calls don't pay for it
+    proc.userdata["vad"] = load_vad()
+    mark_prewarmed()
 
 
 if __name__ == "__main__":
-    # Start health check server in background thread
-    threading.Thread(target=run_health_server, daemon=True).start()
-    
-    cli.run_app(
+    # Create the shared status directory before job processes are spawned
+    status_dir()
+
+    server = AgentServer.from_server_options(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
             prewarm_fnc=prewarm,
+            request_fnc=request_fnc,
+            load_fnc=worker_load.compute,
+            load_threshold=LOAD_THRESHOLD,
+            num_idle_processes=IDLE_PROCESSES,
         )
     )
+    # Health, readiness, token issuance and metrics on PORT, served from the worker's loop
+    server.on("worker_started", ControlPlane(worker_load).start)
+
+    cli.run_app(server)
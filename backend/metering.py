@@ -0,0 +1,165 @@
+"""
+Per-call usage and cost metering for LLM, STT and TTS
+"""
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+from worker_load import status_dir, status_lock
+
+logger = logging.getLogger(__name__)
+
+# USD list prices; override to match your plan
+PRICE_LLM_INPUT_PER_1M = float(os.getenv("PRICE_LLM_INPUT_PER_1M", "0.15"))
+PRICE_LLM_OUTPUT_PER_1M = float(os.getenv("PRICE_LLM_OUTPUT_PER_1M", "0.60"))
+PRICE_STT_PER_MINUTE = float(os.getenv("PRICE_STT_PER_MINUTE", "0.0043"))
+PRICE_TTS_PER_1K_CHARS = float(os.getenv("PRICE_TTS_PER_1K_CHARS", "0.015"))
+
+# Running aggregate over the worker's calls, replaced atomically under a lock
+_USAGE_TOTALS = "usage.totals.json"
+# Per-turn breakdowns beyond this are folded into the totals only
+_MAX_TURNS_REPORTED = 50
+
+
+def _new_usage() -> Dict[str, float]:
+    return {
+        "llm_requests": 0,
+        "llm_prompt_tokens": 0,
+        "llm_completion_tokens": 0,
+        "stt_seconds": 0.0,
+        "tts_characters": 0,
+    }
+
+
+def usage_cost(usage: Dict[str, float]) -> float:
+    """Cost in USD of a usage record at the configured prices"""
+    return round(
+        usage.get("llm_prompt_tokens", 0) / 1_000_000 * PRICE_LLM_INPUT_PER_1M
+        + usage.get("llm_completion_tokens", 0) / 1_000_000 * PRICE_LLM_OUTPUT_PER_1M
+        + usage.get("stt_seconds", 0.0) / 60.0 * PRICE_STT_PER_MINUTE
+        + usage.get("tts_characters", 0) / 1000.0 * PRICE_TTS_PER_1K_CHARS,
+        6,
+    )
+
+
+def _add(target: Dict[str, float], key: str, value: Any) -> None:
+    if value:
+        target[key] = target.get(key, 0) + value
+
+
+class UsageMeter:
+    """Collects usage for one call from session metrics and summarizer responses.
+
+    LLM and TTS usage is grouped per turn by the metrics' speech id. LLM
+    requests that run right after tools executed (the ones carrying the
+    tool output) are also attributed to those tools.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.totals = _new_usage()
+        self.summarizer = _new_usage()
+        self.per_turn: Dict[str, Dict[str, float]] = {}
+        self.per_tool: Dict[str, Dict[str, float]] = {}
+        self._pending_tools: List[str] = []
+
+    def attach(self, session) -> None:
+        session.on("metrics_collected", self._on_metrics_collected)
+
+    def note_tools_executed(self, names: List[str]) -> None:
+        """The next LLM request consumes these tools' output"""
+        self._pending_tools = [n for n in names if n]
+
+    def _turn(self, metrics) -> Dict[str, float]:
+        speech_id = getattr(metrics, "speech_id", None) or "unattributed"
+        return self.per_turn.setdefault(speech_id, _new_usage())
+
+    def _on_metrics_collected(self, evt) -> None:
+        metrics = getattr(evt, "metrics", evt)
+        kind = type(metrics).__name__
+        if kind == "LLMMetrics":
+            prompt = getattr(metrics, "prompt_tokens", 0) or 0
+            completion = getattr(metrics, "completion_tokens", 0) or 0
+            for target in (self.totals, self._turn(metrics)):
+                _add(target, "llm_requests", 1)
+                _add(target, "llm_prompt_tokens", prompt)
+                _add(target, "llm_completion_tokens", completion)
+            tools, self._pending_tools = self._pending_tools, []
+            for name in tools:
+                # Split across tools run in the same step so per-tool sums match the total
+                tool_usage = self.per_tool.setdefault(name, _new_usage())
+                _add(tool_usage, "llm_requests", 1)
+                _add(tool_usage, "llm_prompt_tokens", prompt / len(tools))
+                _add(tool_usage, "llm_completion_tokens", completion / len(tools))
+        elif kind == "STTMetrics":
+            _add(self.totals, "stt_seconds", getattr(metrics, "audio_duration", 0.0) or 0.0)
+        elif kind == "TTSMetrics":
+            characters = getattr(metrics, "characters_count", 0) or 0
+            _add(self.totals, "tts_characters", characters)
+            _add(self._turn(metrics), "tts_characters", characters)
+
+    def record_openai_usage(self, usage: Any) -> None:
+        """Record the `usage` block of a summarizer chat completion"""
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        for target in (self.totals, self.summarizer):
+            _add(target, "llm_requests", 1)
+            _add(target, "llm_prompt_tokens", prompt)
+            _add(target, "llm_completion_tokens", completion)
+
+    def summary(self) -> Dict[str, Any]:
+        """Usage and cost for the call, with per-turn and per-tool breakdowns"""
+        def _with_cost(usage: Dict[str, float]) -> Dict[str, Any]:
+            rounded = {k: round(v, 3) if isinstance(v, float) else v for k, v in usage.items()}
+            return dict(rounded, cost_usd=usage_cost(usage))
+
+        turns = list(self.per_turn.items())[:_MAX_TURNS_REPORTED]
+        return {
+            "totals": _with_cost(self.totals),
+            "summarizer": _with_cost(self.summarizer),
+            "per_turn": [dict(_with_cost(u), speech_id=sid) for sid, u in turns],
+            "per_tool": {name: _with_cost(u) for name, u in self.per_tool.items()},
+        }
+
+
+def _read_worker_totals(path: str) -> Dict[str, float]:
+    aggregate = dict(_new_usage(), calls=0)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return aggregate
+    for key in aggregate:
+        _add(aggregate, key, stored.get(key, 0))
+    return aggregate
+
+
+def record_worker_usage(totals: Dict[str, float]) -> Dict[str, Any]:
+    """Add a call's totals to the worker's running aggregate and return the new aggregate.
+
+    Reads and writes one small file under a lock shared with the other job
+    processes; call it off the event loop.
+    """
+    path = os.path.join(status_dir(), _USAGE_TOTALS)
+    try:
+        with status_lock("usage"):
+            aggregate = _read_worker_totals(path)
+            for key in _new_usage():
+                _add(aggregate, key, totals.get(key, 0))
+            aggregate["calls"] += 1
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(aggregate, f, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.error(f"Error recording worker usage: {e}")
+        aggregate = _read_worker_totals(path)
+    return dict(aggregate, cost_usd=usage_cost(aggregate))
+
+
+def worker_usage() -> Dict[str, Any]:
+    """Aggregate usage and cost over all calls handled by this worker"""
+    aggregate = _read_worker_totals(os.path.join(status_dir(), _USAGE_TOTALS))
+    return dict(aggregate, cost_usd=usage_cost(aggregate))
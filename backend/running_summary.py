@@ -0,0 +1,169 @@
+"""
+Incremental running summary and action log maintained during a call
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from availability import DEFAULT_RESOURCE_ID
+from transcript import ToolCallEntry, TranscriptStore
+
+logger = logging.getLogger(__name__)
+
+UPDATE_EVERY_TURNS = int(os.getenv("SUMMARY_UPDATE_EVERY_TURNS", "4"))
+RUNNING_SUMMARY_MODEL = "gpt-4o-mini"
+RUNNING_SUMMARY_MAX_TOKENS = 200
+
+
+def _resource(appointment: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    """Provider or room name for an action, None on the default calendar"""
+    if appointment.get("resource_id", DEFAULT_RESOURCE_ID) == DEFAULT_RESOURCE_ID:
+        return None
+    return result.get("resource") or appointment.get("resource_id")
+
+
+def action_from_tool_call(entry: ToolCallEntry) -> Optional[Dict[str, Any]]:
+    """Map a tool call to a structured action, or None if it isn't worth logging"""
+    name = entry.name
+    result = entry.result
+    if name == "end_conversation":
+        return None
+    if not result.get("success"):
+        return {"action": "failed", "tool": name, "error": result.get("error", "Failed")}
+    if name == "identify_user":
+        return {"action": "identified", "phone_number": result.get("phone_number")}
+    if name == "fetch_slots":
+        return {"action": "checked_slots", "date": result.get("date"), "available": len(result.get("slots", []))}
+    if name == "hold_slot":
+        return {"action": "held", "date": result.get("date"), "time": result.get("time")}
+    if name == "book_appointment":
+        appointment = result.get("appointment", {})
+        return {
+            "action": "booked",
+            "id": appointment.get("id"),
+            "date": appointment.get("date", entry.args.get("date")),
+            "time": appointment.get("time", entry.args.get("time")),
+            "user_name": appointment.get("user_name", entry.args.get("user_name")),
+            "resource": _resource(appointment, result),
+        }
+    if name == "retrieve_appointments":
+        ids = [a["id"] for a in result.get("appointments", []) if a.get("id") is not None]
+        return {"action": "retrieved", "count": result.get("count", 0), "ids": ids}
+    if name == "cancel_appointment":
+        return {"action": "cancelled", "id": entry.args.get("appointment_id")}
+    if name == "modify_appointment":
+        appointment = result.get("appointment", {})
+        return {
+            "action": "modified",
+            "id": entry.args.get("appointment_id"),
+            "date": appointment.get("date", entry.args.get("new_date")),
+            "time": appointment.get("time", entry.args.get("new_time")),
+            "resource": _resource(appointment, result),
+        }
+    return {"action": "called", "tool": name}
+
+
+def format_action(action: Dict[str, Any]) -> str:
+    """Render one action log entry as a prompt line"""
+    kind = action["action"]
+    if kind == "failed":
+        return f"- {action['tool']} failed: {action['error']}"
+    if kind == "identified":
+        return f"- Identified caller as {action['phone_number']}"
+    if kind == "checked_slots":
+        return f"- Checked slots for {action['date']} ({action['available']} available)"
+    if kind == "held":
+        return f"- Held {action['date']} at {action['time']} while confirming"
+    if kind == "booked":
+        with_resource = f" with {action['resource']}" if action.get("resource") else ""
+        return f"- Booked {action['date']} at {action['time']}{with_resource} for {action['user_name']} (id {action['id']})"
+    if kind == "retrieved":
+        return f"- Retrieved {action['count']} appointment(s)"
+    if kind == "cancelled":
+        return f"- Cancelled appointment {action['id']}"
+    if kind == "modified":
+        with_resource = f" with {action['resource']}" if action.get("resource") else ""
+        return f"- Moved appointment {action['id']} to {action['date']} at {action['time']}{with_resource}"
+    return f"- Called {action.get('tool', 'tool')}"
+
+
+class RunningSummary:
+    """Keeps a compact summary of the call so far plus a structured action log.
+
+    Tool calls are appended to the action log as they finish. The prose
+    summary is folded forward with a small LLM request whenever the agent
+    is listening and enough new turns have accumulated, so the end-of-call
+    summary only has to cover the turns since the last fold.
+    """
+
+    def __init__(self, client, update_every_turns: int = UPDATE_EVERY_TURNS, meter=None):
+        self._client = client
+        self._meter = meter
+        self.update_every_turns = max(1, update_every_turns)
+        self.text = ""
+        self.actions: List[Dict[str, Any]] = []
+        # Transcript position up to which `text` covers the conversation
+        self.turns_folded = 0
+        self._actions_folded = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def note_tool_call(self, entry: ToolCallEntry) -> None:
+        action = action_from_tool_call(entry)
+        if action is not None:
+            self.actions.append(action)
+
+    def schedule(self, history: TranscriptStore) -> None:
+        """Fold new turns into the summary in the background if due"""
+        if self._task is not None and not self._task.done():
+            return
+        new_turns = history.total - self.turns_folded
+        new_actions = len(self.actions) - self._actions_folded
+        if new_turns <= 0 or (new_turns < self.update_every_turns and new_actions == 0):
+            return
+        self._task = asyncio.create_task(self._update(history))
+
+    async def aclose(self) -> None:
+        """Stop any in-flight update; the final summary covers unfolded turns"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _update(self, history: TranscriptStore) -> None:
+        upto = history.total
+        action_count = len(self.actions)
+        new_turns = "\n".join(f"{e.role.capitalize()}: {e.text}" for e in history.since(self.turns_folded))
+        actions_text = "\n".join(format_action(a) for a in self.actions[:action_count]) or "None yet."
+        prompt = f"""Summary of the call so far:
+{self.text or "(nothing yet)"}
+
+New conversation:
+{new_turns}
+
+Actions taken so far:
+{actions_text}
+
+Rewrite the summary of the call so far to include the new conversation. Keep it under 120 words and keep any user preferences or open questions."""
+        try:
+            response = await self._client.chat.completions.create(
+                model=RUNNING_SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": "You maintain a short running summary of a phone call."},
+                    {"role": "user", "content": prompt},
+                ],
+                temperature=0.3,
+                max_tokens=RUNNING_SUMMARY_MAX_TOKENS,
+            )
+            if self._meter is not None:
+                self._meter.record_openai_usage(getattr(response, "usage", None))
+            self.text = (response.choices[0].message.content or "").strip()
+            self.turns_folded = upto
+            self._actions_folded = action_count
+            logger.debug("Running summary updated through turn %d", upto)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error updating running summary: {e}")
@@ -0,0 +1,122 @@
+"""
+Append-only recordings of session timelines for replay
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Unset or empty disables recording
+RECORD_DIR = os.getenv("SESSION_RECORD_DIR", "")
+RECORDING_VERSION = 1
+
+
+def appointment_ids(result: Dict[str, Any]) -> List[str]:
+    """Ids of the appointments a tool result refers to, in result order"""
+    if result.get("appointment"):
+        appointment_id = result["appointment"].get("id")
+        return [str(appointment_id)] if appointment_id is not None else []
+    return [str(a["id"]) for a in result.get("appointments", []) if a.get("id") is not None]
+
+
+class SessionRecorder:
+    """Writes a session's transcripts and tool calls as compact JSON lines.
+
+    The first line is a header with the session id and wall-clock start;
+    every later record carries `t`, seconds since that start. Tool
+    records keep the arguments, duration, success and the appointment
+    ids in the result, which is what `bench.replay` needs to re-run the
+    calls against another backend. Lines are written as they happen, so
+    a crashed worker still leaves a usable prefix.
+    """
+
+    def __init__(self, session_id: str, record_dir: Optional[str] = RECORD_DIR):
+        self.session_id = session_id
+        self._t0 = time.monotonic()
+        self._file = None
+        if not record_dir:
+            return
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id) or "session"
+        try:
+            os.makedirs(record_dir, exist_ok=True)
+            self._file = open(os.path.join(record_dir, f"{safe_id}.rec.jsonl"), "a", encoding="utf-8", buffering=1)
+        except OSError as e:
+            logger.error(f"Session recording disabled: {e}")
+            return
+        self._write({"k": "session", "id": session_id, "ts": round(time.time(), 3), "v": RECORDING_VERSION})
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def _offset(self, ago: float = 0.0) -> float:
+        return round(time.monotonic() - self._t0 - ago, 3)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        try:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.error(f"Error writing session recording: {e}")
+            self.close()
+
+    def record_transcript(self, role: str, text: str) -> None:
+        if self._file is not None:
+            self._write({"k": role[:1], "t": self._offset(), "text": text})
+
+    def record_tool(self, name: str, args: Dict[str, Any], duration: float, result: Dict[str, Any]) -> None:
+        """Record a tool call that just finished after `duration` seconds"""
+        if self._file is None:
+            return
+        record = {
+            "k": "tool",
+            "t": self._offset(duration),
+            "name": name,
+            "args": args,
+            "ms": round(duration * 1000.0, 1),
+            "ok": bool(result.get("success")),
+        }
+        ids = appointment_ids(result)
+        if ids:
+            record["ids"] = ids
+        self._write(record)
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        f, self._file = self._file, None
+        try:
+            f.write(json.dumps({"k": "end", "t": self._offset()}, separators=(",", ":")) + "\n")
+            f.close()
+        except Exception as e:
+            logger.error(f"Error closing session recording: {e}")
+
+
+def read_recording(path: str) -> Dict[str, Any]:
+    """Parse a recording into its header and records, skipping a torn last line"""
+    header: Dict[str, Any] = {}
+    records: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("k") == "session":
+                header = record
+            else:
+                records.append(record)
+    return {"path": path, "header": header, "records": records}
+
+
+def iter_recordings(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """Recordings from files or directories of `*.rec.jsonl` files"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".rec.jsonl"):
+                    yield read_recording(os.path.join(path, name))
+        else:
+            yield read_recording(path)
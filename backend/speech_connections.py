@@ -0,0 +1,188 @@
+"""
+Per-process speech provider connections: a shared HTTP session and pre-connected STT/TTS
+"""
+import asyncio
+import logging
+import os
+import weakref
+from typing import Any, Dict, Optional
+
+import aiohttp
+from livekit.plugins import deepgram
+
+from telemetry import SPEECH_CONNECTIONS, SPEECH_STREAMS
+
+logger = logging.getLogger(__name__)
+
+# Open the speech connections at job start, while the room connects and the caller joins
+PREWARM = os.getenv("SPEECH_PREWARM", "true").lower() not in ("0", "false", "no", "off")
+# How often idle connections are checked and replaced
+HEALTH_INTERVAL = float(os.getenv("SPEECH_HEALTH_INTERVAL", "20"))
+# How long an idle HTTPS connection is kept for reuse
+KEEPALIVE_SECONDS = float(os.getenv("SPEECH_KEEPALIVE_SECONDS", "60"))
+
+DEEPGRAM_URL = "https://api.deepgram.com/v1/listen"
+CONNECT_TIMEOUT = 10.0
+
+
+class _CountingSTT(deepgram.STT):
+    """Deepgram STT that counts the streams it serves"""
+
+    def stream(self, **kwargs):
+        SPEECH_STREAMS.labels("stt").inc()
+        return super().stream(**kwargs)
+
+
+class _CountingTTS(deepgram.TTS):
+    """Deepgram TTS that counts its WebSocket connects against the streams they serve"""
+
+    def __init__(self, owner: "SpeechConnections", **kwargs):
+        super().__init__(**kwargs)
+        self._owner = owner
+
+    async def _connect_ws(self, timeout: float) -> aiohttp.ClientWebSocketResponse:
+        ws = await super()._connect_ws(timeout)
+        self._owner.stats["tts_ws_connects"] += 1
+        SPEECH_CONNECTIONS.labels("tts_ws", "new").inc()
+        return ws
+
+    def stream(self, **kwargs):
+        self._owner.stats["tts_streams"] += 1
+        SPEECH_STREAMS.labels("tts").inc()
+        return super().stream(**kwargs)
+
+
+class SpeechConnections:
+    """One HTTP session and one STT/TTS pair per event loop, kept connected.
+
+    The Deepgram plugins take the shared session, so STT WebSocket
+    upgrades and TTS REST calls reuse warm TLS connections instead of
+    opening their own, and the TTS WebSocket pool starts with an open
+    connection. A health check drops idle connections the provider has
+    closed and opens replacements before the next turn needs them.
+    """
+
+    def __init__(self):
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._stt: Optional[deepgram.STT] = None
+        self._tts: Optional[_CountingTTS] = None
+        self._task: Optional[asyncio.Task] = None
+        # Warm HTTPS connections only matter until STT has opened its stream
+        self._stt_handed_out = False
+        self.stats: Dict[str, int] = {
+            "http_new": 0, "http_reused": 0, "tts_ws_connects": 0, "tts_streams": 0, "recycled": 0,
+        }
+
+    def http_session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_new_connection)
+            trace.on_connection_reuseconn.append(self._on_reused_connection)
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(keepalive_timeout=KEEPALIVE_SECONDS, ttl_dns_cache=300),
+                trace_configs=[trace],
+            )
+        return self._http
+
+    async def _on_new_connection(self, _session, _ctx, _params) -> None:
+        self.stats["http_new"] += 1
+        SPEECH_CONNECTIONS.labels("http", "new").inc()
+
+    async def _on_reused_connection(self, _session, _ctx, _params) -> None:
+        self.stats["http_reused"] += 1
+        SPEECH_CONNECTIONS.labels("http", "reused").inc()
+
+    def stt(self) -> deepgram.STT:
+        if self._stt is None:
+            self._stt = _CountingSTT(language="en-US", model="nova-2", smart_format=True, http_session=self.http_session())
+        self._stt_handed_out = True
+        return self._stt
+
+    def tts(self) -> deepgram.TTS:
+        if self._tts is None:
+            self._tts = _CountingTTS(self, model="aura-asteria-en", http_session=self.http_session())
+        return self._tts
+
+    # -- warm-up and health ---------------------------------------------------
+
+    def start(self) -> None:
+        """Open connections in the background and keep them healthy"""
+        if self._task is None and PREWARM and os.getenv("DEEPGRAM_API_KEY"):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    async def check(self) -> None:
+        """Keep one healthy TTS socket open and, until STT starts, an HTTPS connection warm for it"""
+        checks = [self._check_tts()]
+        if not self._stt_handed_out:
+            checks.append(self._touch(DEEPGRAM_URL))
+        for result in await asyncio.gather(*checks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Speech connection health check failed: {result}")
+
+    async def _check_tts(self) -> None:
+        pool = getattr(self.tts(), "_pool", None)
+        # Idle sockets are only visible through the pool's private set; without it there's nothing to check
+        available = getattr(pool, "_available", None)
+        if available is None:
+            return
+        # The provider closes idle sockets; drop them here rather than on the next turn
+        for ws in list(available):
+            if ws.closed:
+                pool.remove(ws)
+                self.stats["recycled"] += 1
+                SPEECH_CONNECTIONS.labels("tts_ws", "recycled").inc()
+        if not available:
+            pool.put(await pool.get(timeout=CONNECT_TIMEOUT))
+
+    async def _touch(self, url: str) -> None:
+        # Any response leaves a TLS connection in the session's pool for the next request
+        async with self.http_session().head(url, timeout=aiohttp.ClientTimeout(total=CONNECT_TIMEOUT)) as resp:
+            await resp.read()
+
+    def reuse(self) -> Dict[str, Any]:
+        """Connection counts and reuse rates since the process started"""
+        http_total = self.stats["http_new"] + self.stats["http_reused"]
+        streams = self.stats["tts_streams"]
+        return dict(
+            self.stats,
+            http_reuse_rate=round(self.stats["http_reused"] / http_total, 3) if http_total else None,
+            tts_streams_per_connect=round(streams / self.stats["tts_ws_connects"], 2) if self.stats["tts_ws_connects"] else None,
+        )
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"Speech connections: {self.reuse()}")
+        for model in (self._stt, self._tts):
+            if model is not None:
+                try:
+                    await model.aclose()
+                except Exception as e:
+                    logger.error(f"Error closing {type(model).__name__}: {e}")
+        self._stt = self._tts = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+# Job processes run one event loop each, but thread executors share the process
+_BY_LOOP: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SpeechConnections]" = weakref.WeakKeyDictionary()
+
+
+def speech_connections() -> SpeechConnections:
+    """The connections for the running event loop"""
+    loop = asyncio.get_running_loop()
+    connections = _BY_LOOP.get(loop)
+    if connections is None:
+        connections = _BY_LOOP[loop] = SpeechConnections()
+    return connections
@@ -3,140 +3,162 @@ Conversation summarizer for generating call summaries
 """
 import logging
 import os
-from typing import List, Dict, Any, Optional
+import re
+import time
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from running_summary import RunningSummary
+from summary_prompt import SummaryPromptBuilder
+from summary_templates import render_template_summary
+from telemetry import SUMMARY_DURATION
+from transcript import TranscriptStore, ToolCallStore
 
 logger = logging.getLogger(__name__)
 
+SUMMARY_MODEL = "gpt-4o-mini"
+
+# Split after sentence-ending punctuation followed by whitespace
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
 
 class ConversationSummarizer:
     """Generates conversation summaries"""
     
-    def __init__(self):
+    def __init__(self, meter=None):
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY must be set")
-        self.client = OpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key)
+        # Updated during the call so the final summary only covers the tail
+        self.running = RunningSummary(self.client, meter=meter)
+        # Optional UsageMeter that receives token usage of summary requests
+        self.meter = meter
+        self.prompt_builder = SummaryPromptBuilder()
+        # "template" or "llm", for the most recent summary
+        self.last_source = None
     
-    async def generate_summary(
+    async def fetch_appointments(self, user_phone: Optional[str], db) -> List[Dict[str, Any]]:
+        """Get the user's appointments if the phone is available"""
+        if not user_phone:
+            return []
+        try:
+            return await db.get_user_appointments(user_phone)
+        except Exception as e:
+            logger.error(f"Error fetching appointments for summary: {e}")
+            return []
+    
+    async def stream_summary(
         self,
-        conversation_history: List[Dict[str, Any]],
-        tool_calls: List[Dict[str, Any]],
-        user_phone: Optional[str],
-        db,
-    ) -> Dict[str, Any]:
-        """Generate a comprehensive conversation summary"""
+        conversation_history: TranscriptStore,
+        tool_calls: ToolCallStore,
+        appointments: List[Dict[str, Any]],
+    ) -> AsyncIterator[str]:
+        """Yield the summary sentence by sentence as the model streams it"""
+        start = time.perf_counter()
         try:
-            # Get user's appointments if phone is available
-            appointments = []
-            if user_phone:
-                appointments = await db.get_user_appointments(user_phone)
-            
-            # Format conversation history
-            conversation_text = self._format_conversation(conversation_history)
-            
-            # Format tool calls
-            tool_calls_text = self._format_tool_calls(tool_calls)
-            
-            # Format appointments
-            appointments_text = self._format_appointments(appointments)
-            
-            # Generate summary using OpenAI
-            prompt = f"""Summarize this conversation between a user and SuperBryn AI assistant.
-
-Conversation:
-{conversation_text}
-
-Actions Taken:
-{tool_calls_text}
-
-User's Appointments:
-{appointments_text}
-
-Please provide a comprehensive summary that includes:
-1. Main topics discussed
-2. Actions taken (appointments booked, cancelled, modified, retrieved)
-3. User preferences mentioned
-4. Any important details or notes
+            async for sentence in self._stream_sentences(conversation_history, tool_calls, appointments):
+                yield sentence
+        finally:
+            SUMMARY_DURATION.labels(self.last_source or "llm").observe(time.perf_counter() - start)
 
-Format the summary in a natural, conversational way that would be useful for the user to review."""
-
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
+    async def _stream_sentences(
+        self,
+        conversation_history: TranscriptStore,
+        tool_calls: ToolCallStore,
+        appointments: List[Dict[str, Any]],
+    ) -> AsyncIterator[str]:
+        # Routine calls are summarized from the action log without the LLM
+        templated = render_template_summary(self.running.actions, conversation_history.total)
+        if templated:
+            self.last_source = "template"
+            for sentence in _SENTENCE_END.split(templated):
+                yield sentence
+            return
+        self.last_source = "llm"
+        buffer = ""
+        produced = False
+        try:
+            await self.running.aclose()
+            prompt = self._build_prompt(conversation_history, appointments)
+            stream = await self.client.chat.completions.create(
+                model=SUMMARY_MODEL,
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant that creates clear, concise conversation summaries."},
                     {"role": "user", "content": prompt},
                 ],
                 temperature=0.7,
                 max_tokens=500,
+                stream=True,
+                stream_options={"include_usage": True},
             )
-            
-            summary_text = response.choices[0].message.content
-            
-            return {
-                "summary_text": summary_text,
-                "conversation_length": len(conversation_history),
-                "tool_calls_count": len(tool_calls),
-                "appointments_count": len(appointments),
-                "user_phone": user_phone,
-                "timestamp": datetime.now().isoformat(),
-                "appointments": appointments,
-            }
-            
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                if getattr(chunk, "usage", None) is not None and self.meter is not None:
+                    self.meter.record_openai_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                buffer += delta
+                *sentences, buffer = _SENTENCE_END.split(buffer)
+                for sentence in sentences:
+                    if sentence.strip():
+                        produced = True
+                        yield sentence.strip()
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
-            # Fallback summary
-            return {
-                "summary_text": f"Thank you for using SuperBryn! We had a conversation with {len(conversation_history)} exchanges. {len(tool_calls)} actions were taken.",
-                "conversation_length": len(conversation_history),
-                "tool_calls_count": len(tool_calls),
-                "appointments_count": 0,
-                "user_phone": user_phone,
-                "timestamp": datetime.now().isoformat(),
-                "appointments": [],
-            }
+            if not produced and not buffer.strip():
+                buffer = self._fallback_text(conversation_history, tool_calls)
+        if buffer.strip():
+            yield buffer.strip()
+    
+    def build_summary(
+        self,
+        summary_text: str,
+        conversation_history: TranscriptStore,
+        tool_calls: ToolCallStore,
+        user_phone: Optional[str],
+        appointments: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Assemble the summary event payload"""
+        return {
+            "summary_text": summary_text or self._fallback_text(conversation_history, tool_calls),
+            "conversation_length": conversation_history.total,
+            "tool_calls_count": tool_calls.total,
+            "appointments_count": len(appointments),
+            "user_phone": user_phone,
+            "timestamp": datetime.now().isoformat(),
+            "appointments": appointments,
+            "summary_source": self.last_source,
+        }
     
-    def _format_conversation(self, history: List[Dict[str, Any]]) -> str:
-        """Format conversation history as text"""
-        lines = []
-        for entry in history:
-            role = entry.get("role", "unknown")
-            text = entry.get("text", "")
-            lines.append(f"{role.capitalize()}: {text}")
-        return "\n".join(lines)
+    async def generate_summary(
+        self,
+        conversation_history: TranscriptStore,
+        tool_calls: ToolCallStore,
+        user_phone: Optional[str],
+        db,
+    ) -> Dict[str, Any]:
+        """Generate a comprehensive conversation summary"""
+        appointments = await self.fetch_appointments(user_phone, db)
+        sentences = [s async for s in self.stream_summary(conversation_history, tool_calls, appointments)]
+        return self.build_summary(" ".join(sentences), conversation_history, tool_calls, user_phone, appointments)
     
-    def _format_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> str:
-        """Format tool calls as text"""
-        if not tool_calls:
-            return "No actions taken."
-        
-        lines = []
-        for call in tool_calls:
-            name = call.get("name", "unknown")
-            args = call.get("args", {})
-            result = call.get("result", {})
-            
-            lines.append(f"- {name}: {args}")
-            if result.get("success"):
-                lines.append(f"  Result: {result.get('message', 'Success')}")
-            else:
-                lines.append(f"  Error: {result.get('error', 'Failed')}")
-        
-        return "\n".join(lines)
+    def _build_prompt(
+        self,
+        conversation_history: TranscriptStore,
+        appointments: List[Dict[str, Any]],
+    ) -> str:
+        # Only the turns not yet folded into the running summary are sent
+        return self.prompt_builder.build(
+            summary_so_far=self.running.text,
+            turns=conversation_history.since(self.running.turns_folded),
+            actions=self.running.actions,
+            appointments=appointments,
+        )
     
-    def _format_appointments(self, appointments: List[Dict[str, Any]]) -> str:
-        """Format appointments as text"""
-        if not appointments:
-            return "No appointments found."
-        
-        lines = []
-        for apt in appointments:
-            status = apt.get("status", "unknown")
-            date = apt.get("date", "unknown")
-            time = apt.get("time", "unknown")
-            name = apt.get("user_name", "unknown")
-            
-            lines.append(f"- {name}: {date} at {time} ({status})")
-        
-        return "\n".join(lines)
+    def _fallback_text(self, conversation_history: TranscriptStore, tool_calls: ToolCallStore) -> str:
+        return f"Thank you for using SuperBryn! We had a conversation with {conversation_history.total} exchanges. {tool_calls.total} actions were taken."
@@ -0,0 +1,169 @@
+"""
+Token-budgeted prompt builder for end-of-call summaries
+"""
+import os
+import re
+from typing import Any, Dict, Iterable, List, Set
+
+from running_summary import format_action
+from tokens import count_tokens, truncate_to_tokens
+from transcript import TranscriptEntry
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "1500"))
+# Long monologues are cut to this many tokens per turn
+_TURN_MAX_TOKENS = 80
+
+# "yes" and "no" are left out: they're often the caller confirming or declining something
+_FILLER = {
+    "ok", "okay", "uh", "um", "uh huh", "mm hmm", "hmm",
+    "thanks", "thank you", "sure", "great", "right", "alright", "all right", "got it",
+    "hello", "hi", "hey", "cool", "perfect", "fine",
+}
+_NON_WORD = re.compile(r"[^a-z ]+")
+_TURNS_OMITTED = "(earlier turns omitted)"
+
+_INSTRUCTIONS = """Please provide a comprehensive summary that includes:
+1. Main topics discussed
+2. Actions taken (appointments booked, cancelled, modified, retrieved)
+3. User preferences mentioned
+4. Any important details or notes
+
+Format the summary in a natural, conversational way that would be useful for the user to review."""
+
+
+def is_filler(text: str) -> bool:
+    """True for short acknowledgements that carry nothing worth summarizing"""
+    normalized = " ".join(_NON_WORD.sub(" ", text.lower().replace("-", " ")).split())
+    return not normalized or normalized in _FILLER
+
+
+def dedupe_actions(actions: List[Dict[str, Any]]) -> List[str]:
+    """Format actions, collapsing repeats into one line with a count"""
+    counts: Dict[str, int] = {}
+    for action in actions:
+        line = format_action(action)
+        counts[line] = counts.get(line, 0) + 1
+    return [line if n == 1 else f"{line} (x{n})" for line, n in counts.items()]
+
+
+def touched_appointment_ids(actions: List[Dict[str, Any]]) -> Set[str]:
+    """IDs of appointments booked, changed or looked up during the call"""
+    ids: Set[str] = set()
+    for action in actions:
+        if action.get("id") is not None:
+            ids.add(str(action["id"]))
+        ids.update(str(i) for i in action.get("ids", ()))
+    return ids
+
+
+def format_appointments(appointments: List[Dict[str, Any]]) -> str:
+    """Format appointments as text"""
+    if not appointments:
+        return "No appointments were changed or discussed."
+    lines = []
+    for apt in appointments:
+        status = apt.get("status", "unknown")
+        date = apt.get("date", "unknown")
+        time = apt.get("time", "unknown")
+        name = apt.get("user_name", "unknown")
+        lines.append(f"- {name}: {date} at {time} ({status})")
+    return "\n".join(lines)
+
+
+class SummaryPromptBuilder:
+    """Builds the summary prompt within a token budget.
+
+    Fixed sections (instructions, running summary, actions, appointments
+    touched in this call) are placed first; the remaining budget is filled
+    with the newest non-filler turns, oldest dropped first. If the fixed
+    sections alone are over budget, the running summary is trimmed first,
+    then the appointments, then the oldest actions. The instructions are
+    never trimmed.
+    """
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.last_prompt_tokens = 0
+
+    def build(
+        self,
+        summary_so_far: str,
+        turns: Iterable[TranscriptEntry],
+        actions: List[Dict[str, Any]],
+        appointments: List[Dict[str, Any]],
+    ) -> str:
+        touched = touched_appointment_ids(actions)
+        appointments = [a for a in appointments if str(a.get("id")) in touched]
+        action_lines = dedupe_actions(actions)
+        appointments_text = format_appointments(appointments)
+        summary_so_far = summary_so_far or "(no earlier summary)"
+
+        # Tokens left for the variable sections once the fixed text and the conversation's marker are placed
+        available = self.token_budget - count_tokens(self._head("") + self._tail("", "")) - count_tokens(_TURNS_OMITTED) - 1
+        actions_text = self._fit_lines(action_lines, available) or ("" if action_lines else "No actions taken.")
+        available -= count_tokens(actions_text)
+        appointments_text = truncate_to_tokens(appointments_text, available)
+        available -= count_tokens(appointments_text)
+        summary_so_far = truncate_to_tokens(summary_so_far, available)
+
+        head = self._head(summary_so_far)
+        tail = self._tail(actions_text, appointments_text)
+        remaining = self.token_budget - count_tokens(head) - count_tokens(tail)
+
+        lines = [
+            f"{t.role.capitalize()}: {truncate_to_tokens(t.text, _TURN_MAX_TOKENS)}"
+            for t in turns
+            if not is_filler(t.text)
+        ]
+        kept = self._fit_lines(lines, remaining - 1, _TURNS_OMITTED)
+
+        prompt = head + (kept or (_TURNS_OMITTED if lines else "(no new turns)")) + "\n" + tail
+        self.last_prompt_tokens = count_tokens(prompt)
+        return prompt
+
+    @staticmethod
+    def _fit_lines(lines: List[str], budget: int, omitted: str = "(earlier actions omitted)") -> str:
+        """The newest `lines` that fit in `budget` tokens, with a marker if older ones were dropped"""
+        kept: List[str] = []
+        costs: List[int] = []
+        for line in reversed(lines):
+            cost = count_tokens(line) + 1
+            if cost > budget:
+                break
+            kept.append(line)
+            costs.append(cost)
+            budget -= cost
+        if len(kept) == len(lines):
+            kept.reverse()
+            return "\n".join(kept)
+        # The marker is part of the section, so the oldest kept lines make room for it
+        budget -= count_tokens(omitted) + 1
+        while kept and budget < 0:
+            kept.pop()
+            budget += costs.pop()
+        if budget < 0:
+            return ""
+        kept.append(omitted)
+        kept.reverse()
+        return "\n".join(kept)
+
+    @staticmethod
+    def _head(summary_so_far: str) -> str:
+        return f"""Summarize this conversation between a user and SuperBryn AI assistant.
+
+Summary of the earlier conversation:
+{summary_so_far}
+
+Conversation since then:
+"""
+
+    @staticmethod
+    def _tail(actions_text: str, appointments_text: str) -> str:
+        return f"""
+Actions Taken:
+{actions_text}
+
+Appointments From This Call:
+{appointments_text}
+
+{_INSTRUCTIONS}"""
@@ -0,0 +1,66 @@
+"""
+Deterministic summaries for routine calls, rendered from the action log
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+TEMPLATES_ENABLED = os.getenv("SUMMARY_TEMPLATES", "true").strip().lower() in ("1", "true", "yes")
+# Longer calls likely contain content (preferences, questions) the templates can't express
+TEMPLATE_MAX_TURNS = int(os.getenv("SUMMARY_TEMPLATE_MAX_TURNS", "16"))
+
+_SUBSTANTIVE = ("booked", "cancelled", "modified", "retrieved")
+_SUPPORTED = _SUBSTANTIVE + ("identified", "checked_slots", "held")
+_MAX_SUBSTANTIVE = 3
+_CLOSING = "Thank you for calling SuperBryn. Have a great day!"
+
+
+def _spoken_date(date_str: Optional[str]) -> str:
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").strftime("%A, %B %d").replace(" 0", " ")
+    except (TypeError, ValueError):
+        return str(date_str)
+
+
+def _spoken_time(time_str: Optional[str]) -> str:
+    try:
+        parsed = datetime.strptime(str(time_str)[:5], "%H:%M")
+    except (TypeError, ValueError):
+        return str(time_str)
+    suffix = "AM" if parsed.hour < 12 else "PM"
+    hour = parsed.hour % 12 or 12
+    return f"{hour} {suffix}" if parsed.minute == 0 else f"{hour}:{parsed.minute:02d} {suffix}"
+
+
+def _render_action(action: Dict[str, Any]) -> str:
+    kind = action["action"]
+    with_resource = f" with {action['resource']}" if action.get("resource") else ""
+    if kind == "booked":
+        who = f" for {action['user_name']}" if action.get("user_name") else ""
+        return f"Your appointment{who} is booked for {_spoken_date(action['date'])} at {_spoken_time(action['time'])}{with_resource}."
+    if kind == "modified":
+        return f"Your appointment has been moved to {_spoken_date(action['date'])} at {_spoken_time(action['time'])}{with_resource}."
+    if kind == "cancelled":
+        return "Your appointment has been cancelled."
+    count = action.get("count", 0)
+    if count == 0:
+        return "You don't have any appointments with us at the moment."
+    return f"You have {count} appointment{'s' if count != 1 else ''} on file with us."
+
+
+def render_template_summary(actions: List[Dict[str, Any]], conversation_turns: int) -> Optional[str]:
+    """Render a summary for a routine call, or None if the call needs the LLM"""
+    if not TEMPLATES_ENABLED or conversation_turns > TEMPLATE_MAX_TURNS:
+        return None
+    if any(a["action"] not in _SUPPORTED for a in actions):
+        return None
+    substantive = [a for a in actions if a["action"] in _SUBSTANTIVE]
+    if not substantive or len(substantive) > _MAX_SUBSTANTIVE:
+        return None
+    # A modify only has a date or time if the caller changed it
+    if any(a["action"] == "modified" and not (a.get("date") and a.get("time")) for a in substantive):
+        return None
+    sentences = ["Here's a quick summary of our call."]
+    sentences.extend(_render_action(a) for a in substantive)
+    sentences.append(_CLOSING)
+    return " ".join(sentences)
@@ -0,0 +1,381 @@
+"""
+In-process metrics registry with Prometheus text exposition
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from worker_load import pid_alive, status_dir, status_lock
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond cache hits up to slow model calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PUBLISH_INTERVAL = 5.0
+
+_SNAPSHOT_PREFIX = "metrics."
+_RETIRED_SNAPSHOT = "metrics.retired.json"
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Child for one label combination; hold on to it on hot paths"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _snapshot_value(self, child) -> Any:
+        return child.value
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": self.kind,
+            "help": self.help,
+            "labels": list(self.labelnames),
+            "samples": [[list(key), self._snapshot_value(child)] for key, child in self._children.items()],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Gauge; `aggregate` says how values from several processes combine (sum or max)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), registry=None, aggregate: str = "sum"):
+        self.aggregate = aggregate
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), aggregate=self.aggregate)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), registry=None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _snapshot_value(self, child) -> Any:
+        return {"counts": list(child.counts), "sum": child.sum}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return dict(super().snapshot(), buckets=list(self.buckets))
+
+
+class Registry:
+    """Holds this process's metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+REGISTRY = Registry()
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict[str, Any]]], include_gauges: bool = True) -> Dict[str, Dict[str, Any]]:
+    """Combine snapshots from several processes into one"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not include_gauges:
+                continue
+            target = merged.setdefault(name, dict(metric, samples=[]))
+            samples = {tuple(key): value for key, value in target["samples"]}
+            for key, value in metric["samples"]:
+                key = tuple(key)
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = value
+                elif metric["type"] == "histogram":
+                    samples[key] = {
+                        "counts": [a + b for a, b in zip(current["counts"], value["counts"])],
+                        "sum": current["sum"] + value["sum"],
+                    }
+                elif metric.get("aggregate") == "max":
+                    samples[key] = max(current, value)
+                else:
+                    samples[key] = current + value
+            target["samples"] = [[list(key), value] for key, value in samples.items()]
+    return merged
+
+
+def _escape(value: Any) -> str:
+    # Label values can come from the LLM (tool names), so quote them as the text format requires
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: List[str], values: List[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    """Render a snapshot in the Prometheus text format"""
+    lines = []
+    for name, metric in snapshot.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labels"]
+        for values, value in metric["samples"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(names, values)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value["counts"]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(names, values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, values)} {value['sum']}")
+            lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def render_samples(samples: List[Tuple[str, str, str, float]]) -> str:
+    """Render ad-hoc (name, type, help, value) samples in the Prometheus text format"""
+    lines = []
+    for name, kind, help_text, value in samples:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def timed(histogram: Histogram) -> Callable:
+    """Decorator observing an async function's duration, labelled by its name"""
+
+    def decorator(fn):
+        child = histogram.labels(fn.__name__)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# -- cross-process collection -------------------------------------------
+
+def publish_snapshot() -> None:
+    """Write this process's snapshot for the worker's /metrics to collect"""
+    directory = status_dir()
+    path = os.path.join(directory, f"{_SNAPSHOT_PREFIX}{os.getpid()}.json")
+    try:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(REGISTRY.snapshot(), f, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.debug("Could not publish metrics snapshot: %s", e)
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect_process_snapshots() -> List[Dict[str, Dict[str, Any]]]:
+    """Snapshots of live job processes plus the totals of exited ones.
+
+    Snapshots left by exited processes are folded into a retired snapshot
+    (counters and histograms only) so totals survive process turnover.
+    The fold runs under a lock, so concurrent scrapes can't fold the same
+    snapshot twice or overwrite a newer total with an older one.
+    """
+    with status_lock("metrics"):
+        return _collect_process_snapshots()
+
+
+def _collect_process_snapshots() -> List[Dict[str, Dict[str, Any]]]:
+    directory = status_dir()
+    retired_path = os.path.join(directory, _RETIRED_SNAPSHOT)
+    live, dead = [], []
+    for name in os.listdir(directory):
+        if not (name.startswith(_SNAPSHOT_PREFIX) and name.endswith(".json")) or name == _RETIRED_SNAPSHOT:
+            continue
+        try:
+            pid = int(name[len(_SNAPSHOT_PREFIX) : -len(".json")])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        (live if pid_alive(pid) else dead).append(os.path.join(directory, name))
+    retired = _read_snapshot(retired_path) or {}
+    if dead:
+        retired = merge_snapshots([retired] + [s for s in map(_read_snapshot, dead) if s], include_gauges=False)
+        try:
+            with open(retired_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(retired, f, separators=(",", ":"))
+            os.replace(retired_path + ".tmp", retired_path)
+            for path in dead:
+                os.remove(path)
+        except OSError as e:
+            logger.debug("Could not fold exited process metrics: %s", e)
+    snapshots = [s for s in map(_read_snapshot, live) if s]
+    if retired:
+        snapshots.append(retired)
+    return snapshots
+
+
+class MetricsPublisher:
+    """Publishes a job process's snapshot periodically and once more on close"""
+
+    def __init__(self, interval: float = PUBLISH_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        publish_snapshot()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            publish_snapshot()
+
+
+# -- application metrics ------------------------------------------------
+
+TOOL_DURATION = Histogram("superbryn_tool_duration_seconds", "Tool execution time", ["tool"])
+DB_DURATION = Histogram("superbryn_db_duration_seconds", "DatabaseManager call time", ["method"])
+SUMMARY_DURATION = Histogram("superbryn_summary_duration_seconds", "End-of-call summary time", ["source"])
+LLM_TTFT = Histogram("superbryn_llm_ttft_seconds", "LLM time to first token")
+TTS_TTFB = Histogram("superbryn_tts_ttfb_seconds", "TTS time to first audio byte")
+ACTIVE_SESSIONS = Gauge("superbryn_active_sessions", "Active agent sessions")
+LOOP_LAG = Gauge("superbryn_event_loop_lag_ms", "Smoothed job event-loop lag", aggregate="max")
+QUEUED_EVENTS = Gauge("superbryn_data_channel_queued_events", "Data-channel events waiting to be sent")
+CHANGE_FEED_EVENTS = Counter("superbryn_change_feed_events_total", "Appointment changes applied from the change feed", ["type"])
+CHANGE_FEED_LAG = Histogram("superbryn_change_feed_lag_seconds", "Time from an appointment change's commit to applying it")
+SPEECH_CONNECTIONS = Counter("superbryn_speech_connections_total", "Speech provider connections opened or reused", ["kind", "outcome"])
+SPEECH_STREAMS = Counter("superbryn_speech_streams_total", "STT and TTS streams started", ["kind"])
+
+
+def attach_session(session) -> None:
+    """Record model latencies from an AgentSession's metrics events"""
+    ttft = LLM_TTFT.labels()
+    ttfb = TTS_TTFB.labels()
+
+    def _on_metrics_collected(evt) -> None:
+        metrics = getattr(evt, "metrics", evt)
+        kind = type(metrics).__name__
+        if kind == "LLMMetrics":
+            value = getattr(metrics, "ttft", None)
+            if value is not None and value >= 0:
+                ttft.observe(value)
+        elif kind == "TTSMetrics":
+            value = getattr(metrics, "ttfb", None)
+            if value is not None and value >= 0:
+                ttfb.observe(value)
+
+    session.on("metrics_collected", _on_metrics_collected)
@@ -0,0 +1,260 @@
+"""
+LiveKit access token issuance for the web client
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", str(6 * 3600)))
+# Pre-minted grants for clients that let the server pick the room; 0 disables
+TOKEN_POOL_SIZE = int(os.getenv("TOKEN_POOL_SIZE", "64"))
+# Pooled grants older than this are discarded so handed-out tokens stay fresh
+TOKEN_POOL_MAX_AGE = float(os.getenv("TOKEN_POOL_MAX_AGE", "60"))
+TOKEN_ROOM_PREFIX = os.getenv("TOKEN_ROOM_PREFIX", "superbryn-")
+# Token requests are a couple of short strings; anything bigger is rejected unread
+MAX_REQUEST_BYTES = 1024
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.:@-]{1,64}$")
+_DEFAULT_PARTICIPANT = "user"
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+class TokenRequestError(ValueError):
+    """Raised for a malformed token request"""
+
+
+class TokenSigner:
+    """Signs LiveKit room-join JWTs (HS256) with pre-computed key material.
+
+    The HMAC key schedule and the encoded header are built once; each token
+    only copies the keyed HMAC state and signs the claims. Claims match what
+    `livekit.api.AccessToken(...).with_grants(VideoGrants(...)).to_jwt()`
+    produces for a room join with publish and subscribe rights.
+    """
+
+    def __init__(self, api_key: str, api_secret: str, ttl: int = TOKEN_TTL_SECONDS):
+        self.api_key = api_key
+        self.ttl = ttl
+        self._mac = hmac.new(api_secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._header = _b64url(b'{"alg":"HS256","typ":"JWT"}')
+
+    def mint(self, room: str, identity: str, name: Optional[str] = None) -> str:
+        now = int(time.time())
+        claims = {
+            "sub": identity,
+            "iss": self.api_key,
+            "nbf": now,
+            "exp": now + self.ttl,
+            "name": name or identity,
+            "video": {"roomJoin": True, "room": room, "canPublish": True, "canSubscribe": True},
+        }
+        signing_input = self._header + b"." + _b64url(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return (signing_input + b"." + _b64url(mac.digest())).decode("ascii")
+
+
+class TokenPool:
+    """Short-lived pool of pre-minted grants for server-chosen rooms.
+
+    A background task keeps `size` grants ready, each for a fresh random
+    room and participant, and drops grants older than `max_age` seconds.
+    `take()` never blocks: an empty pool just means the caller mints.
+    """
+
+    def __init__(self, signer: TokenSigner, size: int = TOKEN_POOL_SIZE, max_age: float = TOKEN_POOL_MAX_AGE):
+        self._signer = signer
+        self.size = max(0, size)
+        self.max_age = max_age
+        self._grants: Deque[Tuple[float, Dict[str, str]]] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self) -> None:
+        if self.size and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def take(self) -> Optional[Dict[str, str]]:
+        cutoff = time.monotonic() - self.max_age
+        while self._grants:
+            minted_at, grant = self._grants.popleft()
+            if minted_at >= cutoff:
+                self.hits += 1
+                if len(self._grants) < self.size // 2:
+                    self._wakeup.set()
+                return grant
+        self.misses += 1
+        self._wakeup.set()
+        return None
+
+    def mint_grant(self) -> Dict[str, str]:
+        room = f"{TOKEN_ROOM_PREFIX}{secrets.token_hex(6)}"
+        identity = f"{_DEFAULT_PARTICIPANT}-{secrets.token_hex(4)}"
+        return {"token": self._signer.mint(room, identity), "roomName": room, "participantName": identity}
+
+    async def _run(self) -> None:
+        while True:
+            self._expire()
+            while len(self._grants) < self.size:
+                self._grants.append((time.monotonic(), self.mint_grant()))
+                if len(self._grants) % 16 == 0:
+                    # Yield so a large refill doesn't stall request handling
+                    await asyncio.sleep(0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_age / 2)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.max_age
+        while self._grants and self._grants[0][0] < cutoff:
+            self._grants.popleft()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": len(self._grants), "hits": self.hits, "misses": self.misses}
+
+
+def parse_token_request(body: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Validate a token request body and return (room name, participant name)"""
+    if len(body) > MAX_REQUEST_BYTES:
+        raise TokenRequestError("Request body too large")
+    if not body.strip():
+        return None, None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise TokenRequestError("Request body must be JSON")
+    if not isinstance(data, dict):
+        raise TokenRequestError("Request body must be a JSON object")
+    names = []
+    for field in ("roomName", "participantName"):
+        value = data.get(field)
+        if value is not None and (not isinstance(value, str) or not _NAME_RE.match(value)):
+            raise TokenRequestError(f"{field} must be 1-64 letters, digits or _.:@-")
+        names.append(value)
+    return names[0], names[1]
+
+
+class TokenService:
+    """Issues LiveKit tokens, serving server-chosen rooms from the pool"""
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_secret: Optional[str] = None,
+        pool_size: int = TOKEN_POOL_SIZE,
+    ):
+        self.url = url if url is not None else os.getenv("LIVEKIT_URL")
+        api_key = api_key if api_key is not None else os.getenv("LIVEKIT_API_KEY")
+        api_secret = api_secret if api_secret is not None else os.getenv("LIVEKIT_API_SECRET")
+        self.signer: Optional[TokenSigner] = None
+        self.pool: Optional[TokenPool] = None
+        if api_key and api_secret:
+            self.signer = TokenSigner(api_key, api_secret)
+            self.pool = TokenPool(self.signer, size=pool_size)
+        self.issued = 0
+
+    @property
+    def configured(self) -> bool:
+        return self.signer is not None
+
+    def start(self) -> None:
+        if self.pool is not None:
+            self.pool.start()
+
+    async def aclose(self) -> None:
+        if self.pool is not None:
+            await self.pool.aclose()
+
+    def issue(self, room_name: Optional[str], participant_name: Optional[str]) -> Dict[str, Any]:
+        grant = None
+        if room_name is None and participant_name is None:
+            grant = self.pool.take()
+            if grant is None:
+                grant = self.pool.mint_grant()
+        else:
+            room_name = room_name or f"{TOKEN_ROOM_PREFIX}{secrets.token_hex(6)}"
+            participant_name = participant_name or _DEFAULT_PARTICIPANT
+            grant = {"token": self.signer.mint(room_name, participant_name), "roomName": room_name}
+        self.issued += 1
+        return {"token": grant["token"], "url": self.url, "roomName": grant["roomName"]}
+
+    async def handle_token(self, request: web.Request) -> web.Response:
+        """POST /api/livekit-token"""
+        if not self.configured:
+            return web.json_response({"error": "LiveKit credentials not configured"}, status=500)
+        if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+            return web.json_response({"error": "Request body too large"}, status=413)
+        try:
+            room_name, participant_name = parse_token_request(await request.read())
+        except TokenRequestError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        try:
+            return web.json_response(self.issue(room_name, participant_name))
+        except Exception as e:
+            logger.error(f"Error issuing token: {e}")
+            return web.json_response({"error": "Token generation failed"}, status=500)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"issued": self.issued}
+        if self.pool is not None:
+            stats["pool"] = self.pool.stats()
+        return stats
+
+
+@web.middleware
+async def cors_middleware(request: web.Request, handler):
+    """Allow the browser client on any origin, answering preflights directly"""
+    if request.method == "OPTIONS":
+        response = web.Response(status=204)
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = request.headers.get(
+            "Access-Control-Request-Headers", "Content-Type"
+        )
+    else:
+        response = await handler(request)
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+def add_token_routes(app: web.Application, service: TokenService) -> None:
+    """Register the token endpoint and tie the pool to the app lifecycle"""
+    app.router.add_post("/api/livekit-token", service.handle_token)
+
+    async def _start(_app):
+        service.start()
+
+    async def _stop(_app):
+        await service.aclose()
+
+    app.on_startup.append(_start)
+    app.on_cleanup.append(_stop)
@@ -0,0 +1,43 @@
+"""
+Local token counting for prompt budgeting
+"""
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the tiktoken encoding once; fall back to a heuristic if unavailable"""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, using approximate token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in `text` for the gpt-4o model family"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        # ~4 characters per token for English text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim `text` so that it fits in `max_tokens`"""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    # One token is left for the ellipsis
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[: (max_tokens - 1) * 4].rstrip() + "…"
+    return encoding.decode(encoding.encode(text, disallowed_special=())[: max_tokens - 1]).rstrip() + "…"
@@ -3,12 +3,36 @@ Tool definitions and execution logic for the voice agent.
 Uses livekit.agents.llm.function_tool and find_function_tools for tool registration.
 """
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import os
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime, timedelta
 from livekit.agents.llm import function_tool, find_function_tools
 
+from availability import DEFAULT_RESOURCE_ID
+from business_hours import BUSINESS_CALENDAR, to_minutes
+from event_log import event
+from telemetry import TOOL_DURATION
+
 logger = logging.getLogger(__name__)
 
+# How long a slot offered to or chosen by a caller stays reserved; 0 disables holds
+SLOT_HOLD_TTL = int(os.getenv("SLOT_HOLD_TTL_SECONDS", "120"))
+
+# Keep fetch_slots and list_resources results small enough for the LLM context
+MAX_SLOT_RANGE_DAYS = 14
+MAX_SLOTS_RETURNED = 40
+MAX_RESOURCES_PER_SLOT = 5
+MAX_RESOURCES_LISTED = 50
+
+# Tool descriptions and the system prompt quote the configured hours, so they can't drift from the slots offered
+BUSINESS_HOURS = BUSINESS_CALENDAR.describe()
+
+
+def _with(resource_id: str, name: str) -> str:
+    # Single-calendar deployments don't mention the default resource
+    return "" if resource_id == DEFAULT_RESOURCE_ID else f" with {name}"
+
 
 class AppointmentTools:
     """Holds appointment tools for the LLM; use find_function_tools(instance) to get the tool list."""
@@ -27,25 +51,49 @@ class AppointmentTools:
             self._user_phone_ref[0] = result.get("phone_number")
         return str(result)
 
-    @function_tool(description="Fetch available appointment slots (9 AM to 5 PM, hourly).")
-    async def fetch_slots(self, date: Optional[str] = None) -> str:
+    @function_tool(description="List the providers and rooms that take appointments.")
+    async def list_resources(self, kind: Optional[str] = None) -> str:
         result = await self._tm.execute_tool(
-            "fetch_slots", {"date": date} if date else {}, self._db, None
+            "list_resources", {"kind": kind} if kind else {}, self._db, None
         )
         return str(result)
 
+    @function_tool(
+        description=f"Fetch open appointment slots for a date or date range, optionally for one provider or room, excluding booked and held ones. Business hours: {BUSINESS_HOURS}."
+    )
+    async def fetch_slots(
+        self, date: Optional[str] = None, end_date: Optional[str] = None, resource: Optional[str] = None
+    ) -> str:
+        args = {}
+        if date:
+            args["date"] = date
+        if end_date:
+            args["end_date"] = end_date
+        if resource:
+            args["resource"] = resource
+        result = await self._tm.execute_tool("fetch_slots", args, self._db, None)
+        return str(result)
+
+    @function_tool(
+        description="Hold a slot for this caller for a few minutes when you offer a specific time or the caller picks one."
+    )
+    async def hold_slot(self, date: str, time: str, resource: Optional[str] = None) -> str:
+        args = {"date": date, "time": time}
+        if resource:
+            args["resource"] = resource
+        result = await self._tm.execute_tool("hold_slot", args, self._db, None)
+        return str(result)
+
     @function_tool(
         description="Book an appointment. Requires user identified first. Prevents double-booking."
     )
     async def book_appointment(
-        self, date: str, time: str, user_name: str, phone_number: str
+        self, date: str, time: str, user_name: str, phone_number: str, resource: Optional[str] = None
     ) -> str:
-        result = await self._tm.execute_tool(
-            "book_appointment",
-            {"date": date, "time": time, "user_name": user_name, "phone_number": phone_number},
-            self._db,
-            self._user_phone_ref[0],
-        )
+        args = {"date": date, "time": time, "user_name": user_name, "phone_number": phone_number}
+        if resource:
+            args["resource"] = resource
+        result = await self._tm.execute_tool("book_appointment", args, self._db, self._user_phone_ref[0])
         return str(result)
 
     @function_tool(description="Retrieve all appointments for the identified user.")
@@ -65,19 +113,22 @@ class AppointmentTools:
         )
         return str(result)
 
-    @function_tool(description="Modify an existing appointment's date or time.")
+    @function_tool(description="Modify an existing appointment's date, time, or provider/room.")
     async def modify_appointment(
         self,
         appointment_id: str,
         phone_number: str,
         new_date: Optional[str] = None,
         new_time: Optional[str] = None,
+        new_resource: Optional[str] = None,
     ) -> str:
         args = {"appointment_id": appointment_id, "phone_number": phone_number}
         if new_date is not None:
             args["new_date"] = new_date
         if new_time is not None:
             args["new_time"] = new_time
+        if new_resource is not None:
+            args["new_resource"] = new_resource
         result = await self._tm.execute_tool("modify_appointment", args, self._db, None)
         return str(result)
 
@@ -109,11 +160,25 @@ def get_tool_schemas() -> List[Dict[str, Any]]:
                 },
             },
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "list_resources",
+                "description": "List the providers and rooms that take appointments, with their hours and slot length.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "kind": {"type": "string", "enum": ["provider", "room"], "description": "Only list this kind (optional)"},
+                    },
+                    "required": [],
+                },
+            },
+        },
         {
             "type": "function",
             "function": {
                 "name": "fetch_slots",
-                "description": "Fetch available appointment slots. Returns hard-coded available slots (every day from 9 AM to 5 PM in hourly intervals).",
+                "description": f"Fetch available appointment slots. Returns the open times that are not fully booked or held for other callers, each with the providers or rooms that can take it. Business hours: {BUSINESS_HOURS}.",
                 "parameters": {
                     "type": "object",
                     "properties": {
@@ -121,11 +186,32 @@ def get_tool_schemas() -> List[Dict[str, Any]]:
                             "type": "string",
                             "description": "The date to check slots for (YYYY-MM-DD format). If not provided, defaults to today.",
                         },
+                        "end_date": {
+                            "type": "string",
+                            "description": f"Last date of a range to check, up to {MAX_SLOT_RANGE_DAYS} days after date (YYYY-MM-DD format, optional)",
+                        },
+                        "resource": {"type": "string", "description": "Only this provider or room, by name or id (optional)"},
                     },
                     "required": [],
                 },
             },
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "hold_slot",
+                "description": "Hold a slot for this caller for a few minutes so it isn't offered to other callers. Use this as soon as you offer a specific time or the user picks one, before collecting the remaining booking details.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "date": {"type": "string", "description": "Slot date in YYYY-MM-DD format"},
+                        "time": {"type": "string", "description": "Slot time in HH:MM format (24-hour)"},
+                        "resource": {"type": "string", "description": "Provider or room name or id (optional; any with room if omitted)"},
+                    },
+                    "required": ["date", "time"],
+                },
+            },
+        },
         {
             "type": "function",
             "function": {
@@ -138,6 +224,7 @@ def get_tool_schemas() -> List[Dict[str, Any]]:
                         "time": {"type": "string", "description": "Appointment time in HH:MM format (24-hour)"},
                         "user_name": {"type": "string", "description": "Name of the user booking the appointment"},
                         "phone_number": {"type": "string", "description": "Phone number of the user (should match identified user)"},
+                        "resource": {"type": "string", "description": "Provider or room name or id (optional; any with room if omitted)"},
                     },
                     "required": ["date", "time", "user_name", "phone_number"],
                 },
@@ -176,13 +263,14 @@ def get_tool_schemas() -> List[Dict[str, Any]]:
             "type": "function",
             "function": {
                 "name": "modify_appointment",
-                "description": "Modify an existing appointment's date or time. Requires user to be identified first.",
+                "description": "Modify an existing appointment's date, time, or provider/room. Requires user to be identified first.",
                 "parameters": {
                     "type": "object",
                     "properties": {
                         "appointment_id": {"type": "string", "description": "The ID of the appointment to modify"},
                         "new_date": {"type": "string", "description": "New appointment date in YYYY-MM-DD format (optional)"},
                         "new_time": {"type": "string", "description": "New appointment time in HH:MM format (24-hour) (optional)"},
+                        "new_resource": {"type": "string", "description": "New provider or room name or id (optional)"},
                         "phone_number": {"type": "string", "description": "Phone number of the user (for verification)"},
                     },
                     "required": ["appointment_id", "phone_number"],
@@ -203,6 +291,17 @@ def get_tool_schemas() -> List[Dict[str, Any]]:
 class ToolManager:
     """Manages tool execution logic."""
 
+    def __init__(self, tracer=None, recorder=None, holder: Optional[str] = None, hold_ttl: int = SLOT_HOLD_TTL):
+        # Optional TurnTracer that receives one span per tool execution
+        self.tracer = tracer
+        # Optional SessionRecorder that keeps each call's arguments for replay
+        self.recorder = recorder
+        # Slot holds are taken in the name of `holder` (the session id)
+        self.holder = holder
+        self.hold_ttl = hold_ttl
+        # (date, HH:MM) -> resource id held for it, so a booking lands where the hold is
+        self._held: Dict[Tuple[str, str], str] = {}
+
     async def execute_tool(
         self,
         tool_name: str,
@@ -211,13 +310,33 @@ class ToolManager:
         current_user_phone: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Execute a tool and return the result."""
-        logger.info(f"Executing tool: {tool_name} with args: {args}")
+        logger.info("Executing tool: %s", tool_name, extra=event("tool", tool=tool_name, args=args))
+        start = time.perf_counter()
+        result = await self._dispatch(tool_name, args, db, current_user_phone)
+        duration = time.perf_counter() - start
+        TOOL_DURATION.labels(tool_name).observe(duration)
+        if self.tracer is not None:
+            self.tracer.record_tool(tool_name, duration, bool(result.get("success")))
+        if self.recorder is not None:
+            self.recorder.record_tool(tool_name, args, duration, result)
+        return result
 
+    async def _dispatch(
+        self,
+        tool_name: str,
+        args: Dict[str, Any],
+        db,
+        current_user_phone: Optional[str],
+    ) -> Dict[str, Any]:
         try:
             if tool_name == "identify_user":
                 return await self._identify_user(args, db)
+            elif tool_name == "list_resources":
+                return await self._list_resources(args, db)
             elif tool_name == "fetch_slots":
-                return await self._fetch_slots(args)
+                return await self._fetch_slots(args, db)
+            elif tool_name == "hold_slot":
+                return await self._hold_slot(args, db)
             elif tool_name == "book_appointment":
                 return await self._book_appointment(args, db, current_user_phone)
             elif tool_name == "retrieve_appointments":
@@ -243,7 +362,34 @@ class ToolManager:
         await db.get_or_create_user(phone_number)
         return {"success": True, "phone_number": phone_number, "message": f"User identified: {phone_number}"}
 
-    async def _fetch_slots(self, args: Dict[str, Any]) -> Dict[str, Any]:
+    @property
+    def _holds_enabled(self) -> bool:
+        return bool(self.holder) and self.hold_ttl > 0
+
+    async def _resource_arg(self, value: Optional[str], db) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+        """(resource, None) for a provider or room argument, (None, error) if unknown; (None, None) when omitted"""
+        if not value:
+            return None, None
+        resource = await db.find_resource(value)
+        if resource is None:
+            names = [r.name for r in await db.list_resources()][:MAX_RESOURCES_PER_SLOT * 2]
+            return None, {"success": False, "error": f"Unknown provider or room: {value}", "resources": names}
+        return resource, None
+
+    async def _open_slots(self, dates: List[str], db, resource_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Open slots on `dates` that aren't full with bookings or other callers' holds"""
+        return await db.get_open_slots(dates, resource_id=resource_id, holder=self.holder, include_holds=self.hold_ttl > 0)
+
+    async def _open_times(self, date_str: str, db, resource_id: Optional[str] = None) -> List[str]:
+        return [s["time"] for s in await self._open_slots([date_str], db, resource_id)]
+
+    async def _list_resources(self, args: Dict[str, Any], db) -> Dict[str, Any]:
+        """List providers and rooms."""
+        resources = await db.list_resources(args.get("kind"))
+        listed = [r.as_dict() for r in resources[:MAX_RESOURCES_LISTED]]
+        return {"success": True, "resources": listed, "count": len(resources), "message": f"Found {len(resources)} provider(s) or room(s)"}
+
+    async def _fetch_slots(self, args: Dict[str, Any], db) -> Dict[str, Any]:
         """Fetch available appointment slots."""
         date_str = args.get("date")
         if date_str:
@@ -252,9 +398,116 @@ class ToolManager:
             except ValueError:
                 return {"success": False, "error": "Invalid date format. Use YYYY-MM-DD"}
         else:
-            target_date = datetime.now().date()
-        slots = [{"date": target_date.isoformat(), "time": f"{h:02d}:00", "available": True} for h in range(9, 17)]
-        return {"success": True, "date": target_date.isoformat(), "slots": slots, "message": f"Found {len(slots)} available slots on {target_date.isoformat()}"}
+            target_date = BUSINESS_CALENDAR.today()
+        end_date = target_date
+        if args.get("end_date"):
+            try:
+                end_date = datetime.strptime(args["end_date"], "%Y-%m-%d").date()
+            except ValueError:
+                return {"success": False, "error": "Invalid end_date format. Use YYYY-MM-DD"}
+            end_date = min(max(end_date, target_date), target_date + timedelta(days=MAX_SLOT_RANGE_DAYS))
+        resource, error = await self._resource_arg(args.get("resource"), db)
+        if error:
+            return error
+        dates = [(target_date + timedelta(days=i)).isoformat() for i in range((end_date - target_date).days + 1)]
+        open_slots = await self._open_slots(dates, db, resource.id if resource else None)
+        names = {r.id: r.name for r in await db.list_resources()}
+        slots = [
+            {
+                "date": slot["date"],
+                "time": slot["time"],
+                "available": len(slot["resources"]),
+                "resources": [names.get(rid, rid) for rid in slot["resources"][:MAX_RESOURCES_PER_SLOT]],
+            }
+            for slot in open_slots[:MAX_SLOTS_RETURNED]
+        ]
+        date_str = target_date.isoformat()
+        span = date_str if end_date == target_date else f"{date_str} to {end_date.isoformat()}"
+        result = {"success": True, "date": date_str, "slots": slots, "message": f"Found {len(open_slots)} available slots on {span}"}
+        if end_date != target_date:
+            result["end_date"] = end_date.isoformat()
+        if len(open_slots) > len(slots):
+            result["message"] += f"; showing the first {len(slots)}"
+        closed = [{"date": d, "reason": BUSINESS_CALENDAR.closure(d)} for d in dates if not BUSINESS_CALENDAR.hours(d)]
+        if closed:
+            result["closed"] = closed
+        return result
+
+    async def _slot_taken(
+        self, date_str: str, time_str: str, db, reason: str, resource_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        # Offering the remaining times saves the LLM a fetch_slots round trip
+        alternatives = await self._open_times(date_str, db, resource_id)
+        return {"success": False, "error": f"Slot {date_str} {time_str} {reason}", "alternatives": alternatives}
+
+    async def _pick_resources(self, date_str: str, time_str: str, db, resource) -> List[str]:
+        """Resources to try for a slot: the named one, else the one held for it, else those with room"""
+        if resource is not None:
+            return [resource.id]
+        held = self._held.get((date_str, time_str))
+        if held:
+            return [held]
+        # Bookings only: the hold taken next is what settles a race with other callers
+        for slot in await db.get_open_slots([date_str], holder=self.holder, include_holds=False):
+            if slot["time"] == time_str:
+                return slot["resources"]
+        return []
+
+    async def _take_hold(self, resource_id: str, date_str: str, time_str: str, db) -> bool:
+        if self._holds_enabled and not await db.hold_slot(resource_id, date_str, time_str, self.holder, self.hold_ttl):
+            return False
+        self._held[(date_str, time_str)] = resource_id
+        return True
+
+    @staticmethod
+    async def _resource_name(resource_id: str, db) -> str:
+        resource = await db.find_resource(resource_id)
+        return resource.name if resource else resource_id
+
+    @staticmethod
+    def _outside_hours(date_str: str, time_str: str) -> Optional[str]:
+        """Failure reason if the business is closed at that time, else None"""
+        if BUSINESS_CALENDAR.is_open_at(date_str, to_minutes(time_str)):
+            return None
+        return f"is outside business hours ({BUSINESS_CALENDAR.closure(date_str) or BUSINESS_HOURS})"
+
+    @classmethod
+    def _not_a_slot(cls, date_str: str, time_str: str, resource) -> Optional[str]:
+        """Failure reason if the time is closed or off `resource`'s slot grid, else None"""
+        closed = cls._outside_hours(date_str, time_str)
+        if closed or resource is None or resource.is_slot(date_str, to_minutes(time_str)):
+            return closed
+        return f"is not one of {resource.name}'s appointment times"
+
+    @staticmethod
+    def _slot_time(date_str: Optional[str], time_str: Optional[str]) -> Optional[str]:
+        """Normalized HH:MM, or None if the date or time doesn't parse"""
+        try:
+            return datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M").strftime("%H:%M")
+        except ValueError:
+            return None
+
+    async def _hold_slot(self, args: Dict[str, Any], db) -> Dict[str, Any]:
+        """Reserve a slot for this caller while the booking is confirmed."""
+        date_str = args.get("date")
+        time_str = self._slot_time(date_str, args.get("time"))
+        if time_str is None:
+            return {"success": False, "error": "Invalid date or time format"}
+        resource, error = await self._resource_arg(args.get("resource"), db)
+        if error:
+            return error
+        invalid = self._not_a_slot(date_str, time_str, resource)
+        if invalid:
+            return await self._slot_taken(date_str, time_str, db, invalid, resource.id if resource else None)
+        candidates = await self._pick_resources(date_str, time_str, db, resource)
+        for resource_id in candidates[:3]:
+            if await db.slot_capacity(resource_id, date_str, time_str) <= 0:
+                continue
+            if await self._take_hold(resource_id, date_str, time_str, db):
+                name = await self._resource_name(resource_id, db)
+                return {"success": True, "date": date_str, "time": time_str, "resource": name, "message": f"Slot {date_str} {time_str}{_with(resource_id, name)} is held for this caller"}
+        reason = "was just taken by another caller" if candidates else "is not available"
+        return await self._slot_taken(date_str, time_str, db, reason, resource.id if resource else None)
 
     async def _book_appointment(
         self, args: Dict[str, Any], db, current_user_phone: Optional[str],
@@ -270,15 +523,36 @@ class ToolManager:
             phone_number = current_user_phone
         if not phone_number:
             return {"success": False, "error": "User must be identified first. Please provide your phone number."}
-        try:
-            datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-        except ValueError:
+        slot_time = self._slot_time(date_str, time_str)
+        if slot_time is None:
             return {"success": False, "error": "Invalid date or time format"}
-        existing = await db.get_appointment_by_datetime(date_str, time_str)
-        if existing:
-            return {"success": False, "error": f"Slot {date_str} {time_str} is already booked"}
-        appointment = await db.create_appointment(phone_number=phone_number, user_name=user_name, date=date_str, time=time_str)
-        return {"success": True, "appointment": appointment, "message": f"Appointment booked successfully for {user_name} on {date_str} at {time_str}"}
+        resource, error = await self._resource_arg(args.get("resource"), db)
+        if error:
+            return error
+        resource_only = resource.id if resource else None
+        invalid = self._not_a_slot(date_str, slot_time, resource)
+        if invalid:
+            return await self._slot_taken(date_str, slot_time, db, invalid, resource_only)
+        # Taking the hold first serializes callers racing for the same slot
+        candidates = await self._pick_resources(date_str, slot_time, db, resource)
+        reason = "is already booked" if candidates else "is not available"
+        for resource_id in candidates[:3]:
+            if await db.slot_capacity(resource_id, date_str, slot_time) <= 0:
+                continue
+            if await self._take_hold(resource_id, date_str, slot_time, db):
+                break
+            reason = "is being held for another caller"
+        else:
+            return await self._slot_taken(date_str, slot_time, db, reason, resource_only)
+        appointment = await db.create_appointment(
+            phone_number=phone_number, user_name=user_name, date=date_str, time=slot_time,
+            resource_id=resource_id, holder=self.holder if self._holds_enabled else None,
+        )
+        if appointment is None:
+            return await self._slot_taken(date_str, slot_time, db, "was just booked by another caller", resource_only)
+        self._held.pop((date_str, slot_time), None)
+        name = await self._resource_name(resource_id, db)
+        return {"success": True, "appointment": appointment, "resource": name, "message": f"Appointment booked successfully for {user_name} on {date_str} at {slot_time}{_with(resource_id, name)}"}
 
     async def _retrieve_appointments(self, args: Dict[str, Any], db) -> Dict[str, Any]:
         """Retrieve user's appointments."""
@@ -310,16 +584,36 @@ class ToolManager:
         phone_number = args.get("phone_number", "").strip().replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
         if not appointment_id:
             return {"success": False, "error": "Appointment ID is required"}
-        if not new_date and not new_time:
-            return {"success": False, "error": "At least one of new_date or new_time must be provided"}
+        if not new_date and not new_time and not args.get("new_resource"):
+            return {"success": False, "error": "At least one of new_date, new_time or new_resource must be provided"}
+        resource, error = await self._resource_arg(args.get("new_resource"), db)
+        if error:
+            return error
         appointment = await db.get_appointment(appointment_id)
         if not appointment:
             return {"success": False, "error": "Appointment not found"}
         if appointment.get("phone_number") != phone_number:
             return {"success": False, "error": "You don't have permission to modify this appointment"}
-        if new_date and new_time:
-            existing = await db.get_appointment_by_datetime(new_date, new_time)
-            if existing and existing.get("id") != appointment_id:
-                return {"success": False, "error": f"Slot {new_date} {new_time} is already booked"}
-        result = await db.modify_appointment(appointment_id=appointment_id, new_date=new_date, new_time=new_time)
+        date_str = new_date or str(appointment.get("date"))
+        slot_time = self._slot_time(date_str, new_time or str(appointment.get("time"))[:5])
+        if slot_time is None:
+            return {"success": False, "error": "Invalid date or time format"}
+        resource_id = resource.id if resource else str(appointment.get("resource_id") or DEFAULT_RESOURCE_ID)
+        invalid = self._not_a_slot(date_str, slot_time, resource or await db.find_resource(resource_id))
+        if invalid:
+            return await self._slot_taken(date_str, slot_time, db, invalid, resource_id)
+        if await db.slot_capacity(resource_id, date_str, slot_time, exclude_id=appointment_id) <= 0:
+            return await self._slot_taken(date_str, slot_time, db, "is already booked", resource_id)
+        if not await self._take_hold(resource_id, date_str, slot_time, db):
+            return await self._slot_taken(date_str, slot_time, db, "is being held for another caller", resource_id)
+        result = await db.modify_appointment(
+            appointment_id=appointment_id, new_date=new_date, new_time=new_time and slot_time,
+            new_resource_id=resource.id if resource else None,
+        )
+        if result is None:
+            return await self._slot_taken(date_str, slot_time, db, "was just booked by another caller", resource_id)
+        self._held.pop((date_str, slot_time), None)
+        # The moved booking now counts against capacity, so the hold would count it twice
+        if self._holds_enabled:
+            await db.release_slot_hold(resource_id, date_str, slot_time, self.holder)
         return {"success": True, "appointment": result, "message": f"Appointment {appointment_id} modified successfully"}
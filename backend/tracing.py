@@ -0,0 +1,233 @@
+"""
+Per-turn voice latency tracing
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Where per-turn traces are written; unset or empty disables them
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+# Closed turns kept in memory for the per-call report; older ones only live in the trace file
+TRACE_MAX_TURNS = int(os.getenv("TRACE_MAX_TURNS", "500"))
+
+# Span fields reported in the per-call percentile summary (milliseconds)
+REPORT_FIELDS = (
+    "eou_delay_ms",
+    "transcription_delay_ms",
+    "stt_final_ms",
+    "llm_ttft_ms",
+    "tts_ttfb_ms",
+    "playout_start_ms",
+    "tools_ms",
+)
+REPORT_PERCENTILES = (50, 90, 99)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Any]:
+    """Count and p50/p90/p99 of a list of latencies"""
+    summary: Dict[str, Any] = {"count": len(values)}
+    for pct in REPORT_PERCENTILES:
+        value = percentile(values, pct)
+        summary[f"p{pct}"] = round(value, 1) if value is not None else None
+    return summary
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    if seconds is None or seconds < 0:
+        return None
+    return round(seconds * 1000.0, 1)
+
+
+class _TraceWriter:
+    """Appends trace records on a background thread, so the event loop never opens a file"""
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Tuple[str, Dict[str, Any]]]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._failed: set = set()
+
+    def write(self, path: str, record: Dict[str, Any]) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+        self._queue.put((path, record))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, record = item
+            if path in self._failed:
+                continue
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+            except Exception as e:
+                logger.error(f"Error writing trace record to {path}: {e}")
+                self._failed.add(path)
+
+    def flush(self) -> None:
+        """Write out everything queued and stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+
+
+_WRITER = _TraceWriter()
+
+
+class TurnTracer:
+    """Records latency spans for each user turn of a session.
+
+    A turn opens when the user stops speaking (or on the first final
+    transcript if no end-of-speech event was seen) and closes when the
+    agent goes back to listening. Offsets are measured on the monotonic
+    clock from the turn start; model-reported delays come from the
+    session's metrics events. Each closed turn is appended to the trace
+    file as one JSON line by a writer thread, and `close()` appends a
+    percentile report over the last `max_turns` turns.
+    """
+
+    def __init__(self, session_id: str, trace_dir: Optional[str] = TRACE_DIR, max_turns: int = TRACE_MAX_TURNS):
+        self.session_id = session_id
+        self.turns: deque = deque(maxlen=max(1, max_turns))
+        self.turn_count = 0
+        # Optional callback receiving each closed turn record
+        self.on_turn: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._turn: Optional[Dict[str, Any]] = None
+        self._t0 = 0.0
+        self._path = None
+        if trace_dir:
+            safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id) or "session"
+            self._path = os.path.join(trace_dir, f"{safe_id}.trace.jsonl")
+
+    def attach(self, session) -> None:
+        """Subscribe to the AgentSession events the tracer needs"""
+        session.on("user_state_changed", self._on_user_state_changed)
+        session.on("user_input_transcribed", self._on_user_input_transcribed)
+        session.on("agent_state_changed", self._on_agent_state_changed)
+        session.on("metrics_collected", self._on_metrics_collected)
+
+    # -- turn lifecycle -------------------------------------------------
+
+    def _open_turn(self) -> Dict[str, Any]:
+        if self._turn is not None:
+            self._close_turn()
+        self._t0 = time.monotonic()
+        self._turn = {"session": self.session_id, "turn": self.turn_count + 1, "ts": round(time.time(), 3), "tools": []}
+        return self._turn
+
+    def _offset_ms(self) -> float:
+        return round((time.monotonic() - self._t0) * 1000.0, 1)
+
+    def _close_turn(self) -> None:
+        turn, self._turn = self._turn, None
+        if turn is None:
+            return
+        if turn["tools"]:
+            turn["tools_ms"] = round(sum(t["ms"] for t in turn["tools"]), 1)
+        self.turns.append(turn)
+        self.turn_count += 1
+        self._write(turn)
+        if self.on_turn is not None:
+            self.on_turn(turn)
+
+    # -- event handlers -------------------------------------------------
+
+    def _on_user_state_changed(self, evt) -> None:
+        if getattr(evt, "old_state", None) == "speaking" and getattr(evt, "new_state", None) == "listening":
+            self._open_turn()
+
+    def _on_user_input_transcribed(self, evt) -> None:
+        if not getattr(evt, "is_final", True):
+            return
+        turn = self._turn if self._turn is not None else self._open_turn()
+        turn.setdefault("stt_final_ms", self._offset_ms())
+
+    def _on_agent_state_changed(self, evt) -> None:
+        new_state = getattr(evt, "new_state", None)
+        if self._turn is None:
+            return
+        if new_state == "thinking":
+            self._turn.setdefault("llm_start_ms", self._offset_ms())
+        elif new_state == "speaking":
+            self._turn.setdefault("playout_start_ms", self._offset_ms())
+        elif new_state == "listening" and "playout_start_ms" in self._turn:
+            self._turn["playout_end_ms"] = self._offset_ms()
+            self._close_turn()
+
+    def _on_metrics_collected(self, evt) -> None:
+        metrics = getattr(evt, "metrics", evt)
+        if self._turn is None:
+            return
+        kind = type(metrics).__name__
+        if kind == "EOUMetrics":
+            self._turn.setdefault("eou_delay_ms", _ms(getattr(metrics, "end_of_utterance_delay", None)))
+            self._turn.setdefault("transcription_delay_ms", _ms(getattr(metrics, "transcription_delay", None)))
+        elif kind == "LLMMetrics":
+            # A turn with tool calls has several LLM requests; the first one
+            # is what the caller waits on before hearing anything.
+            self._turn.setdefault("llm_ttft_ms", _ms(getattr(metrics, "ttft", None)))
+            self._turn["llm_calls"] = self._turn.get("llm_calls", 0) + 1
+        elif kind == "TTSMetrics":
+            self._turn.setdefault("tts_ttfb_ms", _ms(getattr(metrics, "ttfb", None)))
+
+    def record_tool(self, name: str, duration: float, success: bool) -> None:
+        """Record one tool execution span (`duration` in seconds)"""
+        if self._turn is None:
+            return
+        self._turn["tools"].append({"name": name, "ms": round(duration * 1000.0, 1), "ok": success})
+
+    # -- output ---------------------------------------------------------
+
+    def report(self) -> Dict[str, Any]:
+        """Per-call latency percentiles over all closed turns"""
+        report: Dict[str, Any] = {"session": self.session_id, "report": True, "turns": self.turn_count}
+        for field in REPORT_FIELDS:
+            values = [t[field] for t in self.turns if t.get(field) is not None]
+            if values:
+                report[field] = summarize_latencies(values)
+        tool_values: Dict[str, List[float]] = {}
+        for turn in self.turns:
+            for tool in turn["tools"]:
+                tool_values.setdefault(tool["name"], []).append(tool["ms"])
+        if tool_values:
+            report["tool_ms"] = {name: summarize_latencies(values) for name, values in tool_values.items()}
+        return report
+
+    def close(self) -> Dict[str, Any]:
+        self._close_turn()
+        report = self.report()
+        self._write(report)
+        logger.info("Turn latency report: %s", report)
+        return report
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self._path:
+            _WRITER.write(self._path, record)
@@ -0,0 +1,210 @@
+"""
+Bounded per-session transcript and tool-call storage
+"""
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_TRANSCRIPT_ENTRIES = int(os.getenv("TRANSCRIPT_MAX_ENTRIES", "200"))
+MAX_TOOL_CALL_ENTRIES = int(os.getenv("TOOL_CALLS_MAX_ENTRIES", "100"))
+
+# Only these keys of a tool result are kept; everything else (raw rows,
+# slot grids) is reduced to the fields the summary actually uses.
+_RESULT_KEYS = ("success", "message", "error", "phone_number", "date", "count", "resource")
+_APPOINTMENT_KEYS = ("id", "date", "time", "status", "user_name", "resource_id")
+_MAX_LISTED_APPOINTMENTS = 10
+
+
+def compact_appointment(appointment: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the identifying fields of an appointment row"""
+    return {k: appointment[k] for k in _APPOINTMENT_KEYS if k in appointment}
+
+
+def compact_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a tool result to the fields needed for events and summaries"""
+    compact = {k: result[k] for k in _RESULT_KEYS if k in result}
+    appointment = result.get("appointment")
+    if isinstance(appointment, dict):
+        compact["appointment"] = compact_appointment(appointment)
+    appointments = result.get("appointments")
+    if isinstance(appointments, list):
+        compact["count"] = len(appointments)
+        compact["appointments"] = [
+            compact_appointment(a) for a in appointments[:_MAX_LISTED_APPOINTMENTS] if isinstance(a, dict)
+        ]
+    slots = result.get("slots")
+    if isinstance(slots, list):
+        compact["slots"] = [s.get("time") for s in slots if isinstance(s, dict) and s.get("available", True)]
+    return compact
+
+
+class TranscriptEntry:
+    """A single spoken turn"""
+
+    __slots__ = ("role", "text", "ts")
+
+    def __init__(self, role: str, text: str, ts: float):
+        self.role = role
+        self.text = text
+        self.ts = ts
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"role": self.role, "text": self.text, "ts": round(self.ts, 3)}
+
+
+class ToolCallEntry:
+    """A single executed tool call with its compacted result"""
+
+    __slots__ = ("name", "args", "result", "ts")
+
+    def __init__(self, name: str, args: Dict[str, Any], result: Dict[str, Any], ts: float):
+        self.name = name
+        self.args = args
+        self.result = result
+        self.ts = ts
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "args": self.args, "result": self.result, "ts": round(self.ts, 3)}
+
+
+class _BoundedLog:
+    """Ring buffer of slotted entries with optional spill to an append-only JSONL file.
+
+    Timestamps are seconds on the monotonic clock relative to `started_at`.
+    Iterating yields spilled entries (streamed back from disk) followed by
+    the ones still held in memory, so consumers see the whole session.
+    """
+
+    def __init__(self, max_entries: int, spill_path: Optional[str] = None):
+        self._entries: deque = deque()
+        self._max_entries = max(1, max_entries)
+        self._spill_path = spill_path
+        self._spill_file = None
+        # Kept after a write failure so entries spilled before it can still be read back
+        self._spilled_path = spill_path
+        self._t0 = time.monotonic()
+        self.started_at = time.time()
+        self.total = 0
+        self.spilled = 0
+
+    def _now(self) -> float:
+        return time.monotonic() - self._t0
+
+    def _append(self, entry) -> None:
+        if len(self._entries) >= self._max_entries:
+            self._spill(self._entries.popleft())
+        self._entries.append(entry)
+        self.total += 1
+
+    def _spill(self, entry) -> None:
+        if not self._spill_path:
+            return
+        try:
+            if self._spill_file is None:
+                os.makedirs(os.path.dirname(self._spill_path) or ".", exist_ok=True)
+                self._spill_file = open(self._spill_path, "a", encoding="utf-8")
+            self._spill_file.write(json.dumps(entry.as_dict(), separators=(",", ":"), default=str) + "\n")
+            self.spilled += 1
+        except Exception as e:
+            logger.error(f"Error spilling entry to {self._spill_path}: {e}")
+            self._spill_path = None
+            self.close()
+
+    def _iter_spilled(self) -> Iterator[Any]:
+        if not self.spilled or not self._spilled_path:
+            return
+        if self._spill_file is not None:
+            self._spill_file.flush()
+        with open(self._spilled_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                yield self._entry_from_dict(data)
+
+    def _entry_from_dict(self, data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def __iter__(self) -> Iterator[Any]:
+        yield from self._iter_spilled()
+        yield from list(self._entries)
+
+    def __len__(self) -> int:
+        # The entries iteration yields: spilled ones plus those in memory
+        return self.spilled + len(self._entries)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def since(self, index: int) -> Iterator[Any]:
+        """Yield entries from absolute position `index` onwards"""
+        first_in_memory = self.total - len(self._entries)
+        if index < first_in_memory:
+            # Spilled entries are the session's first ones; any evicted after a spill failure are gone
+            for position, entry in enumerate(self._iter_spilled()):
+                if position >= index:
+                    yield entry
+            index = first_in_memory
+        yield from list(self._entries)[index - first_in_memory :]
+
+    def recent(self, n: int) -> list:
+        """Return the last `n` in-memory entries"""
+        if n <= 0:
+            return []
+        return list(self._entries)[-n:]
+
+    def close(self) -> None:
+        if self._spill_file is not None:
+            try:
+                self._spill_file.close()
+            except Exception:
+                pass
+            self._spill_file = None
+
+
+class TranscriptStore(_BoundedLog):
+    """Bounded transcript of user and assistant turns"""
+
+    def __init__(self, max_entries: int = MAX_TRANSCRIPT_ENTRIES, spill_path: Optional[str] = None):
+        super().__init__(max_entries, spill_path)
+
+    def add(self, role: str, text: str) -> TranscriptEntry:
+        entry = TranscriptEntry(sys.intern(role), text, self._now())
+        self._append(entry)
+        return entry
+
+    def _entry_from_dict(self, data: Dict[str, Any]) -> TranscriptEntry:
+        return TranscriptEntry(sys.intern(data.get("role", "unknown")), data.get("text", ""), data.get("ts", 0.0))
+
+
+class ToolCallStore(_BoundedLog):
+    """Bounded log of executed tool calls"""
+
+    def __init__(self, max_entries: int = MAX_TOOL_CALL_ENTRIES, spill_path: Optional[str] = None):
+        super().__init__(max_entries, spill_path)
+
+    def add(self, name: str, args: Dict[str, Any], result: Dict[str, Any]) -> ToolCallEntry:
+        entry = ToolCallEntry(sys.intern(name), args, compact_result(result), self._now())
+        self._append(entry)
+        return entry
+
+    def _entry_from_dict(self, data: Dict[str, Any]) -> ToolCallEntry:
+        return ToolCallEntry(
+            sys.intern(data.get("name", "unknown")), data.get("args", {}), data.get("result", {}), data.get("ts", 0.0)
+        )
+
+
+def spill_path_for(session_id: str, kind: str) -> Optional[str]:
+    """Return the spill file path for a session, or None when spilling is disabled"""
+    spill_dir = os.getenv("TRANSCRIPT_SPILL_DIR")
+    if not spill_dir:
+        return None
+    safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in session_id) or "session"
+    return os.path.join(spill_dir, f"{safe_id}.{kind}.jsonl")
@@ -0,0 +1,266 @@
+"""
+TTS preview endpoint with an LRU cache of rendered clips
+"""
+import array
+import asyncio
+import collections
+import functools
+import json
+import logging
+import math
+import os
+import re
+import struct
+import sys
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEEPGRAM_SPEAK_URL = "https://api.deepgram.com/v1/speak"
+PREVIEW_MODEL = "aura-asteria-en"
+PREVIEW_SAMPLE_RATE = 24000
+PREVIEW_CACHE_BYTES = int(os.getenv("TTS_PREVIEW_CACHE_MB", "32")) * 1024 * 1024
+PREVIEW_MAX_CHARS = int(os.getenv("TTS_PREVIEW_MAX_CHARS", "500"))
+# The preview spends the Deepgram budget, so its routes are only served when enabled
+PREVIEW_ENABLED = os.getenv("TTS_PREVIEW_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+# Preview requests allowed per client address per minute, with bursts of up to the same number
+PREVIEW_RATE_PER_MINUTE = float(os.getenv("TTS_PREVIEW_RATE_PER_MINUTE", "10"))
+
+_MODEL_RE = re.compile(r"^[a-z0-9-]{1,64}$")
+# Data size used in the header of a WAV streamed before its length is known
+_STREAMING_SIZE = 0xFFFFFFFF
+
+
+def wav_header(sample_rate: int, data_size: int = _STREAMING_SIZE, channels: int = 1) -> bytes:
+    """44-byte header for 16-bit PCM; the default size marks a streamed WAV"""
+    byte_rate = sample_rate * channels * 2
+    riff_size = min(data_size + 36, _STREAMING_SIZE)
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * 2, 16,
+        b"data", data_size,
+    )
+
+
+@functools.lru_cache(maxsize=16)
+def tone_wav(freq: float = 440.0, duration: float = 1.0, sample_rate: int = 16000) -> bytes:
+    """A sine tone as a complete WAV, built in one pass and cached"""
+    n_samples = int(sample_rate * duration)
+    amplitude = 0.5 * 32767
+    step = 2 * math.pi * freq / sample_rate
+    pcm = array.array("h", [int(amplitude * math.sin(step * i)) for i in range(n_samples)])
+    if sys.byteorder == "big":
+        pcm.byteswap()
+    data = pcm.tobytes()
+    return wav_header(sample_rate, len(data)) + data
+
+
+class AudioCache:
+    """LRU cache of rendered WAV clips bounded by total bytes"""
+
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._clips: "collections.OrderedDict[Tuple[str, int, str], bytes]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, int, str]) -> Optional[bytes]:
+        clip = self._clips.get(key)
+        if clip is None:
+            self.misses += 1
+            return None
+        self._clips.move_to_end(key)
+        self.hits += 1
+        return clip
+
+    def put(self, key: Tuple[str, int, str], clip: bytes) -> None:
+        if len(clip) > self.max_bytes:
+            return
+        old = self._clips.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._clips[key] = clip
+        self.size += len(clip)
+        while self.size > self.max_bytes:
+            _, evicted = self._clips.popitem(last=False)
+            self.size -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clips": len(self._clips), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+class RateLimiter:
+    """Token bucket per client key: `per_minute` requests a minute with bursts up to the same number"""
+
+    def __init__(self, per_minute: float = PREVIEW_RATE_PER_MINUTE, max_clients: int = 10000):
+        self.capacity = max(per_minute, 1.0)
+        self.rate = per_minute / 60.0
+        self.max_clients = max_clients
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def allow(self, client: str) -> float:
+        """0 if `client` may make a request now, else the seconds until it may"""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(client, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens < 1.0:
+            self._buckets[client] = (tokens, now)
+            return (1.0 - tokens) / self.rate if self.rate > 0 else 60.0
+        self._buckets[client] = (tokens - 1.0, now)
+        if len(self._buckets) > self.max_clients:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        # Clients whose buckets have refilled are indistinguishable from new ones
+        for client, (tokens, last) in list(self._buckets.items()):
+            if tokens + (now - last) * self.rate >= self.capacity:
+                del self._buckets[client]
+
+
+class TTSPreview:
+    """Streams Deepgram TTS audio for a text as it is produced.
+
+    The first request for a (model, text) pair is proxied chunk by chunk
+    as a streamed WAV and the complete clip is cached; repeats are served
+    from the cache with an exact WAV header. Identical requests that
+    arrive while the first is still streaming wait for its clip instead
+    of making their own upstream call. Each client address is rate
+    limited.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[AudioCache] = None,
+        api_key: Optional[str] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.cache = cache or AudioCache()
+        self.api_key = api_key if api_key is not None else os.getenv("DEEPGRAM_API_KEY")
+        self.limiter = limiter or RateLimiter()
+        self._http: Optional[aiohttp.ClientSession] = None
+        # Clips being synthesized, resolved with the WAV (or None on failure) when done
+        self._inflight: Dict[Tuple[str, int, str], "asyncio.Future[Optional[bytes]]"] = {}
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        return self._http
+
+    async def _read_params(self, request: web.Request) -> Tuple[str, str]:
+        if request.method == "POST":
+            try:
+                data = json.loads(await request.read() or b"{}")
+            except ValueError:
+                raise web.HTTPBadRequest(text="Request body must be JSON")
+            if not isinstance(data, dict):
+                raise web.HTTPBadRequest(text="Request body must be a JSON object")
+        else:
+            data = request.query
+        text = data.get("text")
+        model = data.get("model") or PREVIEW_MODEL
+        if not isinstance(text, str) or not text.strip():
+            raise web.HTTPBadRequest(text="text is required")
+        if len(text) > PREVIEW_MAX_CHARS:
+            raise web.HTTPBadRequest(text=f"text is limited to {PREVIEW_MAX_CHARS} characters")
+        if not isinstance(model, str) or not _MODEL_RE.match(model):
+            raise web.HTTPBadRequest(text="Invalid model")
+        return text.strip(), model
+
+    async def handle_preview(self, request: web.Request) -> web.StreamResponse:
+        """GET /api/tts-preview?text=...&model=... or POST the same as JSON"""
+        retry_after = self.limiter.allow(request.remote or "unknown")
+        if retry_after:
+            return web.json_response(
+                {"error": "Too many preview requests"}, status=429,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        text, model = await self._read_params(request)
+        key = (model, PREVIEW_SAMPLE_RATE, text)
+        clip = self.cache.get(key)
+        if clip is not None:
+            return web.Response(body=clip, content_type="audio/wav", headers={"X-Cache": "hit"})
+        if not self.api_key:
+            return web.json_response({"error": "DEEPGRAM_API_KEY is not set"}, status=503)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            # shield: a follower hanging up mustn't cancel the shared result
+            clip = await asyncio.shield(pending)
+            if clip is None:
+                return web.json_response({"error": "Synthesis failed"}, status=502)
+            return web.Response(body=clip, content_type="audio/wav", headers={"X-Cache": "shared"})
+
+        pending = self._inflight[key] = asyncio.get_running_loop().create_future()
+        clip = None
+        try:
+            response, clip = await self._synthesize(request, key)
+        finally:
+            del self._inflight[key]
+            pending.set_result(clip)
+        return response
+
+    async def _synthesize(
+        self, request: web.Request, key: Tuple[str, int, str]
+    ) -> Tuple[web.StreamResponse, Optional[bytes]]:
+        """Stream the upstream audio to `request`; returns the response and the complete clip, if any"""
+        model, _, text = key
+        params = {"encoding": "linear16", "container": "none", "model": model, "sample_rate": PREVIEW_SAMPLE_RATE}
+        headers = {"Authorization": f"Token {self.api_key}", "Content-Type": "application/json"}
+        response: Optional[web.StreamResponse] = None
+        pcm = bytearray()
+        try:
+            async with self._session().post(DEEPGRAM_SPEAK_URL, params=params, headers=headers, json={"text": text}) as upstream:
+                if upstream.status != 200:
+                    logger.error(f"TTS preview failed: {upstream.status} {await upstream.text()}")
+                    return web.json_response({"error": "Synthesis failed"}, status=502), None
+                response = web.StreamResponse(headers={"Content-Type": "audio/wav", "X-Cache": "miss"})
+                await response.prepare(request)
+                await response.write(wav_header(PREVIEW_SAMPLE_RATE))
+                async for chunk in upstream.content.iter_any():
+                    pcm.extend(chunk)
+                    await response.write(chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"TTS preview failed: {e}")
+            if response is None:
+                return web.json_response({"error": "Synthesis failed"}, status=502), None
+            return response, None
+        clip = wav_header(PREVIEW_SAMPLE_RATE, len(pcm)) + bytes(pcm)
+        self.cache.put(key, clip)
+        await response.write_eof()
+        return response, clip
+
+    async def handle_tone(self, request: web.Request) -> web.Response:
+        """GET /debug/tone: a cached 1s 440 Hz test tone to validate playback"""
+        return web.Response(body=tone_wav(), content_type="audio/wav")
+
+
+def add_tts_preview_routes(app: web.Application, preview: Optional[TTSPreview] = None) -> Optional[TTSPreview]:
+    """Register the preview and test-tone routes when TTS_PREVIEW_ENABLED is set (or a preview is passed)"""
+    if preview is None:
+        if not PREVIEW_ENABLED:
+            return None
+        preview = TTSPreview()
+    app.router.add_route("GET", "/api/tts-preview", preview.handle_preview)
+    app.router.add_route("POST", "/api/tts-preview", preview.handle_preview)
+    # Older clients used the debug route; it now returns real speech
+    app.router.add_route("GET", "/debug/synthesize", preview.handle_preview)
+    app.router.add_route("POST", "/debug/synthesize", preview.handle_preview)
+    app.router.add_get("/debug/tone", preview.handle_tone)
+
+    async def _stop(_app):
+        await preview.aclose()
+
+    app.on_cleanup.append(_stop)
+    return preview
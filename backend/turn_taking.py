@@ -0,0 +1,73 @@
+"""
+Turn-taking configuration: VAD, end-of-turn detection, interruptions and preemptive generation
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# "stt" (provider endpointing only), "vad" (local VAD + STT) or "semantic" (turn-detector model)
+TURN_DETECTION = os.getenv("TURN_DETECTION", "vad").strip().lower()
+PREEMPTIVE_GENERATION = os.getenv("PREEMPTIVE_GENERATION", "true").strip().lower() in ("1", "true", "yes")
+ALLOW_INTERRUPTIONS = os.getenv("ALLOW_INTERRUPTIONS", "true").strip().lower() in ("1", "true", "yes")
+MIN_INTERRUPTION_DURATION = float(os.getenv("MIN_INTERRUPTION_DURATION", "0.5"))
+MIN_ENDPOINTING_DELAY = float(os.getenv("MIN_ENDPOINTING_DELAY", "0.4"))
+MAX_ENDPOINTING_DELAY = float(os.getenv("MAX_ENDPOINTING_DELAY", "3.0"))
+
+
+def load_vad():
+    """Load the Silero VAD model. Called once per process from prewarm."""
+    if TURN_DETECTION == "stt":
+        return None
+    try:
+        from livekit.plugins import silero
+    except ImportError:
+        logger.warning("livekit-plugins-silero is not installed; falling back to STT endpointing")
+        return None
+    try:
+        return silero.VAD.load()
+    except Exception as e:
+        logger.error(f"Error loading VAD model: {e}")
+        return None
+
+
+def _build_turn_detection(vad) -> Any:
+    if TURN_DETECTION == "semantic":
+        try:
+            from livekit.plugins.turn_detector.multilingual import MultilingualModel
+
+            return MultilingualModel()
+        except Exception as e:
+            logger.warning(f"Semantic turn detector unavailable, using VAD turn detection: {e}")
+    if TURN_DETECTION in ("vad", "semantic") and vad is not None:
+        return "vad"
+    return "stt"
+
+
+def session_options(vad: Optional[Any]) -> Dict[str, Any]:
+    """Keyword arguments for AgentSession controlling turn-taking.
+
+    With interruptions enabled, user speech detected by the VAD while the
+    agent is talking cancels the current speech handle, which stops the
+    in-flight TTS stream instead of synthesizing audio nobody hears.
+    Preemptive generation starts the LLM on the transcript available at
+    end of speech, before the end-of-turn decision is final.
+    """
+    turn_detection = _build_turn_detection(vad)
+    logger.info(
+        "Turn taking: detection=%s vad=%s preemptive=%s interruptions=%s",
+        turn_detection if isinstance(turn_detection, str) else type(turn_detection).__name__,
+        vad is not None,
+        PREEMPTIVE_GENERATION,
+        ALLOW_INTERRUPTIONS,
+    )
+    return {
+        "vad": vad,
+        "turn_detection": turn_detection,
+        "allow_interruptions": ALLOW_INTERRUPTIONS,
+        "min_interruption_duration": MIN_INTERRUPTION_DURATION,
+        "min_endpointing_delay": MIN_ENDPOINTING_DELAY,
+        "max_endpointing_delay": MAX_ENDPOINTING_DELAY,
+        "preemptive_generation": PREEMPTIVE_GENERATION,
+    }
@@ -0,0 +1,267 @@
+"""
+Worker load reporting and job admission
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.getenv("WORKER_MAX_SESSIONS", "8"))
+LOAD_THRESHOLD = float(os.getenv("WORKER_LOAD_THRESHOLD", "0.75"))
+IDLE_PROCESSES = int(os.getenv("WORKER_IDLE_PROCESSES", "2"))
+MAX_LOOP_LAG_MS = float(os.getenv("WORKER_MAX_LOOP_LAG_MS", "100"))
+MAX_CPU_PERCENT = float(os.getenv("WORKER_MAX_CPU_PERCENT", "85"))
+
+# Job processes publish their status here; children inherit the path via the
+# environment, so the worker and its job processes agree without IPC.
+_STATUS_DIR_ENV = "SUPERBRYN_STATUS_DIR"
+# Status files older than this are from dead processes and ignored
+_STATUS_STALE_SECONDS = 10.0
+
+
+def status_dir() -> str:
+    """Shared directory for per-process status files, created on first use"""
+    path = os.environ.get(_STATUS_DIR_ENV)
+    if not path:
+        path = os.path.join(tempfile.gettempdir(), f"superbryn-worker-{os.getpid()}")
+        os.environ[_STATUS_DIR_ENV] = path
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _lock_file(f) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        # Windows has no flock; lock the file's first byte instead
+        import msvcrt
+
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten one-second retries; keep waiting
+                continue
+    fcntl.flock(f, fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def status_lock(name: str) -> Iterator[None]:
+    """Exclusive lock across the worker and its job processes, for read-modify-write of shared status files"""
+    with open(os.path.join(status_dir(), f"{name}.lock"), "a+") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def publish_process_status(kind: str, data: Dict[str, Any]) -> None:
+    """Atomically write this process's `kind` status for the worker to read"""
+    directory = status_dir()
+    path = os.path.join(directory, f"{kind}.{os.getpid()}.json")
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(data, updated_at=time.time()), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.debug("Could not publish %s status: %s", kind, e)
+
+
+def clear_process_status(kind: str) -> None:
+    try:
+        os.remove(os.path.join(status_dir(), f"{kind}.{os.getpid()}.json"))
+    except OSError:
+        pass
+
+
+def read_process_statuses(kind: str) -> List[Dict[str, Any]]:
+    """Return fresh `kind` statuses published by all processes"""
+    directory = status_dir()
+    now = time.time()
+    statuses = []
+    suffix = ".json"
+    prefix = f"{kind}."
+    for name in os.listdir(directory):
+        if not (name.startswith(prefix) and name.endswith(suffix)):
+            continue
+        try:
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - data.get("updated_at", 0) <= _STATUS_STALE_SECONDS:
+            statuses.append(data)
+    return statuses
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def mark_prewarmed() -> None:
+    """Record that this process finished prewarming and can take a job"""
+    try:
+        with open(os.path.join(status_dir(), f"prewarmed.{os.getpid()}"), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+    except OSError as e:
+        logger.debug("Could not mark process prewarmed: %s", e)
+
+
+def prewarmed_processes() -> int:
+    """Number of live processes that have completed prewarm"""
+    directory = status_dir()
+    count = 0
+    for name in os.listdir(directory):
+        if not name.startswith("prewarmed."):
+            continue
+        try:
+            pid = int(name.split(".", 1)[1])
+        except ValueError:
+            continue
+        if not pid_alive(pid):
+            # Process has exited; drop its marker
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+            continue
+        count += 1
+    return count
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag as the overshoot of a periodic sleep.
+
+    Runs inside each job process and publishes the smoothed lag so the
+    worker's load function can see how loaded the audio loops are.
+    """
+
+    def __init__(self, interval: float = 0.5, smoothing: float = 0.3):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        clear_process_status("loop")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000.0)
+            self.lag_ms += self.smoothing * (lag_ms - self.lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            publish_process_status("loop", {"lag_ms": round(self.lag_ms, 2)})
+
+
+class WorkerLoad:
+    """Combines active sessions, job event-loop lag and CPU into one load value.
+
+    Each signal is normalized against its limit and the worst one wins, so
+    a worker with few sessions but a saturated loop still reports full.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        load_threshold: float = LOAD_THRESHOLD,
+        max_loop_lag_ms: float = MAX_LOOP_LAG_MS,
+        max_cpu_percent: float = MAX_CPU_PERCENT,
+    ):
+        self.max_sessions = max(1, max_sessions)
+        self.load_threshold = load_threshold
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_cpu_percent = max_cpu_percent
+        self.last: Dict[str, float] = {"load": 0.0, "sessions": 0, "loop_lag_ms": 0.0, "cpu_percent": 0.0}
+        # Jobs accepted since the last sample, not yet visible in active_jobs
+        self._admitted = 0
+        try:
+            import psutil
+
+            self._psutil = psutil
+            psutil.cpu_percent(interval=None)  # prime the counter
+        except ImportError:
+            self._psutil = None
+
+    def _cpu_percent(self) -> float:
+        if self._psutil is not None:
+            return self._psutil.cpu_percent(interval=None)
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1) * 100.0
+        except (AttributeError, OSError):
+            return 0.0
+
+    def compute(self, worker) -> float:
+        """Load function for WorkerOptions; called periodically by the worker"""
+        sessions = len(getattr(worker, "active_jobs", []) or [])
+        lags = [s.get("lag_ms", 0.0) for s in read_process_statuses("loop")]
+        loop_lag_ms = max(lags) if lags else 0.0
+        cpu_percent = self._cpu_percent()
+        load = max(
+            sessions / self.max_sessions,
+            loop_lag_ms / self.max_loop_lag_ms if self.max_loop_lag_ms > 0 else 0.0,
+            cpu_percent / self.max_cpu_percent if self.max_cpu_percent > 0 else 0.0,
+        )
+        self.last = {
+            "load": round(min(load, 1.0), 3),
+            "sessions": sessions,
+            "loop_lag_ms": round(loop_lag_ms, 2),
+            "cpu_percent": round(cpu_percent, 1),
+        }
+        self._admitted = 0
+        return self.last["load"]
+
+    def has_capacity(self) -> bool:
+        """Whether the latest sample leaves room for another job"""
+        sessions = self.last["sessions"] + self._admitted
+        load = max(self.last["load"], sessions / self.max_sessions)
+        return sessions < self.max_sessions and load < self.load_threshold
+
+    def admit(self) -> bool:
+        """Admission check against the latest sample; counts the job if admitted"""
+        if not self.has_capacity():
+            return False
+        self._admitted += 1
+        return True
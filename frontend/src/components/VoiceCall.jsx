@@ -36,8 +36,8 @@ function VoiceCall() {
     setError(null)
 
     try {
-      const roomName = `superbryn-${Date.now()}`
-      const tokenResponse = await fetchToken(roomName)
+      // The server picks the room and participant, so the token comes from its pre-minted pool
+      const tokenResponse = await fetchToken()
       const token = tokenResponse.token || tokenResponse
       const url = tokenResponse.url || LIVEKIT_URL
 
@@ -160,7 +160,7 @@ function VoiceCall() {
     }
   }
 
-  const fetchToken = async (roomName) => {
+  const fetchToken = async () => {
     // Call backend to generate a token
     const tokenUrl = import.meta.env.VITE_TOKEN_API_URL || 'http://localhost:8080/api/livekit-token'
     try {
@@ -169,10 +169,7 @@ function VoiceCall() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({
-          roomName,
-          participantName: `user-${Math.floor(Math.random() * 100000)}`,
-        }),
+        body: JSON.stringify({}),
       })
       
       if (!response.ok) {